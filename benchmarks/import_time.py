@@ -0,0 +1,129 @@
+"""
+Import-time benchmark for FastAPIObservability feature toggles.
+
+For every combination of enable_structlog/enable_prometheus/enable_opentelemetry
+a fresh interpreter is started with ``python -X importtime``. It imports FastAPI,
+then imports fastapi_observability and constructs FastAPIObservability with that
+combination. The self time of every module imported after FastAPI is summed and
+checked against the budget for the combination.
+
+Usage:
+    python benchmarks/import_time.py [--runs N] [--budget-scale X] [--json]
+
+Exits with status 1 if any combination exceeds its budget.
+"""
+import argparse
+import itertools
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+# Budgets in milliseconds, keyed by (structlog, prometheus, opentelemetry),
+# about twice the median measured on a developer machine so that a newly
+# eager import fails the check. Use --budget-scale on slower machines.
+BUDGETS_MS = {
+    (False, False, False): 6,
+    (True, False, False): 25,
+    (False, True, False): 25,
+    (True, True, False): 40,
+    (False, False, True): 190,
+    (True, False, True): 220,
+    (False, True, True): 220,
+    (True, True, True): 240,
+}
+
+SNIPPET = """
+import fastapi
+import sys
+sys.stderr.write("--- fastapi imported ---\\n")
+from fastapi_observability import FastAPIObservability
+FastAPIObservability(
+    fastapi.FastAPI(),
+    enable_structlog={structlog},
+    enable_prometheus={prometheus},
+    enable_opentelemetry={opentelemetry},
+    otlp_endpoint="http://127.0.0.1:1",
+)
+"""
+
+
+def parse_importtime(stderr: str):
+    """Return {module: self_us} for modules imported after FastAPI"""
+    modules = {}
+    started = False
+    for line in stderr.splitlines():
+        if line.startswith("--- fastapi imported ---"):
+            started = True
+            continue
+        if not started or not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        modules[fields[2].strip()] = int(fields[0])
+    return modules
+
+
+def measure(structlog: bool, prometheus: bool, opentelemetry: bool):
+    """Measure the import cost of one toggle combination in a fresh interpreter"""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [SRC_DIR, env.get("PYTHONPATH")]))
+    code = SNIPPET.format(structlog=structlog, prometheus=prometheus, opentelemetry=opentelemetry)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return parse_importtime(result.stderr)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="runs per combination, the median is reported")
+    parser.add_argument("--budget-scale", type=float, default=1.0, help="multiply every budget, e.g. for slow CI machines")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args(argv)
+
+    results = []
+    failed = False
+    for combination in itertools.product((False, True), repeat=3):
+        totals = []
+        modules = {}
+        for _ in range(args.runs):
+            modules = measure(*combination)
+            totals.append(sum(modules.values()) / 1000.0)
+        total_ms = statistics.median(totals)
+        budget_ms = BUDGETS_MS[combination] * args.budget_scale
+        top = sorted(modules.items(), key=lambda item: item[1], reverse=True)[:5]
+        failed = failed or total_ms > budget_ms
+        results.append({
+            "structlog": combination[0],
+            "prometheus": combination[1],
+            "opentelemetry": combination[2],
+            "import_ms": round(total_ms, 1),
+            "budget_ms": budget_ms,
+            "modules": len(modules),
+            "top": [{"module": name, "self_ms": round(us / 1000.0, 1)} for name, us in top],
+        })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'structlog':>9} {'prometheus':>10} {'otel':>5} {'import ms':>10} {'budget':>8} {'modules':>8}")
+        for result in results:
+            status = "" if result["import_ms"] <= result["budget_ms"] else "  OVER BUDGET"
+            print(
+                f"{str(result['structlog']):>9} {str(result['prometheus']):>10} {str(result['opentelemetry']):>5} "
+                f"{result['import_ms']:>10.1f} {result['budget_ms']:>8.0f} {result['modules']:>8}{status}"
+            )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""
+Logging cost benchmark for FastAPIObservabilityLogger.
+
+Measures the time per log event of a logger created once at import time, with
+and without an active OpenTelemetry span, and compares it to binding the trace
+IDs on a new logger for every event. Events filtered out by level are measured
+too; they should not pay for reading the span context. Output goes to
+/dev/null, so rendering cost is included but terminal I/O is not.
+
+Usage:
+    python benchmarks/logging_cost.py [--events N] [--runs N] [--json]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import structlog
+from opentelemetry.sdk.trace import TracerProvider
+from fastapi_observability.logger import FastAPIObservabilityLogger
+
+
+def time_per_event(log, events: int, runs: int) -> float:
+    """Return the median time per event in microseconds"""
+    results = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        for _ in range(events):
+            log()
+        results.append((time.perf_counter() - start) / events * 1e6)
+    return statistics.median(results)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=20000, help="log events per run")
+    parser.add_argument("--runs", type=int, default=5, help="runs per scenario, the median is reported")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args(argv)
+
+    observability_logger = FastAPIObservabilityLogger("benchmark")
+    devnull = open(os.devnull, "w")
+    structlog.configure(logger_factory=structlog.PrintLoggerFactory(file=devnull))
+    logger = observability_logger.get_logger()
+    tracer = TracerProvider().get_tracer(__name__)
+
+    def bind_per_event():
+        span_context = tracer_span.get_span_context()
+        logger.bind(
+            trace_id=format(span_context.trace_id, "032x"),
+            span_id=format(span_context.span_id, "016x"),
+        ).info("request handled", status=200)
+
+    scenarios = {}
+    scenarios["no span"] = time_per_event(lambda: logger.info("request handled", status=200), args.events, args.runs)
+    with tracer.start_as_current_span("request") as tracer_span:
+        scenarios["active span"] = time_per_event(lambda: logger.info("request handled", status=200), args.events, args.runs)
+        scenarios["active span, bind per event"] = time_per_event(bind_per_event, args.events, args.runs)
+        scenarios["active span, filtered debug"] = time_per_event(lambda: logger.debug("request handled", status=200), args.events, args.runs)
+    devnull.close()
+
+    if args.json:
+        print(json.dumps({name: round(value, 3) for name, value in scenarios.items()}, indent=2))
+    else:
+        width = max(len(name) for name in scenarios)
+        for name, value in scenarios.items():
+            print(f"{name:<{width}}  {value:8.2f} us/event")
+
+
+if __name__ == "__main__":
+    main()
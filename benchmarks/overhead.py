@@ -0,0 +1,269 @@
+"""
+End-to-end request overhead benchmark across FastAPIObservability feature toggles.
+
+For a plain FastAPI app (``baseline``) and every combination of
+enable_structlog/enable_prometheus/enable_opentelemetry, a fresh interpreter
+builds a small app and drives it in-process through httpx's ASGI transport.
+Spans go to a local stand-in OTLP receiver and logs to /dev/null, so exporter
+work is included but no network or terminal I/O is.
+
+Reported per combination: throughput, p50/p99 latency and their overhead over
+the baseline, memory allocated at peak per request and retained per request
+(tracemalloc, measured in a separate pass), and RSS growth per request.
+
+Usage:
+    python benchmarks/overhead.py [--requests N] [--concurrency N] [--output FILE] [--compare FILE] [--json]
+
+With --compare, results are checked against a previous --output file and the
+exit status is 1 if the p50 overhead of any combination grew by more than
+--tolerance (default 25%) and --min-delta-us microseconds.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+sys.path.insert(0, SRC_DIR)
+
+COMBINATIONS = [None] + list(itertools.product((False, True), repeat=3))
+
+
+def combination_name(combination) -> str:
+    if combination is None:
+        return "baseline"
+    names = [name for name, enabled in zip(("structlog", "prometheus", "opentelemetry"), combination) if enabled]
+    return "+".join(names) or "none"
+
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        # Peak rather than current RSS, in KiB on Linux and bytes on macOS
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def percentile(values, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def create_app(combination, otlp_endpoint: str):
+    from fastapi import FastAPI
+
+    app = FastAPI()
+    observability = None
+    if combination is not None:
+        from fastapi_observability import FastAPIObservability
+        structlog, prometheus, opentelemetry = combination
+        observability = FastAPIObservability(
+            app,
+            service_name="benchmark",
+            otlp_endpoint=otlp_endpoint,
+            enable_structlog=structlog,
+            enable_prometheus=prometheus,
+            enable_opentelemetry=opentelemetry,
+        )
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: int, q: str = None):
+        return {"item_id": item_id, "q": q}
+
+    return app, observability
+
+
+async def drive(app, requests: int, concurrency: int, warmup: int):
+    """
+    Send requests from concurrent loops.
+
+    Returns the per-request latencies, the wall time, and the median peak and
+    the mean retained allocation bytes per request.
+    """
+    import httpx
+
+    latencies = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark") as client:
+        for index in range(warmup):
+            await client.get(f"/items/{index}", params={"q": "warmup"})
+
+        async def loop(count: int):
+            for index in range(count):
+                start = time.perf_counter()
+                response = await client.get(f"/items/{index}", params={"q": "benchmark"})
+                latencies.append(time.perf_counter() - start)
+                assert response.status_code == 200
+
+        per_loop = requests // concurrency
+        start = time.perf_counter()
+        await asyncio.gather(*(loop(per_loop) for _ in range(concurrency)))
+        wall = time.perf_counter() - start
+
+        # Allocations, in a separate pass since tracing them slows requests down
+        tracemalloc.start()
+        peaks = []
+        retained_before = tracemalloc.get_traced_memory()[0]
+        for index in range(min(requests, 500)):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            await client.get(f"/items/{index}", params={"q": "benchmark"})
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+        retained = (tracemalloc.get_traced_memory()[0] - retained_before) / len(peaks)
+        tracemalloc.stop()
+    return latencies, wall, statistics.median(peaks), retained
+
+
+def run_worker(combination, requests: int, concurrency: int, warmup: int) -> dict:
+    """Measure one combination in this process"""
+    from fastapi_observability.testing import LocalOTLPReceiver
+
+    with LocalOTLPReceiver() as receiver:
+        app, observability = create_app(combination, receiver.endpoint)
+        # httpx's ASGI transport does not run the lifespan
+        if observability is not None:
+            observability.startup()
+        rss_before = current_rss()
+        latencies, wall, peak_bytes, retained_bytes = asyncio.run(drive(app, requests, concurrency, warmup))
+        rss_after = current_rss()
+        if observability is not None:
+            observability.shutdown()
+        spans = receiver.span_count
+
+    return {
+        "combination": combination_name(combination),
+        "structlog": bool(combination and combination[0]),
+        "prometheus": bool(combination and combination[1]),
+        "opentelemetry": bool(combination and combination[2]),
+        "requests": len(latencies),
+        "requests_per_second": round(len(latencies) / wall, 1),
+        "p50_us": round(percentile(latencies, 0.5) * 1e6, 1),
+        "p99_us": round(percentile(latencies, 0.99) * 1e6, 1),
+        "peak_alloc_bytes_per_request": int(peak_bytes),
+        "retained_bytes_per_request": round(retained_bytes, 1),
+        "rss_bytes": rss_after,
+        "rss_growth_bytes_per_request": round((rss_after - rss_before) / len(latencies), 1),
+        "spans_exported": spans,
+    }
+
+
+def measure(combination, args) -> dict:
+    """Measure one combination in a fresh interpreter, so global state is not shared"""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [SRC_DIR, env.get("PYTHONPATH")]))
+    result = subprocess.run(
+        [
+            sys.executable, os.path.abspath(__file__), "--worker", json.dumps(combination),
+            "--requests", str(args.requests), "--concurrency", str(args.concurrency), "--warmup", str(args.warmup),
+        ],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # Logs of the app under test go to /dev/null; the result is the last line
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def package_version() -> str:
+    from importlib import metadata
+    try:
+        return metadata.version("fastapi-observability")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def add_overhead(results):
+    baseline = results[0]
+    for result in results:
+        result["p50_overhead_us"] = round(result["p50_us"] - baseline["p50_us"], 1)
+        result["p99_overhead_us"] = round(result["p99_us"] - baseline["p99_us"], 1)
+
+
+def compare(results, previous, tolerance: float, min_delta_us: float):
+    """Return (combination, previous, current) p50 overheads that regressed"""
+    previous_by_name = {result["combination"]: result for result in previous["results"]}
+    regressions = []
+    for result in results:
+        old = previous_by_name.get(result["combination"])
+        if old is None or result["combination"] == "baseline":
+            continue
+        delta = result["p50_overhead_us"] - old["p50_overhead_us"]
+        if delta > min_delta_us and delta > tolerance * max(old["p50_overhead_us"], 0.0):
+            regressions.append((result["combination"], old["p50_overhead_us"], result["p50_overhead_us"]))
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000, help="measured requests per combination")
+    parser.add_argument("--concurrency", type=int, default=1, help="concurrent request loops")
+    parser.add_argument("--warmup", type=int, default=500, help="requests before measuring")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--compare", help="compare with a previous --output file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative p50 overhead growth")
+    parser.add_argument("--min-delta-us", type=float, default=10.0, help="ignore p50 overhead growth below this")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker is not None:
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, "w")
+        combination = json.loads(args.worker)
+        result = run_worker(tuple(combination) if combination else None, args.requests, args.concurrency, args.warmup)
+        stdout.write(json.dumps(result) + "\n")
+        return 0
+
+    results = [measure(combination, args) for combination in COMBINATIONS]
+    add_overhead(results)
+    report = {
+        "version": package_version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(
+            f"{'combination':<32} {'req/s':>8} {'p50 us':>8} {'p99 us':>8} {'+p50 us':>8} {'+p99 us':>8} "
+            f"{'peak B':>8} {'kept B':>8} {'rss B':>7}"
+        )
+        for result in results:
+            print(
+                f"{result['combination']:<32} {result['requests_per_second']:>8.0f} {result['p50_us']:>8.0f} "
+                f"{result['p99_us']:>8.0f} {result['p50_overhead_us']:>8.0f} {result['p99_overhead_us']:>8.0f} "
+                f"{result['peak_alloc_bytes_per_request']:>8} {result['retained_bytes_per_request']:>8.0f} "
+                f"{result['rss_growth_bytes_per_request']:>7.0f}"
+            )
+
+    if args.compare:
+        with open(args.compare) as previous:
+            regressions = compare(results, json.load(previous), args.tolerance, args.min_delta_us)
+        for name, old, new in regressions:
+            print(f"REGRESSION {name}: p50 overhead {old:.0f} us -> {new:.0f} us", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
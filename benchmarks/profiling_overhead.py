@@ -0,0 +1,131 @@
+"""
+Overhead benchmark for the continuous profiler.
+
+Drives a FastAPI app with a CPU-bound endpoint in-process through httpx's ASGI
+transport, with the requests tagged by ProfiledApp, while a number of
+background threads run CPU work as well. Throughput is measured without the
+sampler and with it at several target intervals, and compared to the
+sampler's own accounting: the time it spent sampling, its effective interval
+after the overhead cap and the number of samples taken. Stacks are deeper and
+threads more numerous in real applications, which makes each pass slower;
+the cap then stretches the interval rather than taking more time.
+
+Usage:
+    python benchmarks/profiling_overhead.py [--requests N] [--threads N] [--max-overhead F] [--json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import httpx
+from fastapi import FastAPI
+from fastapi_observability.profiling import ProfiledApp, StackSampler
+
+INTERVALS = (None, 0.05, 0.01, 0.005, 0.001)
+
+
+def work(iterations: int) -> int:
+    total = 0
+    for index in range(iterations):
+        total += index * index % 7
+    return total
+
+
+def create_app(iterations: int):
+    app = FastAPI()
+    app.add_middleware(ProfiledApp)
+
+    @app.get("/work/{item_id}")
+    async def handler(item_id: int):
+        return {"item_id": item_id, "result": work(iterations)}
+
+    return app
+
+
+async def drive(app, requests: int, runs: int) -> float:
+    """Return the median throughput in requests per second over several runs"""
+    results = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark") as client:
+        for index in range(50):
+            await client.get(f"/work/{index}")
+        for _ in range(runs):
+            start = time.perf_counter()
+            for index in range(requests):
+                await client.get(f"/work/{index}")
+            results.append(requests / (time.perf_counter() - start))
+    return statistics.median(results)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000, help="requests per run")
+    parser.add_argument("--runs", type=int, default=3, help="runs per interval, the median is reported")
+    parser.add_argument("--iterations", type=int, default=5000, help="loop iterations of work per request")
+    parser.add_argument("--threads", type=int, default=4, help="background threads running CPU work")
+    parser.add_argument("--max-overhead", type=float, default=0.01, help="sampler overhead cap")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args(argv)
+
+    app = create_app(args.iterations)
+    stop = threading.Event()
+
+    def background():
+        while not stop.is_set():
+            work(args.iterations)
+            time.sleep(0.001)
+
+    threads = [threading.Thread(target=background, daemon=True) for _ in range(args.threads)]
+    for thread in threads:
+        thread.start()
+
+    results = []
+    try:
+        for interval in INTERVALS:
+            sampler = None
+            if interval is not None:
+                sampler = StackSampler(interval=interval, max_overhead=args.max_overhead)
+                sampler.start()
+            throughput = asyncio.run(drive(app, args.requests, args.runs))
+            result = {"interval": interval, "requests_per_second": round(throughput, 1)}
+            if sampler is not None:
+                stats = sampler.stats()
+                sampler.stop()
+                result.update({
+                    "effective_interval": round(stats["interval"], 6),
+                    "mean_pass_us": round(stats["mean_pass_seconds"] * 1e6, 1),
+                    "sampler_overhead": round(stats["overhead"], 4),
+                    "samples": stats["samples"],
+                })
+            results.append(result)
+    finally:
+        stop.set()
+
+    baseline = results[0]["requests_per_second"]
+    for result in results:
+        result["throughput_change"] = round(result["requests_per_second"] / baseline - 1, 4)
+
+    if args.json:
+        print(json.dumps({"max_overhead": args.max_overhead, "results": results}, indent=2))
+        return
+
+    print(f"{'interval':>10} {'req/s':>9} {'change':>8} {'effective':>10} {'pass us':>8} {'sampling':>9} {'samples':>8}")
+    for result in results:
+        if result["interval"] is None:
+            print(f"{'off':>10} {result['requests_per_second']:>9.0f} {'':>8}")
+            continue
+        print(
+            f"{result['interval'] * 1000:>8.1f}ms {result['requests_per_second']:>9.0f} "
+            f"{result['throughput_change']:>+8.1%} {result['effective_interval'] * 1000:>8.2f}ms "
+            f"{result['mean_pass_us']:>8.1f} {result['sampler_overhead']:>9.2%} {result['samples']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
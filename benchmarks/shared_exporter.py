@@ -0,0 +1,140 @@
+"""
+Throughput benchmark: per-worker OTLP export vs. the per-host shared exporter.
+
+Starts a local stand-in OTLP receiver, then N worker processes that each
+create M spans through a BatchSpanProcessor. In ``direct`` mode every worker
+exports with its own OTLPSpanExporter (one gRPC channel per worker). In
+``shared`` mode workers hand spans to one SharedExporterServer process over a
+Unix domain socket, which exports for all of them.
+
+Reported per mode: wall time until the receiver has every span, spans per
+second, total CPU seconds spent in workers and exporter, and gRPC export
+requests received by the collector.
+
+Usage:
+    python benchmarks/shared_exporter.py [--workers N] [--spans M] [--json]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+
+def run_worker(mode, endpoint, socket_path, spans, ready, go, results):
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+    if mode == "direct":
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+        exporter = OTLPSpanExporter(endpoint=endpoint, insecure=True)
+    else:
+        from fastapi_observability.shared_exporter import SharedSpanExporter
+        exporter = SharedSpanExporter(socket_path)
+
+    provider = TracerProvider()
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    tracer = provider.get_tracer("benchmark")
+
+    # Only measure the export work, not interpreter start-up and imports
+    ready.put(True)
+    go.wait()
+    cpu_start = time.process_time()
+    for index in range(spans):
+        with tracer.start_as_current_span("GET /items/{item_id}") as span:
+            span.set_attribute("http.method", "GET")
+            span.set_attribute("http.route", "/items/{item_id}")
+            span.set_attribute("item.index", index)
+    provider.shutdown()
+    results.put(("worker", time.process_time() - cpu_start))
+
+
+def run_shared_exporter(endpoint, socket_path, ready, stop, results):
+    from fastapi_observability.shared_exporter import SharedExporterServer
+
+    server = SharedExporterServer(socket_path, otlp_endpoint=endpoint, flush_interval=0.2)
+    server.start()
+    cpu_start = time.process_time()
+    ready.set()
+    stop.wait()
+    server.stop()
+    results.put(("exporter", time.process_time() - cpu_start))
+
+
+def run_mode(mode, workers, spans):
+    from fastapi_observability.testing import LocalOTLPReceiver
+
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    socket_path = os.path.join(tempfile.mkdtemp(), "spans.sock")
+    total = workers * spans
+
+    with LocalOTLPReceiver(max_workers=max(4, workers)) as receiver:
+        exporter = None
+        stop = ctx.Event()
+        if mode == "shared":
+            ready = ctx.Event()
+            exporter = ctx.Process(target=run_shared_exporter, args=(receiver.endpoint, socket_path, ready, stop, results))
+            exporter.start()
+            ready.wait(10)
+
+        worker_ready = ctx.Queue()
+        go = ctx.Event()
+        processes = [
+            ctx.Process(target=run_worker, args=(mode, receiver.endpoint, socket_path, spans, worker_ready, go, results))
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        for _ in processes:
+            worker_ready.get()
+
+        start = time.perf_counter()
+        go.set()
+        for process in processes:
+            process.join()
+        if exporter is not None:
+            stop.set()
+            exporter.join()
+        complete = receiver.wait_for_spans(total, timeout=30)
+        wall = time.perf_counter() - start
+
+        cpu = sum(results.get()[1] for _ in range(workers + (1 if exporter is not None else 0)))
+        return {
+            "mode": mode,
+            "workers": workers,
+            "spans": total,
+            "received": receiver.span_count,
+            "complete": complete,
+            "wall_seconds": round(wall, 3),
+            "spans_per_second": round(receiver.span_count / wall, 1),
+            "cpu_seconds": round(cpu, 3),
+            "export_requests": len(receiver.requests),
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--spans", type=int, default=5000, help="spans per worker")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args(argv)
+
+    results = [run_mode(mode, args.workers, args.spans) for mode in ("direct", "shared")]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'mode':>8} {'spans':>8} {'received':>9} {'wall s':>8} {'spans/s':>10} {'cpu s':>8} {'requests':>9}")
+    for result in results:
+        print(
+            f"{result['mode']:>8} {result['spans']:>8} {result['received']:>9} {result['wall_seconds']:>8.2f} "
+            f"{result['spans_per_second']:>10.0f} {result['cpu_seconds']:>8.2f} {result['export_requests']:>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
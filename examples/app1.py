@@ -1,6 +1,5 @@
 from fastapi import FastAPI, status
 from fastapi_observability import FastAPIObservability
-import httpx
 import asyncio
 from fastapi.responses import JSONResponse
 import logging
@@ -29,9 +28,6 @@ observability = FastAPIObservability(
 # Get structured logger
 logger = observability.get_logger()
 
-# Explicitly instrument HTTPX client
-observability.instrument_httpx_client(capture_headers=True)
-
 @app.get("/")
 async def root():
     logger.info("root_endpoint_called")
@@ -41,10 +37,10 @@ async def root():
 async def chain():
     logger.info("Starting chain in app1")
     
-    # Call app2
-    async with httpx.AsyncClient() as client:
-        response = await client.get("http://app2:8000/process")
-        app2_result = response.json()
+    # Call app2 through the pooled client, which reuses connections across requests
+    client = observability.http_client("app2", base_url="http://app2:8000")
+    response = await client.get("/process")
+    app2_result = response.json()
     
     # Simulate some work
     await asyncio.sleep(0.5)
@@ -1,9 +1,36 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from .logger import FastAPIObservabilityLogger
-from .metrics import FastAPIObservabilityMetrics
-from .instrumentation import setup_telemetry, instrument_fastapi, instrument_httpx
-from .middleware import ObservabilityMiddleware
-from typing import Optional, List, Union, Callable
+from typing import Optional, List, Union, Callable, Dict, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from opentelemetry.sdk.trace.export import SpanExporter
+    from prometheus_client import CollectorRegistry
+    from .http_client import HTTPClientPool
+    from .policy import RoutePolicy
+
+# Subsystems are imported inside FastAPIObservability only when their feature
+# toggle is enabled. The OpenTelemetry SDK, exporters and instrumentors in
+# particular are expensive to import and dominate cold-start time.
+_LAZY_ATTRIBUTES = {
+    "FastAPIObservabilityLogger": ".logger",
+    "FastAPIObservabilityMetrics": ".metrics",
+    "ObservabilityMiddleware": ".middleware",
+    "setup_telemetry": ".instrumentation",
+    "instrument_fastapi": ".instrumentation",
+    "instrument_httpx": ".instrumentation",
+    "RoutePolicy": ".policy",
+    "route_policy": ".policy",
+    "RuntimeSettings": ".runtime",
+}
+
+def __getattr__(name):
+    """Resolve the component names this package used to import eagerly"""
+    module_name = _LAZY_ATTRIBUTES.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+    module = importlib.import_module(module_name, __name__)
+    return getattr(module, name)
 
 class FastAPIObservability:
     def __init__(
@@ -17,6 +44,54 @@ class FastAPIObservability:
         enable_opentelemetry: bool = True,
         excluded_endpoints: Union[List[str], str] = None,
         disable_default_loggers: bool = False,
+        defer_exporters: bool = False,
+        shutdown_timeout: float = 5.0,
+        shared_exporter_socket: Optional[str] = None,
+        span_spool_dir: Optional[str] = None,
+        span_spool_max_bytes: int = 256 * 1024 * 1024,
+        unified_logging: bool = False,
+        logger_levels: Optional[Dict[str, Union[int, str]]] = None,
+        error_traceback_limit: int = 5,
+        error_traceback_window: float = 60.0,
+        max_exception_fingerprint_series: int = 100,
+        heavy_hitters: Optional[Dict[str, Union[str, Callable]]] = None,
+        heavy_hitters_top_k: int = 10,
+        heavy_hitters_capacity: int = 100,
+        queue_time_headers: Optional[List[str]] = None,
+        enable_server_timing: bool = False,
+        server_timing_histograms: bool = False,
+        route_policies: Optional[Dict[str, Union["RoutePolicy", Dict[str, bool]]]] = None,
+        log_level: Union[int, str] = "INFO",
+        admin_token: Optional[str] = None,
+        admin_path: str = "/observability/config",
+        runtime_settings_path: Optional[str] = None,
+        runtime_poll_interval: float = 1.0,
+        enable_task_instrumentation: bool = True,
+        span_exporters: Optional[List["SpanExporter"]] = None,
+        metrics_registry: Optional["CollectorRegistry"] = None,
+        metrics_namespace: str = "",
+        metrics_labels: Optional[Dict[str, str]] = None,
+        log_sink: Optional[Callable[[Dict], None]] = None,
+        enable_profiling: bool = False,
+        profiling_dir: Optional[str] = None,
+        profiling_interval: float = 0.01,
+        profiling_max_overhead: float = 0.01,
+        profiling_export_interval: float = 60.0,
+        profiling_path: str = "/observability/profile",
+        request_archive_dir: Optional[str] = None,
+        request_archive_max_bytes: int = 1024 * 1024 * 1024,
+        request_archive_rotate_bytes: int = 64 * 1024 * 1024,
+        request_archive_rotate_interval: float = 3600.0,
+        statsd_host: Optional[str] = None,
+        statsd_port: int = 8125,
+        statsd_protocol: str = "dogstatsd",
+        statsd_flush_interval: float = 10.0,
+        capture_headers: bool = False,
+        enable_httpx_instrumentation: bool = True,
+        span_headers: Optional[List[str]] = None,
+        span_attribute_max_length: int = 256,
+        span_max_attributes: int = 64,
+        span_max_events: int = 32,
     ):
         # For backward compatibility, support both app_name and service_name
         if service_name is None and app_name is not None:
@@ -30,7 +105,10 @@ class FastAPIObservability:
         self.enable_prometheus = enable_prometheus
         self.enable_opentelemetry = enable_opentelemetry
         self.disable_default_loggers = disable_default_loggers
-        
+        self.shutdown_timeout = shutdown_timeout
+        self._is_shutdown = False
+        self._http_clients: Optional["HTTPClientPool"] = None
+
         # Format excluded endpoints for OpenTelemetry
         self.excluded_urls = None
         if excluded_endpoints:
@@ -40,39 +118,323 @@ class FastAPIObservability:
             else:
                 self.excluded_urls = excluded_endpoints
         
+        # Settings that can be changed while the application runs; route
+        # policies are compiled on startup
+        from .policy import RoutePolicies
+        from .runtime import RuntimeSettings
+        self.runtime = RuntimeSettings(
+            shared_path=runtime_settings_path,
+            poll_interval=runtime_poll_interval,
+            log_level=log_level,
+            route_policies=RoutePolicies(route_policies),
+            excluded_endpoints=excluded_endpoints or ()
+        )
+        
         # Initialize components based on feature flags
-        self.logger = FastAPIObservabilityLogger(
-            service_name=service_name, 
-            disable_default_loggers=disable_default_loggers
-        ) if enable_structlog else None
+        self.logger = None
+        if enable_structlog:
+            from .logger import FastAPIObservabilityLogger
+            self.logger = FastAPIObservabilityLogger(
+                service_name=service_name, 
+                disable_default_loggers=disable_default_loggers,
+                unified_logging=unified_logging,
+                logger_levels=logger_levels,
+                runtime=self.runtime,
+                log_sink=log_sink
+            )
+        
+        # Aggregated push metrics for deployments that cannot be scraped,
+        # flushed by a thread started in each worker on startup
+        self.statsd = None
+        if statsd_host:
+            from .statsd import StatsDEmitter
+            self.statsd = StatsDEmitter(
+                statsd_host,
+                statsd_port,
+                prefix=metrics_namespace,
+                tags={"service": service_name, **(metrics_labels or {})},
+                protocol=statsd_protocol,
+                flush_interval=statsd_flush_interval
+            )
         
-        self.metrics = FastAPIObservabilityMetrics(service_name) if enable_prometheus else None
+        self.metrics = None
+        if enable_prometheus or self.statsd is not None:
+            from .metrics import FastAPIObservabilityMetrics
+            self.metrics = FastAPIObservabilityMetrics(
+                service_name,
+                registry=metrics_registry,
+                max_exception_fingerprints=max_exception_fingerprint_series,
+                namespace=metrics_namespace,
+                const_labels=metrics_labels,
+                statsd=self.statsd
+            )
         
         # Setup OpenTelemetry if enabled
         self.tracer_provider = None
+        self.attribute_policy = None
         if enable_opentelemetry:
-            self.tracer_provider = setup_telemetry(service_name, otlp_endpoint)
+            from .attributes import SpanAttributePolicy
+            from .instrumentation import RuntimeSampler, setup_telemetry, instrument_fastapi
+            # Header allowlist, value truncation and per-span limits of all spans
+            self.attribute_policy = SpanAttributePolicy(
+                headers=span_headers,
+                max_value_length=span_attribute_max_length,
+                max_attributes=span_max_attributes,
+                max_events=span_max_events
+            )
+            # With defer_exporters the exporter threads and gRPC channels are
+            # only started on lifespan startup, i.e. in each worker process
+            # after a preloading server has forked.
+            self.tracer_provider = setup_telemetry(
+                service_name,
+                otlp_endpoint,
+                start_exporters=not defer_exporters,
+                shared_exporter_socket=shared_exporter_socket,
+                spool_dir=span_spool_dir,
+                spool_max_bytes=span_spool_max_bytes,
+                sampler=RuntimeSampler(self.runtime),
+                span_exporters=span_exporters,
+                attribute_policy=self.attribute_policy,
+                capture_headers=capture_headers,
+                enable_httpx_instrumentation=enable_httpx_instrumentation,
+            )
             # Instrument FastAPI with OpenTelemetry before adding middleware
             instrument_fastapi(
                 self.app, 
                 self.tracer_provider, 
-                excluded_urls=self.excluded_urls or "health,metrics"
+                excluded_urls=self.excluded_urls or "health,metrics",
+                capture_headers=capture_headers
+            )
+            
+            if self.metrics:
+                policy = self.attribute_policy
+                self.metrics.track_span_attributes(lambda: [policy])
+            
+            if span_spool_dir and self.metrics:
+                processor = self.tracer_provider.fork_safe_processor
+                self.metrics.track_span_spools(
+                    lambda: [p.spool for p in processor.processors if hasattr(p, "spool")]
+                )
+        
+        # Stack sampling attributed to routes, started in each worker on startup
+        self.profiler = None
+        if enable_profiling:
+            from .profiling import StackSampler
+            self.profiler = StackSampler(
+                interval=profiling_interval,
+                max_overhead=profiling_max_overhead,
+                output_dir=profiling_dir,
+                export_interval=profiling_export_interval
             )
         
-        # Add middleware if logging or metrics are enabled
-        if enable_structlog or enable_prometheus:
+        # Background tasks and sync code on the threadpool run outside the
+        # middleware's timing; the patches are process-wide, the tracer and
+        # metrics are selected per request by TaskInstrumentationApp. Also
+        # tags threadpool threads for the profiler
+        self.task_instrumentation = None
+        if enable_task_instrumentation and (self.metrics or self.tracer_provider or self.profiler):
+            from .tasks import instrument_tasks
+            self.task_instrumentation = instrument_tasks(tracer_provider=self.tracer_provider, metrics=self.metrics)
+        
+        # Top-K request counts per configured key, e.g. {"clients": "client_ip"}
+        self.heavy_hitters = {}
+        if heavy_hitters and (enable_structlog or enable_prometheus):
+            from .heavy_hitters import HeavyHitterTracker
+            self.heavy_hitters = {
+                name: HeavyHitterTracker(name, key, top_k=heavy_hitters_top_k, capacity=heavy_hitters_capacity)
+                for name, key in heavy_hitters.items()
+            }
+            if self.metrics:
+                trackers = list(self.heavy_hitters.values())
+                self.metrics.track_heavy_hitters(lambda: trackers)
+        
+        # Per-request records on local disk for offline latency analysis
+        self.request_archive = None
+        if request_archive_dir:
+            from .archive import RequestArchive
+            self.request_archive = RequestArchive(
+                request_archive_dir,
+                max_bytes=request_archive_max_bytes,
+                rotate_bytes=request_archive_rotate_bytes,
+                rotate_interval=request_archive_rotate_interval
+            )
+        
+        # Tags requests for the profiler; added first, so it runs inside the
+        # observability middleware and the request's span
+        if self.profiler is not None:
+            from .profiling import ProfiledApp
+            self.app.add_middleware(ProfiledApp)
+        
+        # Add middleware if logging, metrics or the request archive are enabled
+        self.errors = None
+        if enable_structlog or self.metrics is not None or self.request_archive is not None:
+            from .errors import ExceptionAggregator
+            from .middleware import ObservabilityMiddleware
+            # Unhandled exceptions grouped by fingerprint; full tracebacks are
+            # logged for the first error_traceback_limit occurrences per window
+            self.errors = ExceptionAggregator(
+                traceback_limit=error_traceback_limit,
+                window=error_traceback_window
+            )
             self.app.add_middleware(
                 ObservabilityMiddleware,
                 service_name=service_name,
                 logger=self.logger,
                 metrics=self.metrics,
-                excluded_endpoints=excluded_endpoints
+                errors=self.errors,
+                heavy_hitters=list(self.heavy_hitters.values()),
+                queue_time_headers=queue_time_headers,
+                server_timing=enable_server_timing,
+                server_timing_histograms=server_timing_histograms,
+                runtime=self.runtime,
+                archive=self.request_archive
             )
         
+        # Outermost, so background tasks added anywhere in the request are seen
+        if self.task_instrumentation is not None:
+            from .tasks import TaskInstrumentationApp
+            self.app.add_middleware(TaskInstrumentationApp, instrumentation=self.task_instrumentation)
+        
         # Add metrics endpoint if Prometheus is enabled
         if enable_prometheus:
             self.app.add_route("/metrics", self.metrics.get_metrics)
-    
+        
+        # Add the runtime settings endpoint if a token protects it
+        if admin_token:
+            from .runtime import create_admin_endpoint
+            self.app.add_route(
+                admin_path,
+                create_admin_endpoint(self.runtime, admin_token),
+                methods=["GET", "PUT", "DELETE"]
+            )
+            if self.profiler is not None:
+                from .profiling import create_profile_endpoint
+                self.app.add_route(profiling_path, create_profile_endpoint(self.profiler, admin_token))
+
+        self._install_lifespan_hooks()
+
+    def _install_lifespan_hooks(self):
+        """Run startup() and shutdown() around the application's own lifespan"""
+        lifespan_context = self.app.router.lifespan_context
+
+        @asynccontextmanager
+        async def lifespan(app):
+            self.startup()
+            try:
+                async with lifespan_context(app) as state:
+                    yield state
+            finally:
+                await self.close_http_clients()
+                self.shutdown()
+
+        self.app.router.lifespan_context = lifespan
+
+    def startup(self):
+        """Start the telemetry exporters in the current process
+
+        Also starts the profiler, StatsD flushing and polling of shared runtime
+        settings, compiles the route policies and re-applies
+        unified logging, since servers install their own log handlers after
+        the application was imported. Called automatically on
+        lifespan startup. Call it from a server's post-fork hook (e.g. gunicorn
+        ``post_fork``) if the workers do not run the ASGI lifespan. Calling it
+        again in the same process is a no-op.
+        """
+        self._is_shutdown = False
+        self.runtime.compile(self.app.routes)
+        self.runtime.start()
+        if self.logger is not None:
+            self.logger.configure_stdlib_logging()
+        if self.tracer_provider is not None:
+            self.tracer_provider.fork_safe_processor.start()
+        if self.profiler is not None:
+            self.profiler.start()
+        if self.statsd is not None:
+            self.statsd.start()
+
+    def shutdown(self, timeout: Optional[float] = None) -> bool:
+        """Flush pending telemetry and stop the exporters of the current process
+
+        Called automatically on lifespan shutdown. Calling it more than once is a no-op.
+
+        Args:
+            timeout: Deadline in seconds for flushing, defaults to ``shutdown_timeout``
+
+        Returns:
+            True if all pending telemetry was flushed within the deadline
+        """
+        if self._is_shutdown:
+            return True
+        self._is_shutdown = True
+
+        if timeout is None:
+            timeout = self.shutdown_timeout
+
+        self.runtime.stop()
+        if self.profiler is not None:
+            self.profiler.stop()
+        
+        flushed = True
+        if self.tracer_provider is not None:
+            from .instrumentation import shutdown_telemetry
+            flushed = shutdown_telemetry(self.tracer_provider, timeout=timeout)
+        if self.logger is not None:
+            self.logger.flush()
+        if self.request_archive is not None:
+            self.request_archive.close()
+        if self.statsd is not None:
+            self.statsd.stop()
+        return flushed
+
+    def http_client(self, name: str = "default", **client_kwargs):
+        """Get a pooled, instrumented HTTPX client that lives for the application lifespan
+        
+        Reusing the client keeps connections to downstream services open across
+        requests. Requests sent through it are traced and the trace context is
+        propagated to the peer without patching HTTPX globally. With Prometheus
+        enabled, per-peer latency and connection pool usage are exported.
+        
+        Args:
+            name: Name of the client, e.g. the downstream service it calls
+            **client_kwargs: Arguments for httpx.AsyncClient, used only when the
+                client is created (e.g. base_url, timeout, limits, http2)
+        
+        Returns:
+            The pooled HTTPX AsyncClient, closed on lifespan shutdown
+        """
+        if self._http_clients is None:
+            from .http_client import HTTPClientPool
+            self._http_clients = HTTPClientPool(
+                tracer_provider=self.tracer_provider,
+                metrics=self.metrics
+            )
+        return self._http_clients.get(name, **client_kwargs)
+
+    async def close_http_clients(self):
+        """Close the pooled HTTPX clients
+
+        Called automatically on lifespan shutdown.
+        """
+        if self._http_clients is not None:
+            await self._http_clients.aclose()
+
+    def include_metrics(self, other: "FastAPIObservability"):
+        """Expose the metrics of another instance, e.g. of a mounted sub-application, on this one's /metrics
+        
+        Each instance keeps its own registry; they are collected together at
+        scrape time, with metrics of the same name merged into one family.
+        
+        Args:
+            other: FastAPIObservability instance whose metrics to include
+        
+        Raises:
+            RuntimeError: If Prometheus is not enabled on this instance, or the
+                other instance has no metrics
+        """
+        if not self.enable_prometheus or self.metrics is None or other.metrics is None:
+            raise RuntimeError("Prometheus is not enabled")
+        self.metrics.include(other.metrics)
+
     def get_logger(self):
         """Get the configured logger"""
         if not self.enable_structlog:
@@ -83,7 +445,8 @@ class FastAPIObservability:
         """Instrument HTTPX client with OpenTelemetry
         
         Args:
-            capture_headers: Whether to capture HTTP headers as span attributes
+            capture_headers: Whether to capture the headers allowlisted by
+                ``span_headers`` as span attributes
             request_hook: Optional callback function called before the request is sent
             response_hook: Optional callback function called after the response is received
         
@@ -96,6 +459,7 @@ class FastAPIObservability:
         if not self.enable_opentelemetry:
             raise RuntimeError("OpenTelemetry is not enabled")
             
+        from .instrumentation import instrument_httpx
         return instrument_httpx(
             tracer_provider=self.tracer_provider,
             capture_headers=capture_headers,
@@ -0,0 +1,479 @@
+"""
+Columnar on-disk archive of per-request records for offline analysis.
+
+Prometheus histograms aggregate request latencies away. With an archive,
+ObservabilityMiddleware also appends one record per request (route, method,
+status, duration, request and response size, client, trace ID) to local
+files. Records are buffered in memory and written in batches by a background
+thread, column by column, so millions of requests take little space and can
+be loaded for percentile and regression analysis without parsing logs.
+
+Files are written as Arrow IPC streams (``.arrows``) when pyarrow is
+installed, else in a compact array-backed format (``.columns``): a header
+with the schema, then batches whose numeric columns are raw arrays and whose
+string columns are dictionary-encoded. ``read_archive`` reads both.
+
+The file being written ends in ``.active``; it is renamed when rotated by
+size or age, so readers only pick up finished files. Its writer holds an
+advisory lock on it, so an ``.active`` file left unlocked by a worker that
+died is finished by the next worker to start. The oldest files of all workers
+are deleted beyond ``max_bytes``. Summarize an archive directory with:
+
+    python -m fastapi_observability.archive /var/lib/my-service/requests
+"""
+import argparse
+import json
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from typing import Any, Dict, IO, List, Optional, Sequence, Tuple, Union
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None  # type: ignore[assignment]
+
+# Column names and array type codes; "str" columns are dictionary-encoded
+COLUMNS = (
+    ("timestamp", "d"),
+    ("route", "str"),
+    ("method", "str"),
+    ("status", "H"),
+    ("duration", "d"),
+    ("request_bytes", "q"),
+    ("response_bytes", "q"),
+    ("client", "str"),
+    ("trace_id", "str"),
+)
+
+MAGIC = b"FOBSREQ1"
+ACTIVE_SUFFIX = ".active"
+_LENGTH = struct.Struct("<I")
+
+def _arrow():
+    """Return pyarrow if it is installed"""
+    try:
+        import pyarrow  # type: ignore[import-not-found]
+        import pyarrow.ipc  # type: ignore[import-not-found]  # noqa: F401
+    except ImportError:
+        return None
+    return pyarrow
+
+def _encode_strings(values: Sequence[str]) -> bytes:
+    dictionary: Dict[str, int] = {}
+    indices = array("I", [dictionary.setdefault(value, len(dictionary)) for value in values])
+    encoded = [value.encode("utf-8") for value in dictionary]
+    lengths = array("I", [len(value) for value in encoded])
+    return _LENGTH.pack(len(encoded)) + lengths.tobytes() + b"".join(encoded) + indices.tobytes()
+
+def _decode_strings(payload: bytes, rows: int, swap: bool) -> List[str]:
+    (count,) = _LENGTH.unpack_from(payload)
+    position = _LENGTH.size
+    lengths = array("I")
+    lengths.frombytes(payload[position:position + count * lengths.itemsize])
+    indices = array("I")
+    if swap:
+        lengths.byteswap()
+    position += count * lengths.itemsize
+    dictionary = []
+    for length in lengths:
+        dictionary.append(payload[position:position + length].decode("utf-8"))
+        position += length
+    indices.frombytes(payload[position:position + rows * indices.itemsize])
+    if swap:
+        indices.byteswap()
+    return [dictionary[index] for index in indices]
+
+class ColumnarWriter:
+    """Writer of the array-backed columnar format"""
+
+    suffix = ".columns"
+
+    def __init__(self, path: str):
+        self.file = open(path, "wb")
+        header = json.dumps({"columns": COLUMNS, "byteorder": sys.byteorder}).encode()
+        self.file.write(MAGIC + _LENGTH.pack(len(header)) + header)
+
+    def write_batch(self, rows: List[tuple]):
+        columns = list(zip(*rows))
+        parts = [_LENGTH.pack(len(rows))]
+        for (_, typecode), values in zip(COLUMNS, columns):
+            payload = _encode_strings(values) if typecode == "str" else array(typecode, values).tobytes()
+            parts.append(_LENGTH.pack(len(payload)))
+            parts.append(payload)
+        # One write per batch; a batch cut short by a crash is skipped by readers
+        self.file.write(b"".join(parts))
+        self.file.flush()
+
+    def tell(self) -> int:
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+class ArrowWriter:
+    """Writer of Arrow IPC streams, with dictionary-encoded string columns"""
+
+    suffix = ".arrows"
+
+    def __init__(self, path: str):
+        pa = self.pa = _arrow()
+        types = {"d": pa.float64(), "H": pa.uint16(), "q": pa.int64(), "str": pa.dictionary(pa.int32(), pa.string())}
+        self.schema = pa.schema([(name, types[typecode]) for name, typecode in COLUMNS])
+        self.file = pa.OSFile(path, "wb")
+        try:
+            options = pa.ipc.IpcWriteOptions(compression="zstd")
+        except (ValueError, pa.ArrowException):
+            options = None
+        self.writer = pa.ipc.new_stream(self.file, self.schema, options=options)
+
+    def write_batch(self, rows: List[tuple]):
+        pa = self.pa
+        columns = []
+        for (_, typecode), values, field in zip(COLUMNS, zip(*rows), self.schema):
+            if typecode == "str":
+                columns.append(pa.array(values, pa.string()).dictionary_encode())
+            else:
+                columns.append(pa.array(values, field.type))
+        self.writer.write_batch(pa.RecordBatch.from_arrays(columns, schema=self.schema))
+        self.file.flush()
+
+    def tell(self) -> int:
+        return self.file.tell()
+
+    def close(self):
+        self.writer.close()
+        self.file.close()
+
+class RequestArchive:
+    """
+    Batched, rotated columnar archive of request records.
+
+    ``record()`` only appends a tuple to a buffer; a writer thread, started
+    lazily in each process, writes the buffer every ``flush_interval``
+    seconds or once ``batch_size`` records are pending. When the writer falls
+    behind by more than ``max_pending`` records, further records are dropped
+    and counted in ``dropped_records``.
+
+    Args:
+        directory: Directory for the archive files
+        max_bytes: Maximum disk usage of the finished files in the directory,
+            shared by all workers writing to it
+        rotate_bytes: Size at which a file is finished and a new one started
+        rotate_interval: Age in seconds at which a file is finished
+        batch_size: Records per written batch
+        flush_interval: Maximum time in seconds records wait in memory
+        max_pending: Maximum number of records waiting in memory
+        format: "arrow", "columns" or "auto" for Arrow if pyarrow is installed
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int = 1024 * 1024 * 1024,
+        rotate_bytes: int = 64 * 1024 * 1024,
+        rotate_interval: float = 3600.0,
+        batch_size: int = 4096,
+        flush_interval: float = 1.0,
+        max_pending: int = 100000,
+        format: str = "auto",
+    ):
+        if format not in ("auto", "arrow", "columns"):
+            raise ValueError(f"Unknown archive format {format!r}, expected 'auto', 'arrow' or 'columns'")
+        if format == "arrow" and _arrow() is None:
+            raise ValueError("The arrow archive format requires pyarrow")
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.rotate_bytes = rotate_bytes
+        self.rotate_interval = rotate_interval
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.writer_class = ArrowWriter if format == "arrow" or (format == "auto" and _arrow() is not None) else ColumnarWriter
+
+        self.written_records = 0
+        self.dropped_records = 0
+        self._pending: List[tuple] = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._writer: Optional[Union[ColumnarWriter, ArrowWriter]] = None
+        self._path: Optional[str] = None
+        # Second handle on the active file, holding its lock
+        self._active_lock: Optional[IO[bytes]] = None
+        self._opened_at = 0.0
+        self._sequence = 0
+        self._pid: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def record(
+        self,
+        route: str,
+        method: str,
+        status: int,
+        duration: float,
+        request_bytes: int = -1,
+        response_bytes: int = -1,
+        client: str = "",
+        trace_id: str = "",
+        timestamp: Optional[float] = None,
+    ):
+        """Add a request record; sizes are -1 when unknown"""
+        if self._pid != os.getpid():
+            self._start()
+        row = (
+            time.time() if timestamp is None else timestamp,
+            route, method, status, duration, request_bytes, response_bytes, client, trace_id
+        )
+        with self._lock:
+            pending = self._pending
+            if len(pending) >= self.max_pending:
+                self.dropped_records += 1
+                return
+            pending.append(row)
+        if len(pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Buffers and files inherited across a fork belong to the parent
+            self._pending = []
+            self._writer = None
+            if self._active_lock is not None:
+                self._active_lock.close()
+                self._active_lock = None
+            self._pid = os.getpid()
+            os.makedirs(self.directory, exist_ok=True)
+            self._finish_orphans()
+            self._remove_old_files()
+            self._thread = threading.Thread(target=self._run, name="request-archive", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if self._pid != pid:
+                return
+            self.flush()
+
+    def flush(self):
+        """Write pending records, rotating the current file when it is due"""
+        with self._write_lock:
+            while self._pending:
+                with self._lock:
+                    rows, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+                writer = self._writer or self._open()
+                writer.write_batch(rows)
+                self.written_records += len(rows)
+                if writer.tell() >= self.rotate_bytes:
+                    self._finish()
+            if self._writer is not None and time.time() - self._opened_at >= self.rotate_interval:
+                self._finish()
+
+    def close(self):
+        """Write pending records, finish the current file and stop the writer thread"""
+        if self._pid != os.getpid():
+            return
+        self.flush()
+        self._pid = None
+        self._wakeup.set()
+        with self._write_lock:
+            if self._writer is not None:
+                self._finish()
+
+    def _open(self) -> Union[ColumnarWriter, ArrowWriter]:
+        self._opened_at = time.time()
+        # The sequence number keeps files opened within the same millisecond apart
+        self._sequence += 1
+        name = f"requests-{os.getpid()}-{int(self._opened_at * 1000)}-{self._sequence:06d}{self.writer_class.suffix}"
+        self._path = path = os.path.join(self.directory, name)
+        self._writer = writer = self.writer_class(path + ACTIVE_SUFFIX)
+        if fcntl is not None:
+            self._active_lock = open(path + ACTIVE_SUFFIX, "rb")
+            fcntl.flock(self._active_lock, fcntl.LOCK_EX)
+        return writer
+
+    def _finish(self):
+        self._writer.close()
+        self._writer = None
+        os.replace(self._path + ACTIVE_SUFFIX, self._path)
+        if self._active_lock is not None:
+            self._active_lock.close()
+            self._active_lock = None
+        self._remove_old_files()
+
+    def _finish_orphans(self):
+        """Finish the active files of workers that died, which hold no lock"""
+        if fcntl is None:
+            return
+        for name in os.listdir(self.directory):
+            if not (name.startswith("requests-") and name.endswith(ACTIVE_SUFFIX)):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path, "rb") as file:
+                    fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    if os.fstat(file.fileno()).st_size:
+                        os.replace(path, path[:-len(ACTIVE_SUFFIX)])
+                    else:
+                        os.remove(path)
+            except (BlockingIOError, FileNotFoundError):
+                # Still being written, or finished by another worker first
+                continue
+
+    def _remove_old_files(self):
+        """Delete the oldest finished files of any worker beyond max_bytes"""
+        files: List[Tuple[int, str, int]] = []
+        for name in os.listdir(self.directory):
+            if not (name.startswith("requests-") and name.endswith((ColumnarWriter.suffix, ArrowWriter.suffix))):
+                continue
+            try:
+                size = os.path.getsize(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            # requests-<pid>-<opened at in ms>-<sequence>
+            files.append((int(name.split("-")[2]), name, size))
+        files.sort()
+        total = sum(size for _, _, size in files)
+        # The newest file is kept even if it alone exceeds the budget
+        for _, name, size in files[:-1]:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                # Deleted by another worker at the same time
+                pass
+            total -= size
+
+def read_archive(path: str) -> Dict[str, list]:
+    """
+    Read an archive file into columns.
+
+    Args:
+        path: ``.columns`` or ``.arrows`` file
+
+    Returns:
+        Column name to list of values, in record order
+
+    Raises:
+        ValueError: If the file is not an archive file
+    """
+    if path.endswith(ArrowWriter.suffix):
+        pa = _arrow()
+        if pa is None:
+            raise ValueError(f"Reading {path} requires pyarrow")
+        batches = []
+        with pa.OSFile(path, "rb") as source:
+            reader = pa.ipc.open_stream(source)
+            try:
+                for record_batch in reader:
+                    batches.append(record_batch)
+            except pa.ArrowException:
+                # Stream of a worker that died, cut short after the last complete batch
+                pass
+        table = pa.Table.from_batches(batches, schema=reader.schema)
+        return {name: table.column(name).to_pylist() for name in table.column_names}
+
+    with open(path, "rb") as file:
+        data = file.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{path} is not a request archive file")
+    position = len(MAGIC)
+    (length,) = _LENGTH.unpack_from(data, position)
+    position += _LENGTH.size
+    header = json.loads(data[position:position + length])
+    position += length
+    swap = header["byteorder"] != sys.byteorder
+    columns: Dict[str, Any] = {name: [] for name, _ in header["columns"]}
+
+    while position + _LENGTH.size <= len(data):
+        (rows,) = _LENGTH.unpack_from(data, position)
+        batch_position = position + _LENGTH.size
+        batch: List[Tuple[str, Any]] = []
+        for name, typecode in header["columns"]:
+            if batch_position + _LENGTH.size > len(data):
+                return columns
+            (size,) = _LENGTH.unpack_from(data, batch_position)
+            batch_position += _LENGTH.size
+            payload = data[batch_position:batch_position + size]
+            if len(payload) < size:
+                # Batch cut short by a crash
+                return columns
+            batch_position += size
+            if typecode == "str":
+                batch.append((name, _decode_strings(payload, rows, swap)))
+            else:
+                values = array(typecode)
+                values.frombytes(payload)
+                if swap:
+                    values.byteswap()
+                batch.append((name, values))
+        for name, values in batch:
+            columns[name].extend(values)
+        position = batch_position
+    return columns
+
+def list_archive(directory: str) -> List[str]:
+    """Finished archive files in a directory, oldest first per process"""
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.startswith("requests-") and name.endswith((ColumnarWriter.suffix, ArrowWriter.suffix))
+    )
+
+def percentile(sorted_values: Sequence[float], fraction: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+def summarize(directory: str) -> List[dict]:
+    """Request count, error count and latency percentiles per route and method"""
+    durations: Dict[tuple, List[float]] = {}
+    errors: Dict[tuple, int] = {}
+    for path in list_archive(directory):
+        columns = read_archive(path)
+        for route, method, status, duration in zip(columns["route"], columns["method"], columns["status"], columns["duration"]):
+            key = (route, method)
+            durations.setdefault(key, []).append(duration)
+            if status >= 500:
+                errors[key] = errors.get(key, 0) + 1
+
+    summary = []
+    for (route, method), values in sorted(durations.items()):
+        values.sort()
+        summary.append({
+            "route": route,
+            "method": method,
+            "requests": len(values),
+            "errors": errors.get((route, method), 0),
+            "p50": percentile(values, 0.5),
+            "p95": percentile(values, 0.95),
+            "p99": percentile(values, 0.99),
+            "max": values[-1],
+        })
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize a FastAPIObservability request archive")
+    parser.add_argument("directory", help="archive directory")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = parser.parse_args(argv)
+
+    summary = summarize(args.directory)
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+    print(f"{'method':<7} {'route':<40} {'requests':>9} {'errors':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for row in summary:
+        print(
+            f"{row['method']:<7} {row['route']:<40} {row['requests']:>9} {row['errors']:>7} "
+            f"{row['p50'] * 1000:>8.1f} {row['p95'] * 1000:>8.1f} {row['p99'] * 1000:>8.1f} {row['max'] * 1000:>8.1f}"
+        )
+
+if __name__ == "__main__":
+    main()
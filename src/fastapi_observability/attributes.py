@@ -0,0 +1,132 @@
+"""
+Bounds on the size of spans built by the instrumentation hooks.
+
+Every attribute costs CPU to serialize and money to store, and header values
+or query strings can be arbitrarily long. A SpanAttributePolicy decides what
+the request and response hooks record: only allowlisted headers, looked up
+in a table compiled once instead of being matched per request, with values
+truncated to ``max_value_length``. Its SpanLimits cap the attributes and
+events of every span, and SpanLimitAccounting counts what was truncated or
+dropped because of them, so the limits can be tuned from the metrics.
+"""
+from typing import Dict, Iterable, Optional, Tuple
+from opentelemetry.sdk.trace import SpanLimits, SpanProcessor
+
+# Captured when header capture is enabled and no allowlist is given
+DEFAULT_CAPTURED_HEADERS = ("content-type", "content-length", "user-agent", "x-request-id")
+
+# Never captured, as their values are credentials
+SENSITIVE_HEADERS = frozenset({"authorization", "proxy-authorization", "cookie", "set-cookie", "x-api-key"})
+
+class SpanAttributePolicy:
+    """
+    Header allowlist, value truncation and per-span limits.
+
+    Args:
+        headers: Names of the request and response headers to capture,
+            defaults to ``DEFAULT_CAPTURED_HEADERS``
+        max_value_length: Maximum length of string attribute values
+        max_attributes: Maximum number of attributes per span
+        max_events: Maximum number of events per span
+
+    Raises:
+        ValueError: If a sensitive header is allowlisted or a limit is not positive
+    """
+
+    def __init__(
+        self,
+        headers: Optional[Iterable[str]] = None,
+        max_value_length: int = 256,
+        max_attributes: int = 64,
+        max_events: int = 32,
+    ):
+        if min(max_value_length, max_attributes, max_events) <= 0:
+            raise ValueError("Span attribute limits must be positive")
+        headers = [name.lower() for name in (DEFAULT_CAPTURED_HEADERS if headers is None else headers)]
+        sensitive = SENSITIVE_HEADERS.intersection(headers)
+        if sensitive:
+            raise ValueError(f"Sensitive headers cannot be captured: {', '.join(sorted(sensitive))}")
+        self.max_value_length = max_value_length
+        self.max_attributes = max_attributes
+        self.max_events = max_events
+        # Header name, as str and as raw ASGI bytes, to attribute key
+        normalized = {name: name.replace("-", "_") for name in headers}
+        self.request_headers: Dict[str, str] = {name: f"http.request.header.{key}" for name, key in normalized.items()}
+        self.response_headers: Dict[str, str] = {name: f"http.response.header.{key}" for name, key in normalized.items()}
+        self.raw_request_headers: Dict[bytes, str] = {name.encode("latin-1"): key for name, key in self.request_headers.items()}
+
+        self.truncated_values = 0
+        self.dropped_attributes = 0
+        self.dropped_events = 0
+        self.dropped_links = 0
+
+    def span_limits(self) -> SpanLimits:
+        """SpanLimits for the tracer provider, enforced by the SDK on every span"""
+        return SpanLimits(
+            max_span_attributes=self.max_attributes,
+            max_events=self.max_events,
+            max_span_attribute_length=self.max_value_length,
+        )
+
+    def truncate(self, value: str) -> str:
+        """Shorten a string value to ``max_value_length``
+
+        Truncations are counted by SpanLimitAccounting when the span ends,
+        together with the ones made by the SDK.
+        """
+        if len(value) <= self.max_value_length:
+            return value
+        return value[:self.max_value_length]
+
+    def asgi_request_headers(self, headers: Iterable[Tuple[bytes, bytes]]) -> Dict[str, Tuple[str, ...]]:
+        """Attributes of the allowlisted headers of an ASGI scope"""
+        attributes: Dict[str, Tuple[str, ...]] = {}
+        lookup = self.raw_request_headers
+        for name, value in headers:
+            key = lookup.get(name)
+            if key is not None:
+                attributes[key] = attributes.get(key, ()) + (self.truncate(value.decode("latin-1")),)
+        return attributes
+
+    def http_headers(self, headers, response: bool = False) -> Dict[str, Tuple[str, ...]]:
+        """Attributes of the allowlisted headers of httpx headers"""
+        attributes: Dict[str, Tuple[str, ...]] = {}
+        if headers is None:
+            return attributes
+        for name, key in (self.response_headers if response else self.request_headers).items():
+            values = headers.get_list(name)
+            if values:
+                attributes[key] = tuple(self.truncate(value) for value in values)
+        return attributes
+
+class SpanLimitAccounting(SpanProcessor):
+    """
+    Count the attribute values truncated and the attributes, events and links
+    spans dropped because of the span limits.
+
+    The SDK truncates values to ``max_span_attribute_length`` without a trace,
+    e.g. long ``http.url`` or ``http.target`` values, and the hooks truncate to
+    the same length. A string value of exactly that length is therefore
+    counted as truncated; values that were exactly that long to begin with
+    are counted too.
+    """
+
+    def __init__(self, policy: SpanAttributePolicy):
+        self.policy = policy
+
+    def on_end(self, span):
+        policy = self.policy
+        limit = policy.max_value_length
+        truncated = 0
+        for value in span.attributes.values():
+            if type(value) is str:
+                if len(value) == limit:
+                    truncated += 1
+            elif type(value) is tuple:
+                for item in value:
+                    if type(item) is str and len(item) == limit:
+                        truncated += 1
+        policy.truncated_values += truncated
+        policy.dropped_attributes += span.dropped_attributes
+        policy.dropped_events += span.dropped_events
+        policy.dropped_links += span.dropped_links
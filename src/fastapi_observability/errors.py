@@ -0,0 +1,161 @@
+"""
+Exception fingerprinting and deduplicated error aggregation.
+
+Exceptions are grouped by a fingerprint of their type and the innermost frames
+of their traceback. Frames are normalized to module and function names, so the
+fingerprint is stable across deployments, line number changes and messages
+carrying request data. Per fingerprint, occurrences are counted and full
+tracebacks are only logged for the first few occurrences in each time window.
+"""
+import hashlib
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Callable, List, Optional
+
+@lru_cache(maxsize=1024)
+def _module_name(filename: str) -> str:
+    """Get a path-independent name for the file a frame belongs to"""
+    filename = os.path.normpath(filename)
+    # Longest matching sys.path entry, e.g. site-packages before its parent
+    for path in sorted((p for p in sys.path if p), key=len, reverse=True):
+        path = os.path.normpath(os.path.abspath(path)) + os.sep
+        if filename.startswith(path):
+            filename = filename[len(path):]
+            break
+    else:
+        filename = os.path.basename(filename)
+    return os.path.splitext(filename)[0].replace(os.sep, ".")
+
+def fingerprint_exception(error: BaseException, frames: int = 5) -> str:
+    """
+    Fingerprint an exception by its type and normalized top-of-stack.
+
+    Args:
+        error: The exception
+        frames: Number of innermost traceback frames to include
+
+    Returns:
+        A 16 character hex fingerprint
+    """
+    error_type = type(error)
+    parts = [f"{error_type.__module__}.{error_type.__qualname__}"]
+    stack = traceback.extract_tb(error.__traceback__)[-frames:] if frames > 0 else []
+    for frame in stack:
+        parts.append(f"{_module_name(frame.filename)}:{frame.name}")
+    return hashlib.sha1("\n".join(parts).encode()).hexdigest()[:16]
+
+class ErrorGroup:
+    """Occurrences of exceptions sharing a fingerprint"""
+
+    def __init__(self, fingerprint: str, exception_type: str, location: str, now: float):
+        self.fingerprint = fingerprint
+        self.exception_type = exception_type
+        self.location = location
+        self.count = 0
+        self.first_seen = now
+        self.last_seen = now
+        self.last_message = ""
+        self.window_start = now
+        self.window_count = 0
+        # Occurrences whose traceback was left out since the last one was logged
+        self.suppressed = 0
+
+    def to_dict(self):
+        return {
+            "fingerprint": self.fingerprint,
+            "exception_type": self.exception_type,
+            "location": self.location,
+            "count": self.count,
+            "first_seen": self.first_seen,
+            "last_seen": self.last_seen,
+            "last_message": self.last_message,
+        }
+
+class ErrorOccurrence:
+    """Result of recording one exception"""
+
+    def __init__(self, group: ErrorGroup, log_traceback: bool, suppressed: int):
+        self.group = group
+        self.fingerprint = group.fingerprint
+        # Occurrences of the group including this one
+        self.count = group.count
+        self.log_traceback = log_traceback
+        # Occurrences whose traceback was left out before this one was logged
+        self.suppressed = suppressed
+
+class ExceptionAggregator:
+    """
+    Bounded in-memory aggregation of exceptions by fingerprint.
+
+    Args:
+        max_fingerprints: Maximum number of groups kept; the least recently
+            seen group is evicted when a new one does not fit
+        traceback_limit: Number of occurrences per group and window for which
+            the full traceback should be logged
+        window: Length of the traceback window in seconds
+        frames: Number of innermost traceback frames in the fingerprint
+        clock: Time source, defaults to time.time
+    """
+
+    def __init__(
+        self,
+        max_fingerprints: int = 1000,
+        traceback_limit: int = 5,
+        window: float = 60.0,
+        frames: int = 5,
+        clock: Optional[Callable[[], float]] = None,
+    ):
+        self.max_fingerprints = max_fingerprints
+        self.traceback_limit = traceback_limit
+        self.window = window
+        self.frames = frames
+        self.clock = clock or time.time
+        self.evicted = 0
+        self._groups: "OrderedDict[str, ErrorGroup]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, error: BaseException) -> ErrorOccurrence:
+        """Record an exception and decide whether its traceback should be logged"""
+        fingerprint = fingerprint_exception(error, self.frames)
+        now = self.clock()
+
+        with self._lock:
+            group = self._groups.get(fingerprint)
+            if group is None:
+                stack = traceback.extract_tb(error.__traceback__)
+                location = f"{_module_name(stack[-1].filename)}:{stack[-1].name}" if stack else ""
+                group = ErrorGroup(fingerprint, type(error).__name__, location, now)
+                self._groups[fingerprint] = group
+                if len(self._groups) > self.max_fingerprints:
+                    self._groups.popitem(last=False)
+                    self.evicted += 1
+            else:
+                self._groups.move_to_end(fingerprint)
+
+            group.count += 1
+            group.last_seen = now
+            group.last_message = str(error)
+
+            if now - group.window_start >= self.window:
+                group.window_start = now
+                group.window_count = 0
+            group.window_count += 1
+
+            log_traceback = group.window_count <= self.traceback_limit
+            suppressed = 0
+            if log_traceback:
+                suppressed, group.suppressed = group.suppressed, 0
+            else:
+                group.suppressed += 1
+
+        return ErrorOccurrence(group, log_traceback, suppressed)
+
+    def groups(self) -> List[dict]:
+        """Get the tracked groups, most recently seen last"""
+        with self._lock:
+            return [group.to_dict() for group in self._groups.values()]
@@ -0,0 +1,189 @@
+"""
+Heavy-hitter tracking of clients and tenants with bounded memory.
+
+Using client IPs or API keys as Prometheus labels creates one series per
+distinct value. ``HeavyHitterTracker`` instead keeps a Space-Saving summary of
+a fixed number of keys per request attribute and exports only the current
+top-K. Keys seen more than ``total / capacity`` times are guaranteed to be in
+the summary; each count overestimates the true count by at most its error.
+"""
+import hashlib
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Union
+
+from fastapi import Request, Response
+
+class SpaceSaving:
+    """
+    Space-Saving summary of the most frequent keys, with weighted sums per key.
+
+    Counts are kept in buckets of equal count, so recording a key and evicting
+    the least frequent one are O(1). When a new key arrives and the summary is
+    full, it replaces a key with the minimum count and inherits that count as
+    its error. The sums of the evicted key are not inherited.
+
+    Args:
+        capacity: Maximum number of keys tracked
+    """
+
+    def __init__(self, capacity: int):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.total = 0
+        # key -> [count, error, bytes, duration_sum]
+        self._entries: Dict[str, list] = {}
+        # count -> keys with that count, in insertion order
+        self._buckets: Dict[int, Dict[str, None]] = {}
+        self._min_count = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _move(self, key: str, old_count: int, new_count: int):
+        bucket = self._buckets[old_count]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[old_count]
+            if old_count == self._min_count:
+                self._min_count = new_count
+        self._buckets.setdefault(new_count, {})[key] = None
+
+    def add(self, key: str, size: int = 0, duration: float = 0.0):
+        """Count one occurrence of key with its size and duration"""
+        self.total += 1
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._move(key, entry[0], entry[0] + 1)
+            entry[0] += 1
+            entry[2] += size
+            entry[3] += duration
+            return
+
+        if len(self._entries) < self.capacity:
+            self._entries[key] = [1, 0, size, duration]
+            self._buckets.setdefault(1, {})[key] = None
+            self._min_count = 1
+            return
+
+        # Replace the oldest key with the minimum count
+        min_count = self._min_count
+        bucket = self._buckets[min_count]
+        evicted = next(iter(bucket))
+        del bucket[evicted]
+        del self._entries[evicted]
+        self._entries[key] = [min_count + 1, min_count, size, duration]
+        if not bucket:
+            del self._buckets[min_count]
+            self._min_count = min_count + 1
+        self._buckets.setdefault(min_count + 1, {})[key] = None
+
+    def top(self, k: int) -> List[dict]:
+        """Get the k keys with the highest counts"""
+        entries = sorted(self._entries.items(), key=lambda item: item[1][0], reverse=True)[:k]
+        return [
+            {"key": key, "count": count, "error": error, "bytes": size, "duration_sum": duration}
+            for key, (count, error, size, duration) in entries
+        ]
+
+    def clear(self):
+        self.total = 0
+        self._entries.clear()
+        self._buckets.clear()
+        self._min_count = 0
+
+def _content_length(headers) -> int:
+    try:
+        return int(headers.get("content-length", 0))
+    except ValueError:
+        return 0
+
+class HeavyHitterTracker:
+    """
+    Track the top-K values of a request attribute by request count.
+
+    The key is one of:
+
+    - ``"client_ip"``: the client address of the connection
+    - ``"header:<name>"``: a request header, e.g. ``"header:X-API-Key"``
+    - ``"path_param:<name>"``: a path parameter of the matched route
+    - a callable taking the request and returning the key or None
+
+    Requests without a key are not counted. Bytes are the request and response
+    Content-Length, so bodies without one (e.g. streaming responses) count as 0.
+
+    Args:
+        name: Name of the tracker, used as the ``tracker`` metric label
+        key: Request attribute to key the summary by
+        top_k: Number of keys exported as metrics
+        capacity: Number of keys tracked, at least top_k; larger values make
+            the counts of the top-K more accurate
+        hash_keys: Export a hash of the key instead of the key itself, e.g.
+            for API keys. Defaults to True for header keys
+        window: If set, the summary is cleared every window seconds so it
+            reflects recent traffic rather than everything since startup
+        clock: Time source, defaults to time.monotonic
+    """
+
+    def __init__(
+        self,
+        name: str,
+        key: Union[str, Callable[[Request], Optional[str]]],
+        top_k: int = 10,
+        capacity: int = 100,
+        hash_keys: Optional[bool] = None,
+        window: Optional[float] = None,
+        clock: Optional[Callable[[], float]] = None,
+    ):
+        self.name = name
+        self.top_k = top_k
+        self.window = window
+        self.clock = clock or time.monotonic
+        self.get_key = self._compile_key(key)
+        if hash_keys is None:
+            hash_keys = isinstance(key, str) and key.startswith("header:")
+        self.hash_keys = hash_keys
+        self.summary = SpaceSaving(max(capacity, top_k))
+        self._window_start = self.clock()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _compile_key(key) -> Callable[[Request], Optional[str]]:
+        if callable(key):
+            return key
+        if key == "client_ip":
+            return lambda request: request.client.host if request.client else None
+        kind, _, name = key.partition(":")
+        if kind == "header" and name:
+            return lambda request: request.headers.get(name)
+        if kind == "path_param" and name:
+            return lambda request: request.path_params.get(name)
+        raise ValueError(f"Unsupported heavy hitter key: {key!r}")
+
+    def record(self, key: str, size: int = 0, duration: float = 0.0):
+        """Count one request for key"""
+        if self.hash_keys:
+            key = hashlib.sha256(key.encode()).hexdigest()[:16]
+        with self._lock:
+            if self.window is not None:
+                now = self.clock()
+                if now - self._window_start >= self.window:
+                    self.summary.clear()
+                    self._window_start = now
+            self.summary.add(key, size, duration)
+
+    def record_request(self, request: Request, response: Optional[Response], duration: float):
+        """Count a finished request by its key"""
+        key = self.get_key(request)
+        if key is None:
+            return
+        size = _content_length(request.headers)
+        if response is not None:
+            size += _content_length(response.headers)
+        self.record(str(key), size, duration)
+
+    def top(self) -> List[dict]:
+        """Get the current top-K keys with request count, error bound, bytes and duration sum"""
+        with self._lock:
+            return self.summary.top(self.top_k)
@@ -0,0 +1,207 @@
+"""
+Pooled, instrumented HTTPX clients for outgoing requests.
+
+Creating an ``httpx.AsyncClient`` per request pays TCP (and TLS) setup on every
+call. ``HTTPClientPool`` hands out named clients that live for the lifespan of
+the application and share their connection pool across requests. Each client
+uses an instrumenting transport instead of the global HTTPX instrumentation:
+it starts a client span, injects the trace context into the request headers
+and records per-peer latency, connection pool wait time and new connections.
+The global instrumentation is suppressed for these requests, so each one gets
+a single client span even when ``instrument_httpx()`` is in effect.
+"""
+import time
+from typing import Any, Callable, Dict, Optional, Tuple, TYPE_CHECKING
+import httpx
+
+if TYPE_CHECKING:
+    from .metrics import FastAPIObservabilityMetrics
+
+# Keyword arguments of httpx.AsyncClient that configure the transport. They
+# are ignored by AsyncClient when a transport is passed, so they are handed
+# to the pooled transport instead.
+_TRANSPORT_ARGUMENTS = ("verify", "cert", "trust_env", "http1", "http2", "limits", "retries")
+
+def get_peer(url: httpx.URL) -> str:
+    """Get the host:port a request is sent to"""
+    port = url.port or {"http": 80, "https": 443}.get(url.scheme)
+    return f"{url.host}:{port}"
+
+class InstrumentedTransport(httpx.AsyncBaseTransport):
+    """
+    Transport that traces and measures requests sent through a pooled transport.
+
+    Pool wait time and new connections are taken from the httpcore ``trace``
+    request extension: the wait ends with the first connection event of the
+    request, either opening a new connection or sending on a reused one.
+
+    Args:
+        transport: Transport owning the connection pool
+        name: Name of the client, used as the ``client`` metric label
+        tracer: Optional OpenTelemetry tracer for client spans
+        metrics: Optional metrics to record requests in
+    """
+
+    def __init__(
+        self,
+        transport: httpx.AsyncBaseTransport,
+        name: str = "default",
+        tracer=None,
+        metrics: Optional["FastAPIObservabilityMetrics"] = None,
+    ):
+        self.transport = transport
+        self.name = name
+        self.tracer = tracer
+        self.metrics = metrics
+
+    def pool_connections(self) -> Tuple[int, int]:
+        """Get the number of active and idle connections in the pool"""
+        pool = getattr(self.transport, "_pool", None)
+        if pool is None:
+            return 0, 0
+        active = idle = 0
+        for connection in pool.connections:
+            if connection.is_closed():
+                continue
+            if connection.is_idle():
+                idle += 1
+            else:
+                active += 1
+        return active, idle
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        peer = get_peer(request.url)
+        start_time = time.perf_counter()
+        timing: Dict[str, Any] = {"pool_wait": None, "connections_created": 0}
+        parent_trace = request.extensions.get("trace")
+
+        async def trace(event_name: str, info: Dict[str, Any]):
+            if timing["pool_wait"] is None and event_name.endswith(".started"):
+                timing["pool_wait"] = time.perf_counter() - start_time
+            if event_name == "connection.connect_tcp.complete":
+                timing["connections_created"] += 1
+            if parent_trace is not None:
+                await parent_trace(event_name, info)
+
+        request.extensions["trace"] = trace
+
+        if self.tracer is None:
+            return await self._send(request, peer, start_time, timing)
+
+        from opentelemetry import propagate
+        from opentelemetry.instrumentation.utils import suppress_http_instrumentation
+        from opentelemetry.trace import SpanKind, Status, StatusCode
+
+        with self.tracer.start_as_current_span(
+            request.method,
+            kind=SpanKind.CLIENT,
+            record_exception=True,
+            attributes={
+                "http.request.method": request.method,
+                "url.full": str(request.url),
+                "server.address": request.url.host,
+                "server.port": int(peer.rsplit(":", 1)[1]),
+                "http.client.name": self.name,
+            },
+        ) as span:
+            propagate.inject(request.headers)
+            # The pooled transport may be patched by HTTPXClientInstrumentor,
+            # which would start a second client span
+            with suppress_http_instrumentation():
+                response = await self._send(request, peer, start_time, timing)
+            span.set_attribute("http.response.status_code", response.status_code)
+            if timing["pool_wait"] is not None:
+                span.set_attribute("http.client.pool_wait_seconds", timing["pool_wait"])
+            if response.status_code >= 400:
+                span.set_status(Status(StatusCode.ERROR))
+            return response
+
+    async def _send(self, request: httpx.Request, peer: str, start_time: float, timing: Dict[str, Any]) -> httpx.Response:
+        status = "error"
+        try:
+            response = await self.transport.handle_async_request(request)
+            status = str(response.status_code)
+            return response
+        finally:
+            # Latency until the response headers arrived; the body is streamed afterwards
+            if self.metrics:
+                self.metrics.record_http_client_request(
+                    client=self.name,
+                    method=request.method,
+                    peer=peer,
+                    status=status,
+                    duration=time.perf_counter() - start_time,
+                    pool_wait=timing["pool_wait"],
+                    connections_created=timing["connections_created"],
+                )
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+class HTTPClientPool:
+    """
+    Named, pooled HTTPX clients for the lifespan of an application.
+
+    Clients are created on first use and closed by ``aclose()``, which
+    FastAPIObservability calls on lifespan shutdown. A client requested again
+    after that is created anew, e.g. in the next lifespan of a test client.
+
+    Args:
+        tracer_provider: Optional tracer provider for client spans
+        metrics: Optional metrics to record requests and pool usage in
+        transport_factory: Callable creating the pooled transport from the
+            transport keyword arguments, defaults to httpx.AsyncHTTPTransport
+    """
+
+    def __init__(
+        self,
+        tracer_provider=None,
+        metrics: Optional["FastAPIObservabilityMetrics"] = None,
+        transport_factory: Optional[Callable[..., httpx.AsyncBaseTransport]] = None,
+    ):
+        self.tracer = tracer_provider.get_tracer(__name__) if tracer_provider is not None else None
+        self.metrics = metrics
+        self.transport_factory = transport_factory or httpx.AsyncHTTPTransport
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._transports: Dict[str, InstrumentedTransport] = {}
+
+        if metrics:
+            metrics.track_http_client_pools(lambda: list(self._transports.values()))
+
+    def get(self, name: str = "default", **client_kwargs) -> httpx.AsyncClient:
+        """Get the client with the given name, creating it on first use
+
+        Args:
+            name: Name of the client, e.g. the downstream service it calls
+            **client_kwargs: Arguments for httpx.AsyncClient, used only when the
+                client is created (e.g. base_url, timeout, limits, http2)
+
+        Returns:
+            The pooled HTTPX client
+        """
+        client = self._clients.get(name)
+        if client is not None and not client.is_closed:
+            return client
+
+        transport_kwargs = {
+            key: client_kwargs.pop(key)
+            for key in _TRANSPORT_ARGUMENTS
+            if key in client_kwargs
+        }
+        transport = InstrumentedTransport(
+            self.transport_factory(**transport_kwargs),
+            name=name,
+            tracer=self.tracer,
+            metrics=self.metrics,
+        )
+        client = httpx.AsyncClient(transport=transport, **client_kwargs)
+        self._clients[name] = client
+        self._transports[name] = transport
+        return client
+
+    async def aclose(self):
+        """Close all clients and their connection pools"""
+        clients, self._clients = self._clients, {}
+        self._transports = {}
+        for client in clients.values():
+            await client.aclose()
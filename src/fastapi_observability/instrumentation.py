@@ -1,15 +1,224 @@
+import os
+import threading
+import time
+import weakref
+from typing import Dict, Optional, Tuple, Union
 from opentelemetry import trace
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+from opentelemetry.sdk.trace import TracerProvider, SpanProcessor
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter, SimpleSpanProcessor
 from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
 from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
 from opentelemetry.instrumentation.requests import RequestsInstrumentor
 from opentelemetry.instrumentation.httpx import HTTPXClientInstrumentor
 from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import sampling
+from opentelemetry.sdk.trace.sampling import Decision, Sampler, SamplingResult
 from opentelemetry.semconv.resource import ResourceAttributes
+from opentelemetry.trace import SpanKind
 
-def setup_telemetry(service_name: str, otlp_endpoint: str = "http://localhost:4317"):
-    """Setup OpenTelemetry instrumentation for FastAPI"""
+from .attributes import SpanAttributePolicy, SpanLimitAccounting
+
+class RuntimeSampler(Sampler):
+    """
+    Sampler following the runtime settings and route policies.
+    
+    The FastAPI instrumentation resolves the route before starting the server
+    span and passes it as the ``http.route`` attribute, so per-route decisions
+    are a lookup of the compiled policy by route path. Server spans of routes
+    whose policy disables tracing are dropped, and routes with a policy
+    ``sample_ratio`` are sampled at that ratio regardless of the parent's
+    decision. Other spans are sampled at the runtime ``sample_ratio`` if one
+    is set, else by the delegate. Spans within a request follow the decision
+    for its server span through their parent.
+    
+    Args:
+        runtime: Runtime settings of the application
+        delegate: Default sampler, defaults to the sampler configured by
+            OTEL_TRACES_SAMPLER (parent-based always-on if unset)
+    """
+    
+    def __init__(self, runtime, delegate: Optional[Sampler] = None):
+        self.runtime = runtime
+        self.delegate = delegate or sampling._get_from_env_or_default()
+        # Ratio samplers by (ratio, parent-based); built once per ratio in use
+        self._ratio_samplers: Dict[Tuple[float, bool], Sampler] = {}
+    
+    def _ratio_sampler(self, ratio: float, parent_based: bool) -> Sampler:
+        sampler = self._ratio_samplers.get((ratio, parent_based))
+        if sampler is None:
+            if len(self._ratio_samplers) >= 64:
+                self._ratio_samplers.clear()
+            sampler = sampling.TraceIdRatioBased(ratio)
+            if parent_based:
+                sampler = sampling.ParentBased(sampler)
+            self._ratio_samplers[(ratio, parent_based)] = sampler
+        return sampler
+    
+    def should_sample(self, parent_context, trace_id, name, kind=None, attributes=None, links=None, trace_state=None):
+        config = self.runtime.config
+        sampler = self.delegate
+        if config.sample_ratio is not None:
+            sampler = self._ratio_sampler(config.sample_ratio, parent_based=True)
+        if kind == SpanKind.SERVER and attributes:
+            route = attributes.get("http.route")
+            if route is not None:
+                policy = config.route_policies.for_path(route)
+                if not policy.tracing:
+                    return SamplingResult(Decision.DROP)
+                if policy.sample_ratio is not None:
+                    sampler = self._ratio_sampler(policy.sample_ratio, parent_based=False)
+        return sampler.should_sample(
+            parent_context, trace_id, name, kind=kind, attributes=attributes, links=links, trace_state=trace_state
+        )
+    
+    def get_description(self):
+        return f"RuntimeSampler{{{self.delegate.get_description()}}}"
+
+class ForkSafeSpanProcessor(SpanProcessor):
+    """
+    Span processor that owns the exporters of the current process.
+    
+    Exporters are created by ``start()`` rather than at construction, so a
+    preloading server (e.g. gunicorn ``--preload``) can set up tracing in the
+    master and start the exporter threads and gRPC channels in each worker after
+    the fork. Processors inherited across a fork are discarded in the child;
+    their threads do not exist there and their channels are unusable. Spans that
+    end while no exporters are running are dropped.
+    """
+    
+    def __init__(self, processor_factory):
+        self._processor_factory = processor_factory
+        self._processors = ()
+        self._pid = None
+        
+        if hasattr(os, "register_at_fork"):
+            processor_ref = weakref.ref(self)
+            
+            def _after_in_child():
+                processor = processor_ref()
+                if processor is not None:
+                    processor._processors = ()
+                    processor._pid = None
+                    
+            os.register_at_fork(after_in_child=_after_in_child)
+    
+    @property
+    def processors(self):
+        """Span processors running in the current process"""
+        return self._processors if self.started else ()
+    
+    @property
+    def started(self) -> bool:
+        """Whether exporters are running in the current process"""
+        return self._pid == os.getpid()
+    
+    def start(self):
+        """Create the span processors for the current process if not already running"""
+        if self.started:
+            return
+        self._processors = tuple(self._processor_factory())
+        self._pid = os.getpid()
+    
+    def on_start(self, span, parent_context=None):
+        for processor in self._processors:
+            processor.on_start(span, parent_context=parent_context)
+    
+    def on_end(self, span):
+        for processor in self._processors:
+            processor.on_end(span)
+    
+    def shutdown(self):
+        processors, self._processors, self._pid = self._processors, (), None
+        for processor in processors:
+            processor.shutdown()
+    
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        deadline = time.monotonic() + timeout_millis / 1000
+        for processor in self._processors:
+            remaining_millis = int((deadline - time.monotonic()) * 1000)
+            if remaining_millis <= 0 or not processor.force_flush(remaining_millis):
+                return False
+        return True
+
+def create_span_processors(
+    otlp_endpoint: str = "http://localhost:4317",
+    shared_exporter_socket: Optional[str] = None,
+    spool_dir: Optional[str] = None,
+    spool_max_bytes: int = 256 * 1024 * 1024,
+    span_exporters=None,
+):
+    """Create the OTLP and console span processors along with their exporters"""
+    if span_exporters is not None:
+        # Given exporters replace the OTLP and console exporters. Spans are
+        # exported as they end, so in-memory test exporters see them at once.
+        return [SimpleSpanProcessor(exporter) for exporter in span_exporters]
+    
+    console_processor = BatchSpanProcessor(ConsoleSpanExporter())
+    
+    if shared_exporter_socket:
+        # Hand spans to the per-host shared exporter process instead of
+        # opening a gRPC channel to the collector from every worker
+        from .shared_exporter import SharedSpanExporter
+        return [BatchSpanProcessor(SharedSpanExporter(shared_exporter_socket)), console_processor]
+    
+    if spool_dir:
+        # Spool spans to disk while the collector is unavailable
+        from .spool import create_spooling_processor
+        return [create_spooling_processor(otlp_endpoint, spool_dir, max_bytes=spool_max_bytes), console_processor]
+    
+    # Create an OTLP exporter
+    otlp_exporter = OTLPSpanExporter(endpoint=otlp_endpoint)
+    otlp_processor = BatchSpanProcessor(otlp_exporter)
+    
+    return [otlp_processor, console_processor]
+
+def setup_telemetry(
+    service_name: str,
+    otlp_endpoint: str = "http://localhost:4317",
+    start_exporters: bool = True,
+    shared_exporter_socket: Optional[str] = None,
+    spool_dir: Optional[str] = None,
+    spool_max_bytes: int = 256 * 1024 * 1024,
+    sampler: Optional[Sampler] = None,
+    span_exporters=None,
+    attribute_policy: Optional[SpanAttributePolicy] = None,
+    capture_headers: bool = False,
+    enable_httpx_instrumentation: bool = True,
+):
+    """Setup OpenTelemetry instrumentation for FastAPI
+    
+    Args:
+        service_name: Name of the service reported in the trace resource
+        otlp_endpoint: OTLP gRPC endpoint to export spans to
+        start_exporters: Whether to start the exporters immediately. When False,
+            call ``start()`` on the returned provider's ``fork_safe_processor``
+            in each worker process.
+        shared_exporter_socket: Unix domain socket of a shared exporter process.
+            When set, spans are handed to it instead of being exported directly.
+        spool_dir: Directory for spooling spans to disk while the collector is
+            unavailable. Spooling is disabled when None. Cannot be combined
+            with ``shared_exporter_socket``; pass ``--spool-dir`` to the shared
+            exporter process instead.
+        spool_max_bytes: Maximum disk usage of the spool per process
+        sampler: Optional sampler, defaults to the SDK default sampler
+        span_exporters: Span exporters to use instead of the OTLP and console
+            exporters, e.g. an in-memory exporter in tests
+        attribute_policy: Header allowlist and attribute limits of all spans,
+            defaults to a SpanAttributePolicy with the default limits
+        capture_headers: Whether outgoing HTTPX requests capture the policy's
+            allowlisted headers
+        enable_httpx_instrumentation: Whether to instrument all HTTPX clients
+            globally. Pooled clients from ``HTTPClientPool`` are traced by
+            their own transport either way.
+    
+    Returns:
+        The configured tracer provider
+
+    Raises:
+        ValueError: If both ``shared_exporter_socket`` and ``spool_dir`` are set
+    """
+    if shared_exporter_socket and spool_dir:
+        raise ValueError("spool_dir cannot be combined with shared_exporter_socket, pass --spool-dir to the shared exporter instead")
     
     # Create a resource with service name
     resource = Resource.create({
@@ -17,75 +226,151 @@ def setup_telemetry(service_name: str, otlp_endpoint: str = "http://localhost:43
         ResourceAttributes.SERVICE_NAMESPACE: "fastapi-observability",
     })
     
-    # Create a tracer provider
-    tracer_provider = TracerProvider(resource=resource)
-    
-    # Create an OTLP exporter
-    otlp_exporter = OTLPSpanExporter(endpoint=otlp_endpoint)
-    
-    # Create span processors
-    otlp_processor = BatchSpanProcessor(otlp_exporter)
-    console_processor = BatchSpanProcessor(ConsoleSpanExporter())
+    # Create a tracer provider whose spans are bounded by the attribute policy
+    attribute_policy = attribute_policy or SpanAttributePolicy()
+    tracer_provider = TracerProvider(resource=resource, sampler=sampler, span_limits=attribute_policy.span_limits())
+    tracer_provider.attribute_policy = attribute_policy  # type: ignore[attr-defined]
+    tracer_provider.add_span_processor(SpanLimitAccounting(attribute_policy))
     
-    # Add the span processors to the tracer provider
-    tracer_provider.add_span_processor(otlp_processor)
-    tracer_provider.add_span_processor(console_processor)
+    # Add the span processors to the tracer provider. Their exporters are
+    # owned by a fork-safe processor so they can be started per worker.
+    fork_safe_processor = ForkSafeSpanProcessor(
+        lambda: create_span_processors(otlp_endpoint, shared_exporter_socket, spool_dir, spool_max_bytes, span_exporters)
+    )
+    tracer_provider.add_span_processor(fork_safe_processor)
+    tracer_provider.fork_safe_processor = fork_safe_processor  # type: ignore[attr-defined]
+    if start_exporters:
+        fork_safe_processor.start()
     
     # Set the tracer provider
     trace.set_tracer_provider(tracer_provider)
     
     # Instrument common HTTP libraries
     RequestsInstrumentor().instrument()
-    instrument_httpx(tracer_provider=tracer_provider)
+    if enable_httpx_instrumentation:
+        instrument_httpx(tracer_provider=tracer_provider, capture_headers=capture_headers)
     
     return tracer_provider
 
-def instrument_fastapi(app, tracer_provider=None, excluded_urls="health,metrics"):
-    """Instrument FastAPI application with OpenTelemetry"""
+def shutdown_telemetry(tracer_provider, timeout: float = 5.0) -> bool:
+    """Flush pending spans and stop the exporters of the current process
+    
+    Args:
+        tracer_provider: Tracer provider returned by ``setup_telemetry``
+        timeout: Deadline in seconds for flushing and shutting down the exporters
+    
+    Returns:
+        True if all spans were flushed and the exporters stopped within the deadline
+    """
+    processor = getattr(tracer_provider, "fork_safe_processor", None)
+    if processor is None or not processor.started:
+        return True
+    
+    result = {}
+    
+    def _flush_and_shutdown():
+        result["flushed"] = processor.force_flush(int(timeout * 1000))
+        processor.shutdown()
+    
+    # Exporters may block on an unreachable collector, so run them in a daemon
+    # thread and stop waiting once the deadline has passed.
+    thread = threading.Thread(target=_flush_and_shutdown, name="otel-shutdown", daemon=True)
+    thread.start()
+    thread.join(timeout)
+    return not thread.is_alive() and result.get("flushed", False)
+
+def instrument_fastapi(app, tracer_provider=None, excluded_urls="health,metrics", attribute_policy=None, capture_headers=False):
+    """Instrument FastAPI application with OpenTelemetry
+    
+    Args:
+        app: FastAPI application
+        tracer_provider: Optional tracer provider
+        excluded_urls: Comma-separated URLs not to trace
+        attribute_policy: SpanAttributePolicy bounding the attributes added
+            to server spans, defaults to the tracer provider's
+        capture_headers: Whether to add the policy's allowlisted request
+            headers to server spans
+    """
     # Check if the app is already instrumented
     if not hasattr(app, "_is_instrumented"):
+        policy = _attribute_policy(tracer_provider, attribute_policy)
         FastAPIInstrumentor.instrument_app(
             app,
             tracer_provider=tracer_provider,
             excluded_urls=excluded_urls,
+            server_request_hook=lambda span, scope: _server_request_hook(span, scope, policy, capture_headers),
         )
         # Mark the app as instrumented
         setattr(app, "_is_instrumented", True)
 
-def instrument_httpx(tracer_provider=None, capture_headers=False, request_hook=None, response_hook=None):
+def instrument_httpx(tracer_provider=None, capture_headers=False, request_hook=None, response_hook=None, attribute_policy=None):
     """Instrument HTTPX client with OpenTelemetry
     
+    Instrumenting again replaces the hooks and header capture of an earlier call.
+    
     Args:
         tracer_provider: Optional tracer provider
-        capture_headers: Whether to capture HTTP headers as span attributes
+        capture_headers: Whether to capture the policy's allowlisted HTTP
+            headers as span attributes
         request_hook: Optional callback function called before the request is sent
-        response_hook: Optional callback function called after the response is received
+        response_hook: Optional callback function called after the response
+            is received, replacing the default one
+        attribute_policy: SpanAttributePolicy bounding the attributes added
+            to client spans, defaults to the tracer provider's
     """
-    # Use default response hook if none provided
-    if response_hook is None:
-        response_hook = _client_response_hook
-        
-    return HTTPXClientInstrumentor().instrument(
+    policy = _attribute_policy(tracer_provider, attribute_policy)
+
+    def default_response_hook(span, request, response):
+        _client_response_hook(span, request, response, policy, capture_headers)
+
+    async def default_async_response_hook(span, request, response):
+        _client_response_hook(span, request, response, policy, capture_headers)
+    
+    instrumentor = HTTPXClientInstrumentor()
+    if instrumentor.is_instrumented_by_opentelemetry:
+        instrumentor.uninstrument()
+    # Use the default response hooks if none provided
+    return instrumentor.instrument(
         tracer_provider=tracer_provider,
-        capture_headers=capture_headers,
         request_hook=request_hook,
-        response_hook=response_hook,
+        response_hook=response_hook if response_hook is not None else default_response_hook,
+        async_response_hook=default_async_response_hook if response_hook is None else None,
     )
 
-def _server_request_hook(span, scope):
-    """Hook for adding custom attributes to server spans"""
-    if span and scope:
-        span.set_attribute("http.method", scope.get("method", ""))
-        span.set_attribute("http.route", scope.get("path", ""))
-        query_string = scope.get("query_string", b"").decode("utf-8")
-        if query_string:
-            span.set_attribute("http.query_string", query_string)
+def _attribute_policy(tracer_provider, attribute_policy):
+    if attribute_policy is not None:
+        return attribute_policy
+    return getattr(tracer_provider, "attribute_policy", None) or SpanAttributePolicy()
+
+def _server_request_hook(span, scope, policy: SpanAttributePolicy, capture_headers: bool = False):
+    """Hook adding the query string and allowlisted headers to server spans in one call"""
+    if not span or not span.is_recording() or not scope:
+        return
+    attributes: Dict[str, Union[str, Tuple[str, ...]]] = {}
+    query_string = scope.get("query_string", b"")
+    if query_string:
+        attributes["http.query_string"] = policy.truncate(query_string.decode("latin-1"))
+    if capture_headers:
+        attributes.update(policy.asgi_request_headers(scope.get("headers", ())))
+    if attributes:
+        span.set_attributes(attributes)
 
-def _client_response_hook(span, response):
-    """Hook for adding custom attributes to client spans"""
-    if span and response:
-        span.set_attribute("http.status_code", response.status_code)
-        span.set_attribute("http.response_content_length", len(response.content) if hasattr(response, "content") else 0)
+def _client_response_hook(span, request, response, policy: SpanAttributePolicy, capture_headers: bool = False):
+    """Hook adding status, size, peer service and allowlisted headers to client spans in one call"""
+    if not span or not span.is_recording() or response is None:
+        return
+    attributes = {"http.status_code": response.status_code}
+    headers = response.headers
+    if headers is not None:
+        # The body may not have been read yet, so the size is only known from the header
+        content_length = headers.get("content-length")
+        if content_length and content_length.isdigit():
+            attributes["http.response_content_length"] = int(content_length)
         # Add service name from response headers if available
-        if hasattr(response, "headers") and "x-service-name" in response.headers:
-            span.set_attribute("peer.service", response.headers["x-service-name"]) 
\ No newline at end of file
+        peer_service = headers.get("x-service-name")
+        if peer_service:
+            attributes["peer.service"] = policy.truncate(peer_service)
+    if capture_headers:
+        attributes.update(policy.http_headers(request.headers))
+        attributes.update(policy.http_headers(headers, response=True))
+    span.set_attributes(attributes)
@@ -1,11 +1,32 @@
 import structlog
+import functools
 import logging
+import os
 import sys
-from opentelemetry import trace
-from opentelemetry.trace import Status, StatusCode
-from typing import Optional, Dict, Any
+import threading
+import time
+from typing import Optional, Dict, Any, Callable, List, Union, TYPE_CHECKING
 import traceback
 
+from .runtime import RuntimeConfig, RuntimeSettings
+from .trace_context import get_current_span_context, get_trace_context
+
+if TYPE_CHECKING:
+    from .errors import ErrorOccurrence
+
+# Levels of the structlog logger methods
+_METHOD_LEVELS = {
+    "debug": logging.DEBUG,
+    "info": logging.INFO,
+    "msg": logging.INFO,
+    "warning": logging.WARNING,
+    "warn": logging.WARNING,
+    "error": logging.ERROR,
+    "exception": logging.ERROR,
+    "critical": logging.CRITICAL,
+    "fatal": logging.CRITICAL,
+}
+
 def custom_renderer(_, __, event_dict):
     """
     Custom log formatter that outputs a minimal single-line log format.
@@ -34,42 +55,307 @@ def custom_renderer(_, __, event_dict):
     if message:
         output += f" - {message}"
     
+    # Traceback rendered by format_exc_info
+    exception = event_dict.pop("exception", None)
+    if exception:
+        output += f"\n{exception}"
+    
     return output
 
+class TraceContextProcessor:
+    """
+    Structlog processor adding the IDs of the active OpenTelemetry span to each event.
+
+    The span context is read when an event is processed, so loggers created
+    once at import time still log the trace of the current request. Level
+    filtering happens before processors run, so filtered events cost nothing.
+    The hex-formatted IDs are cached per span, since a span usually logs more
+    than once. IDs bound explicitly on the logger take precedence.
+
+    Args:
+        max_cached_spans: Number of spans to cache formatted IDs for
+    """
+
+    def __init__(self, max_cached_spans: int = 1024):
+        self.max_cached_spans = max_cached_spans
+        self._cache: Dict[int, tuple] = {}
+
+    def __call__(self, _, __, event_dict):
+        if "trace_id" in event_dict:
+            return event_dict
+
+        span_context = get_current_span_context()
+        if span_context is None:
+            return event_dict
+
+        ids = self._cache.get(span_context.span_id)
+        if ids is None or ids[0] != span_context.trace_id:
+            if len(self._cache) >= self.max_cached_spans:
+                self._cache.clear()
+            ids = (
+                span_context.trace_id,
+                format(span_context.trace_id, "032x"),
+                format(span_context.span_id, "016x"),
+            )
+            self._cache[span_context.span_id] = ids
+
+        event_dict["trace_id"] = ids[1]
+        event_dict["span_id"] = ids[2]
+        return event_dict
+
+class SinkRenderer:
+    """
+    Structlog processor passing events to a callable instead of rendering them.
+
+    Used in place of the renderer when a log sink is configured; the event
+    dict is handed over after all other processors ran, and nothing is written.
+    """
+
+    def __init__(self, sink: Callable[[Dict[str, Any]], None]):
+        self.sink = sink
+
+    def __call__(self, _, __, event_dict):
+        self.sink(event_dict)
+        return ""
+
+class SinkHandler(logging.Handler):
+    """Handler formatting records only for the SinkRenderer of its formatter"""
+
+    def emit(self, record):
+        try:
+            self.format(record)
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+def make_runtime_filtering_bound_logger(runtime: RuntimeSettings) -> type:
+    """
+    Create a structlog bound logger class filtering on the runtime log level.
+
+    ``structlog.make_filtering_bound_logger`` fixes the level when the class
+    is created, and loggers cached on first use keep it. The level methods of
+    this class instead compare against the level of the current runtime
+    config snapshot, before any event dict is built, so filtered events
+    return immediately and level changes apply to loggers already cached.
+
+    Args:
+        runtime: Runtime settings holding the log level
+    """
+    base = structlog.make_filtering_bound_logger(logging.NOTSET)
+
+    def make_method(method, level: int):
+        @functools.wraps(method)
+        def filtered(self, event=None, *args, **kw):
+            if level < runtime.config.log_level:
+                return None
+            return method(self, event, *args, **kw)
+        return filtered
+
+    def make_async_method(method, level: int):
+        @functools.wraps(method)
+        async def filtered(self, event=None, *args, **kw):
+            if level < runtime.config.log_level:
+                return None
+            return await method(self, event, *args, **kw)
+        return filtered
+
+    def log(self, level: int, event=None, *args, **kw):
+        if level < runtime.config.log_level:
+            return None
+        return base.log(self, level, event, *args, **kw)
+
+    methods: Dict[str, Callable] = {"log": log}
+    for name, level in _METHOD_LEVELS.items():
+        methods[name] = make_method(getattr(base, name), level)
+        # Async variants exist from structlog 22.2
+        async_method = getattr(base, f"a{name}", None)
+        if async_method is not None:
+            methods[f"a{name}"] = make_async_method(async_method, level)
+    return type("RuntimeFilteringBoundLogger", (base,), methods)
+
+class BufferedStreamHandler(logging.StreamHandler):
+    """
+    Stream handler that leaves flushing to a background thread.
+
+    Records are written to the stream under the handler lock, so lines of
+    different threads never interleave, but the stream is only flushed every
+    ``flush_interval`` seconds or when a record of ``flush_level`` or above is
+    written. The flush thread is started lazily in each process.
+    """
+
+    def __init__(self, stream=None, flush_interval: float = 1.0, flush_level: int = logging.WARNING):
+        super().__init__(stream)
+        self.flush_interval = flush_interval
+        self.flush_level = flush_level
+        self._dirty = False
+        self._flusher_pid = None
+
+    def emit(self, record):
+        try:
+            self.stream.write(self.format(record) + self.terminator)
+            if record.levelno >= self.flush_level:
+                self.stream.flush()
+                self._dirty = False
+            else:
+                self._dirty = True
+                if self._flusher_pid != os.getpid():
+                    self._start_flusher()
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def _start_flusher(self):
+        self._flusher_pid = os.getpid()
+        thread = threading.Thread(target=self._flush_loop, name="log-flusher", daemon=True)
+        thread.start()
+
+    def _flush_loop(self):
+        pid = os.getpid()
+        while self._flusher_pid == pid:
+            time.sleep(self.flush_interval)
+            if self._dirty:
+                self.flush()
+
+    def flush(self):
+        self.acquire()
+        try:
+            self._dirty = False
+            if self.stream and hasattr(self.stream, "flush"):
+                self.stream.flush()
+        finally:
+            self.release()
+
+# Loggers that servers configure with their own handlers
+_SERVER_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access", "gunicorn", "gunicorn.error", "gunicorn.access")
+
 class FastAPIObservabilityLogger:
-    def __init__(self, service_name: str, disable_default_loggers: bool = False):
+    def __init__(
+        self,
+        service_name: str,
+        disable_default_loggers: bool = False,
+        unified_logging: bool = False,
+        logger_levels: Optional[Dict[str, Union[int, str]]] = None,
+        runtime: Optional[RuntimeSettings] = None,
+        log_sink: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ):
         self.service_name = service_name
+        # The log level can be changed at runtime through these settings
+        self.runtime = runtime or RuntimeSettings()
+        self.runtime.add_listener(self._apply_log_level)
+        self.unified_logging = unified_logging
+        self.logger_levels = logger_levels or {}
+        self.disable_default_loggers = disable_default_loggers
         
-        # Configure logging with minimal format
-        logging.basicConfig(
-            format="%(message)s",
-            stream=sys.stdout,
-            level=logging.INFO,
-        )
+        # Processors shared by structlog events and, in unified mode, stdlib records
+        shared_processors: List[structlog.types.Processor] = [
+            structlog.contextvars.merge_contextvars,
+            structlog.processors.add_log_level,
+            TraceContextProcessor(),
+            # Simple timestamp without milliseconds
+            structlog.processors.TimeStamper(fmt="%Y-%m-%d %H:%M:%S"),
+            structlog.processors.format_exc_info,
+        ]
         
-        # Set root logger to INFO level
-        logging.getLogger().setLevel(logging.INFO)
+        # A log sink receives event dicts instead of rendered lines on stdout
+        renderer = SinkRenderer(log_sink) if log_sink is not None else custom_renderer
         
-        # Disable default loggers if requested
-        if disable_default_loggers:
-            self._disable_default_loggers()
+        self.handler = None
+        if unified_logging:
+            # One handler renders stdlib records and structlog events alike
+            self.handler = SinkHandler() if log_sink is not None else BufferedStreamHandler(sys.stdout)
+            self.handler.setFormatter(structlog.stdlib.ProcessorFormatter(
+                foreign_pre_chain=shared_processors,
+                processors=[
+                    structlog.stdlib.ProcessorFormatter.remove_processors_meta,
+                    renderer
+                ]
+            ))
+            self.configure_stdlib_logging()
+        else:
+            # Configure logging with minimal format
+            logging.basicConfig(
+                format="%(message)s",
+                stream=sys.stdout,
+                level=self.runtime.config.log_level,
+            )
+            
+            # Set root logger to the configured level
+            logging.getLogger().setLevel(self.runtime.config.log_level)
+            
+            # Disable default loggers if requested
+            if disable_default_loggers:
+                self._disable_default_loggers()
+            self._apply_logger_levels()
             
         # Configure structlog with minimal format
+        # The bound logger filters on the runtime log level, so a level change
+        # applies to loggers that were already created and cached
         structlog.configure(
-            processors=[
-                structlog.contextvars.merge_contextvars,
-                structlog.processors.add_log_level,
-                # Simple timestamp without milliseconds
-                structlog.processors.TimeStamper(fmt="%Y-%m-%d %H:%M:%S"),
-                custom_renderer
+            processors=shared_processors + [
+                structlog.stdlib.ProcessorFormatter.wrap_for_formatter if unified_logging else renderer
             ],
-            wrapper_class=structlog.make_filtering_bound_logger(logging.INFO),
+            wrapper_class=make_runtime_filtering_bound_logger(self.runtime),
             context_class=dict,
-            logger_factory=structlog.PrintLoggerFactory(),
+            logger_factory=self._logger_factory(unified_logging, log_sink),
             cache_logger_on_first_use=True
         )
         
         self.logger = structlog.get_logger()
+        self.service_logger = structlog.get_logger(service=self.service_name)
+    
+    @staticmethod
+    def _logger_factory(unified_logging: bool, log_sink):
+        if unified_logging:
+            return structlog.stdlib.LoggerFactory()
+        if log_sink is not None:
+            # The sink already received the event; discard the empty line
+            return structlog.ReturnLoggerFactory()
+        return structlog.PrintLoggerFactory()
+    
+    def configure_stdlib_logging(self):
+        """Route stdlib logging through the unified handler
+        
+        Replaces the root handlers and makes server loggers (uvicorn, gunicorn)
+        propagate to the root instead of writing through their own handlers.
+        Servers install those handlers when they start, after the application
+        was imported, so this runs again on lifespan startup. Does nothing
+        unless unified logging is enabled.
+        """
+        if not self.unified_logging:
+            return
+        
+        root = logging.getLogger()
+        root.handlers = [self.handler]
+        root.setLevel(self.runtime.config.log_level)
+        
+        for logger_name in _SERVER_LOGGERS:
+            server_logger = logging.getLogger(logger_name)
+            server_logger.handlers = []
+            server_logger.propagate = True
+        
+        if self.disable_default_loggers:
+            self._disable_default_loggers()
+        self._apply_logger_levels()
+    
+    def _apply_logger_levels(self):
+        """Set the configured per-logger levels
+        
+        Levels are checked by each logger before a record is created, so
+        records below them are never formatted.
+        """
+        for logger_name, level in self.logger_levels.items():
+            logging.getLogger(logger_name).setLevel(level.upper() if isinstance(level, str) else level)
+    
+    def _apply_log_level(self, config: RuntimeConfig):
+        """Apply a runtime log level change to stdlib logging"""
+        logging.getLogger().setLevel(config.log_level)
+    
+    def flush(self):
+        """Flush buffered log output"""
+        if self.handler is not None:
+            self.handler.flush()
     
     def _disable_default_loggers(self):
         """Disable default FastAPI/Uvicorn loggers"""
@@ -85,21 +371,26 @@ class FastAPIObservabilityLogger:
         logging.getLogger("httpx").setLevel(logging.WARNING)
 
     def get_logger(self):
-        """Get a logger instance with OpenTelemetry context"""
-        current_span = trace.get_current_span()
-        if current_span:
-            span_context = current_span.get_span_context()
-            if span_context.is_valid:
-                # Use trace.format_trace_id to get properly formatted trace ID
-                return self.logger.bind(
-                    trace_id=trace.format_trace_id(span_context.trace_id),
-                    span_id=trace.format_span_id(span_context.span_id),
-                    service=self.service_name
-                )
-        return self.logger.bind(service=self.service_name)
+        """Get a logger instance bound to the service
+
+        Trace and span IDs of the active span are added to each event when it
+        is logged, so the logger can be created once and reused.
+        """
+        return self.service_logger
+
+    def bind_request_context(self, **context):
+        """Clear any existing context variables and bind the ones for a new request"""
+        structlog.contextvars.clear_contextvars()
+        structlog.contextvars.bind_contextvars(**context)
 
     def log_request(self, request, response, context=None):
-        """Log HTTP request with minimal information"""
+        """Log HTTP request with minimal information
+        
+        ``response`` is None if the application raised; the request is then
+        logged with status 500, as returned by the server error handler.
+        """
+        status_code = response.status_code if response is not None else 500
+        
         # Get client information
         if request.client:
             client_host = request.client.host
@@ -113,21 +404,55 @@ class FastAPIObservabilityLogger:
         
         # Log with minimal format
         self.logger.info(
-            f"{client_host}:{client_port} - \"{request.method} {request.url.path} HTTP/{http_version}\" {response.status_code}",
+            f"{client_host}:{client_port} - \"{request.method} {request.url.path} HTTP/{http_version}\" {status_code}",
             http={
                 "url": str(request.url),
-                "status_code": response.status_code,
+                "status_code": status_code,
                 "method": request.method,
                 "version": http_version,
             },
             network={"client": {"ip": client_host, "port": client_port}},
         )
 
+    def log_websocket(self, scope, close_code: int, duration: float, messages: Dict[str, int], message_bytes: Dict[str, int]):
+        """Log a finished WebSocket connection with minimal information"""
+        client = scope.get("client") or ("unknown", "0")
+        path = scope.get("path", "")
+        
+        self.logger.info(
+            f"{client[0]}:{client[1]} - \"WEBSOCKET {path}\" {close_code} {duration:.3f}s",
+            websocket={
+                "path": path,
+                "close_code": close_code,
+                "duration": duration,
+                "messages": messages,
+                "bytes": message_bytes,
+            },
+            network={"client": {"ip": client[0], "port": client[1]}},
+        )
+
     def log_error(self, error: Exception, context: Optional[Dict[str, Any]] = None) -> None:
         """Log an error with minimal information"""
         error_msg = f"error {type(error).__name__}: {str(error)}"
         self.logger.error(error_msg)
 
+    def log_exception(self, error: Exception, occurrence: "ErrorOccurrence", context: Optional[Dict[str, Any]] = None) -> None:
+        """Log an unhandled exception, with its traceback only if the aggregator allows it"""
+        error_msg = f"error {type(error).__name__}: {str(error)} fingerprint={occurrence.fingerprint} count={occurrence.count}"
+        if occurrence.suppressed:
+            error_msg += f" ({occurrence.suppressed} tracebacks suppressed)"
+        
+        self.logger.error(
+            error_msg,
+            exc_info=error if occurrence.log_traceback else None,
+            error={
+                "type": type(error).__name__,
+                "fingerprint": occurrence.fingerprint,
+                "count": occurrence.count,
+                "location": occurrence.group.location,
+            },
+        )
+
     def _get_current_span_context(self) -> Dict[str, str]:
         """
         Get the current span context from OpenTelemetry.
@@ -135,14 +460,4 @@ class FastAPIObservabilityLogger:
         Returns:
             Dict containing trace_id and span_id if available
         """
-        span_context = {}
-        current_span = trace.get_current_span()
-        
-        if current_span:
-            ctx = current_span.get_span_context()
-            if ctx.is_valid:
-                # Use OpenTelemetry's formatters to get the trace and span IDs
-                span_context["trace_id"] = trace.format_trace_id(ctx.trace_id)
-                span_context["span_id"] = trace.format_span_id(ctx.span_id)
-                
-        return span_context 
\ No newline at end of file
+        return get_trace_context() 
\ No newline at end of file
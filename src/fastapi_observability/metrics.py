@@ -1,36 +1,455 @@
-from prometheus_client import Counter, Histogram, REGISTRY, CONTENT_TYPE_LATEST
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE_LATEST, CollectorRegistry
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, Metric
 from prometheus_client.openmetrics.exposition import generate_latest
 from fastapi import Response, Request
-from opentelemetry import trace
 import time
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Callable, Iterable, List, Set, Tuple, Union, TYPE_CHECKING
+
+from .trace_context import get_current_span_context
+
+if TYPE_CHECKING:
+    from .statsd import StatsDEmitter
+
+def _prefixed(namespace: str, name: str) -> str:
+    return f"{namespace}_{name}" if namespace else name
+
+class SpanSpoolCollector:
+    """Collect depth and replay counters of span spools at scrape time"""
+    
+    def __init__(self, get_spools: Callable[[], Iterable[Any]], namespace: str = ""):
+        self.get_spools = get_spools
+        self.namespace = namespace
+    
+    def collect(self):
+        spools = list(self.get_spools())
+        
+        gauges = (
+            ("otel_span_spool_bytes", "Disk usage of the span spool in bytes", "bytes"),
+            ("otel_span_spool_segments", "Number of span spool segment files", "segments"),
+            ("otel_span_spool_pending_payloads", "Export payloads waiting in the span spool", "pending_payloads"),
+            ("otel_span_spool_pending_spans", "Spans waiting in the span spool", "pending_spans"),
+        )
+        for name, documentation, attribute in gauges:
+            yield GaugeMetricFamily(
+                _prefixed(self.namespace, name), documentation,
+                value=sum(getattr(spool, attribute) for spool in spools)
+            )
+        
+        counters = (
+            ("otel_span_spool_spooled_spans", "Spans written to the span spool", "spooled_spans"),
+            ("otel_span_spool_replayed_spans", "Spans replayed from the span spool", "replayed_spans"),
+            ("otel_span_spool_dropped_spans", "Spans dropped from the span spool", "dropped_spans"),
+        )
+        for name, documentation, attribute in counters:
+            yield CounterMetricFamily(
+                _prefixed(self.namespace, name), documentation,
+                value=sum(getattr(spool, attribute) for spool in spools)
+            )
+
+class SpanAttributeCollector:
+    """Collect the counts of span attributes truncated or dropped by attribute policies at scrape time"""
+    
+    def __init__(self, get_policies: Callable[[], Iterable[Any]], namespace: str = ""):
+        self.get_policies = get_policies
+        self.namespace = namespace
+    
+    def collect(self):
+        policies = list(self.get_policies())
+        counters = (
+            ("otel_span_attribute_values_truncated", "Span attribute values truncated to the maximum length", "truncated_values"),
+            ("otel_span_attributes_dropped", "Span attributes dropped beyond the per-span limit", "dropped_attributes"),
+            ("otel_span_events_dropped", "Span events dropped beyond the per-span limit", "dropped_events"),
+            ("otel_span_links_dropped", "Span links dropped beyond the per-span limit", "dropped_links"),
+        )
+        for name, documentation, attribute in counters:
+            yield CounterMetricFamily(
+                _prefixed(self.namespace, name), documentation,
+                value=sum(getattr(policy, attribute) for policy in policies)
+            )
+
+class HTTPClientPoolCollector:
+    """Collect connection pool usage of pooled HTTP clients at scrape time"""
+    
+    def __init__(self, get_transports: Callable[[], Iterable[Any]], namespace: str = ""):
+        self.get_transports = get_transports
+        self.namespace = namespace
+    
+    def collect(self):
+        metric = GaugeMetricFamily(
+            _prefixed(self.namespace, "http_client_pool_connections"),
+            "Connections in the pool of pooled HTTP clients by state",
+            labels=["client", "state"]
+        )
+        for transport in self.get_transports():
+            active, idle = transport.pool_connections()
+            metric.add_metric([transport.name, "active"], active)
+            metric.add_metric([transport.name, "idle"], idle)
+        yield metric
+
+class HeavyHitterCollector:
+    """Collect the current top-K keys of heavy-hitter trackers at scrape time"""
+    
+    def __init__(self, get_trackers: Callable[[], Iterable[Any]], namespace: str = ""):
+        self.get_trackers = get_trackers
+        self.namespace = namespace
+    
+    def collect(self):
+        labels = ["tracker", "key"]
+        namespace = self.namespace
+        requests = GaugeMetricFamily(_prefixed(namespace, "http_heavy_hitter_requests"), "Requests of the top-K keys of a heavy-hitter tracker", labels=labels)
+        errors = GaugeMetricFamily(_prefixed(namespace, "http_heavy_hitter_requests_error"), "Maximum overestimation of the request count of a top-K key", labels=labels)
+        size = GaugeMetricFamily(_prefixed(namespace, "http_heavy_hitter_bytes"), "Request and response bytes of the top-K keys of a heavy-hitter tracker", labels=labels)
+        duration = GaugeMetricFamily(_prefixed(namespace, "http_heavy_hitter_duration_seconds_sum"), "Total request duration of the top-K keys of a heavy-hitter tracker", labels=labels)
+        
+        for tracker in self.get_trackers():
+            for entry in tracker.top():
+                values = [tracker.name, entry["key"]]
+                requests.add_metric(values, entry["count"])
+                errors.add_metric(values, entry["error"])
+                size.add_metric(values, entry["bytes"])
+                duration.add_metric(values, entry["duration_sum"])
+        
+        yield requests
+        yield errors
+        yield size
+        yield duration
+
+class ConstLabelCollector:
+    """
+    Collect the metrics of a registry with constant labels added to every sample.
+    
+    Metrics are recorded without the constant labels, so they are neither
+    passed on every ``labels()`` call nor part of each child's key; they are
+    added once per sample at scrape time.
+    
+    Args:
+        registry: Registry holding the metrics
+        const_labels: Labels added to every sample, e.g. {"service": "orders"}
+    """
+    
+    def __init__(self, registry: CollectorRegistry, const_labels: Dict[str, str]):
+        self.registry = registry
+        self.const_labels = dict(const_labels)
+    
+    def describe(self):
+        # Lets the target registry detect duplicate metric names
+        return self.collect()
+    
+    def collect(self):
+        const_labels = self.const_labels
+        for metric in self.registry.collect():
+            labelled = Metric(metric.name, metric.documentation, metric.type, metric.unit)
+            labelled.samples = [
+                sample._replace(labels={**sample.labels, **const_labels})
+                for sample in metric.samples
+            ]
+            yield labelled
+
+class CompositeRegistry:
+    """
+    Expose the metrics of several registries as one, e.g. of mounted applications.
+    
+    Families with the same name in more than one registry, such as
+    ``http_requests_total`` of applications with different ``service``
+    labels, are merged into one family so each is exposed once. Registries
+    are collected at scrape time; nothing is copied between them.
+    
+    Args:
+        registries: Registries (or anything with a ``collect()`` method) to expose
+    """
+    
+    def __init__(self, registries: Iterable[Any] = ()):
+        self.registries: List[Any] = []
+        for registry in registries:
+            self.add(registry)
+    
+    def add(self, registry):
+        """Add a registry, unless it is already exposed"""
+        if not any(registry is known for known in self.registries):
+            self.registries.append(registry)
+    
+    def collect(self):
+        families = {}
+        for registry in self.registries:
+            for metric in registry.collect():
+                family = families.get(metric.name)
+                if family is None:
+                    families[metric.name] = metric
+                elif family.type == metric.type:
+                    if not isinstance(family, _MergedMetric):
+                        family = families[metric.name] = _MergedMetric(family)
+                    family.samples.extend(metric.samples)
+        return iter(families.values())
+
+class _MergedMetric(Metric):
+    """Copy of a metric family that samples of other registries are added to"""
+    
+    def __init__(self, metric: Metric):
+        super().__init__(metric.name, metric.documentation, metric.type, metric.unit)
+        self.samples = list(metric.samples)
 
 class FastAPIObservabilityMetrics:
-    def __init__(self, service_name: str):
+    """
+    Prometheus metrics of one FastAPIObservability instance.
+    
+    Metrics live in a registry of their own, so any number of instances can
+    exist in one process, e.g. for mounted sub-applications, app factories or
+    tests. The ``service`` label and any ``const_labels`` are added to every
+    sample at scrape time.
+    
+    Args:
+        service_name: Value of the ``service`` label
+        registry: Registry to expose the metrics in, defaults to a new
+            registry for this instance
+        max_exception_fingerprints: Maximum number of exception fingerprint series
+        namespace: Prefix of all metric names, e.g. "orders" for
+            ``orders_http_requests_total``
+        const_labels: Further labels added to every sample
+        include_default_registry: Whether ``/metrics`` also exposes the
+            default registry, with process metrics and metrics the
+            application registered itself
+        statsd: Emitter that request, exception, queue time, phase, HTTP
+            client and background task observations are also pushed to
+    """
+    
+    def __init__(
+        self,
+        service_name: str,
+        registry: Optional[CollectorRegistry] = None,
+        max_exception_fingerprints: int = 100,
+        namespace: str = "",
+        const_labels: Optional[Dict[str, str]] = None,
+        include_default_registry: bool = True,
+        statsd: Optional["StatsDEmitter"] = None,
+    ):
         self.service_name = service_name
+        self.statsd = statsd
+        self.namespace = namespace
+        self.const_labels = {"service": service_name, **(const_labels or {})}
+        
+        # Metrics are recorded in a private registry without the constant
+        # labels, which are added when the exposed registry is collected
+        self._registry = CollectorRegistry()
+        self.registry = registry if registry is not None else CollectorRegistry()
+        self.max_exception_fingerprints = max_exception_fingerprints
+        self._exception_fingerprints: Set[str] = set()
         
         # Define Prometheus metrics
         self.requests_total = Counter(
             "http_requests_total",
             "Total number of HTTP requests",
-            ["method", "endpoint", "status", "service"]
+            ["method", "endpoint", "status"],
+            namespace=namespace,
+            registry=self._registry
         )
         
         self.request_duration_seconds = Histogram(
             "http_request_duration_seconds",
             "HTTP request duration in seconds",
-            ["method", "endpoint", "service"],
-            buckets=(0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+            ["method", "endpoint"],
+            buckets=(0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0),
+            namespace=namespace,
+            registry=self._registry
         )
         
         self.exceptions_total = Counter(
             "http_exceptions_total",
             "Total number of HTTP exceptions",
-            ["method", "endpoint", "exception_type", "service"]
+            ["method", "endpoint", "exception_type"],
+            namespace=namespace,
+            registry=self._registry
+        )
+        
+        # Time between the load balancer receiving a request and the
+        # application starting to handle it
+        self.request_queue_time_seconds = Histogram(
+            "http_request_queue_time_seconds",
+            "Time requests were queued before reaching the application, from load balancer timestamps",
+            buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+            namespace=namespace,
+            registry=self._registry
+        )
+        
+        # Server-Timing phases, recorded with server_timing_histograms
+        self.request_phase_duration_seconds = Histogram(
+            "http_request_phase_duration_seconds",
+            "Duration of the phases of HTTP requests reported in the Server-Timing header",
+            ["method", "endpoint", "phase"],
+            buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+            namespace=namespace,
+            registry=self._registry
+        )
+        
+        # Exceptions grouped by fingerprint, capped at max_exception_fingerprints
+        # series; further fingerprints are counted as "other"
+        self.exception_fingerprints_total = Counter(
+            "http_exception_fingerprints_total",
+            "Total number of unhandled exceptions by fingerprint",
+            ["fingerprint", "exception_type"],
+            namespace=namespace,
+            registry=self._registry
+        )
+        
+        # Streaming responses (no Content-Length), timed until the last chunk
+        self.response_time_to_first_byte_seconds = Histogram(
+            "http_response_time_to_first_byte_seconds",
+            "Time from request start to the first body chunk of streaming responses",
+            ["method", "endpoint"],
+            buckets=(0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0),
+            namespace=namespace,
+            registry=self._registry
+        )
+        
+        self.response_stream_duration_seconds = Histogram(
+            "http_response_stream_duration_seconds",
+            "Time from request start to the last body chunk of streaming responses",
+            ["method", "endpoint"],
+            buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0),
+            namespace=namespace,
+            registry=self._registry
+        )
+        
+        self.response_stream_chunks = Histogram(
+            "http_response_stream_chunks",
+            "Number of body chunks sent by streaming responses",
+            ["method", "endpoint"],
+            buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 5000, 10000),
+            namespace=namespace,
+            registry=self._registry
+        )
+        
+        # WebSocket connections
+        self.websocket_connection_duration_seconds = Histogram(
+            "websocket_connection_duration_seconds",
+            "WebSocket connection duration in seconds",
+            ["endpoint"],
+            buckets=(0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 1800.0, 3600.0),
+            namespace=namespace,
+            registry=self._registry
+        )
+        
+        self.websocket_messages_total = Counter(
+            "websocket_messages_total",
+            "Total number of WebSocket messages",
+            ["endpoint", "direction"],
+            namespace=namespace,
+            registry=self._registry
+        )
+        
+        self.websocket_message_bytes_total = Counter(
+            "websocket_message_bytes_total",
+            "Total WebSocket message payload bytes",
+            ["endpoint", "direction"],
+            namespace=namespace,
+            registry=self._registry
+        )
+        
+        self.websocket_closes_total = Counter(
+            "websocket_closes_total",
+            "Total number of closed WebSocket connections by close code",
+            ["endpoint", "code"],
+            namespace=namespace,
+            registry=self._registry
+        )
+        
+        # Outgoing requests of pooled HTTP clients
+        self.http_client_request_duration_seconds = Histogram(
+            "http_client_request_duration_seconds",
+            "Outgoing HTTP request latency until the response headers, per peer",
+            ["client", "method", "peer", "status"],
+            buckets=(0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0),
+            namespace=namespace,
+            registry=self._registry
+        )
+        
+        self.http_client_pool_wait_seconds = Histogram(
+            "http_client_pool_wait_seconds",
+            "Time outgoing HTTP requests waited for a pooled connection",
+            ["client"],
+            buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+            namespace=namespace,
+            registry=self._registry
+        )
+        
+        self.http_client_connections_created_total = Counter(
+            "http_client_connections_created_total",
+            "Total number of connections opened by pooled HTTP clients",
+            ["client", "peer"],
+            namespace=namespace,
+            registry=self._registry
+        )
+        
+        # Background tasks, run after the response was sent
+        self.background_task_queue_delay_seconds = Histogram(
+            "background_task_queue_delay_seconds",
+            "Time between a background task being added and starting",
+            ["task"],
+            buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+            namespace=namespace,
+            registry=self._registry
+        )
+        
+        self.background_task_duration_seconds = Histogram(
+            "background_task_duration_seconds",
+            "Background task execution time",
+            ["task", "status"],
+            buckets=(0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0, 30.0, 60.0),
+            namespace=namespace,
+            registry=self._registry
+        )
+        
+        self.background_task_failures_total = Counter(
+            "background_task_failures_total",
+            "Total number of failed background tasks",
+            ["task", "exception_type"],
+            namespace=namespace,
+            registry=self._registry
+        )
+        
+        # Sync endpoints, dependencies and background tasks on the threadpool
+        self.threadpool_wait_seconds = Histogram(
+            "threadpool_wait_seconds",
+            "Time threadpool calls waited for a worker thread",
+            ["kind"],
+            buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+            namespace=namespace,
+            registry=self._registry
+        )
+        
+        self.threadpool_run_seconds = Histogram(
+            "threadpool_run_seconds",
+            "Time threadpool calls ran on a worker thread",
+            ["kind"],
+            buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+            namespace=namespace,
+            registry=self._registry
+        )
+        
+        self.threadpool_threads_busy = Gauge(
+            "threadpool_threads_busy",
+            "Number of threadpool threads running a call",
+            namespace=namespace,
+            registry=self._registry
+        )
+        
+        self.threadpool_threads_limit = Gauge(
+            "threadpool_threads_limit",
+            "Maximum number of threadpool threads running calls at once",
+            namespace=namespace,
+            registry=self._registry
         )
         
         # Track the start time of requests
         self.request_start_times = {}
+        
+        # Registered once all metrics exist, so duplicate names in a shared
+        # registry are detected
+        self.registry.register(ConstLabelCollector(self._registry, self.const_labels))
+        
+        # Registries exposed by /metrics; other applications' can be included
+        self.exposition = CompositeRegistry([self.registry])
+        if include_default_registry and self.registry is not REGISTRY:
+            self.exposition.add(REGISTRY)
 
     def get_exemplar(self, context: Optional[Dict[str, Any]] = None):
         """Get OpenTelemetry trace ID and request ID for exemplar"""
@@ -45,11 +464,9 @@ class FastAPIObservabilityMetrics:
         
         # If no context provided, try to get trace info from current span
         if not exemplar:
-            current_span = trace.get_current_span()
-            if current_span:
-                span_context = current_span.get_span_context()
-                if span_context.is_valid:
-                    exemplar["trace_id"] = format(span_context.trace_id, "032x")
+            span_context = get_current_span_context()
+            if span_context is not None:
+                exemplar["trace_id"] = format(span_context.trace_id, "032x")
         
         return exemplar
 
@@ -69,28 +486,224 @@ class FastAPIObservabilityMetrics:
         self.requests_total.labels(
             method=method,
             endpoint=endpoint,
-            status=str(status),
-            service=self.service_name
+            status=str(status)
         ).inc()
         
         self.request_duration_seconds.labels(
             method=method,
-            endpoint=endpoint,
-            service=self.service_name
+            endpoint=endpoint
         ).observe(duration, exemplar=self.get_exemplar(context))
+        
+        if self.statsd is not None:
+            self.statsd.increment("http.requests", tags={"method": method, "endpoint": endpoint, "status": str(status)})
+            self.statsd.timing("http.request.duration", duration, tags={"method": method, "endpoint": endpoint})
 
     def record_exception(self, method: str, endpoint: str, exception_type: str, context: Optional[Dict[str, Any]] = None):
         """Record exception metrics"""
         self.exceptions_total.labels(
             method=method,
             endpoint=endpoint,
-            exception_type=exception_type,
-            service=self.service_name
+            exception_type=exception_type
         ).inc(exemplar=self.get_exemplar(context))
+        
+        if self.statsd is not None:
+            self.statsd.increment("http.exceptions", tags={"method": method, "endpoint": endpoint, "exception_type": exception_type})
+
+    def record_queue_time(self, queue_time: float):
+        """Record the time a request was queued before reaching the application"""
+        self.request_queue_time_seconds.observe(queue_time, exemplar=self.get_exemplar())
+        if self.statsd is not None:
+            self.statsd.timing("http.request.queue_time", queue_time)
+
+    def record_phases(self, method: str, endpoint: str, phases: Iterable[Tuple[str, float]]):
+        """Record the phase durations of a request
+        
+        Args:
+            method: HTTP method
+            endpoint: Path template of the matched route
+            phases: Phase names and durations in seconds
+        """
+        for phase, duration in phases:
+            self.request_phase_duration_seconds.labels(
+                method=method,
+                endpoint=endpoint,
+                phase=phase
+            ).observe(duration)
+            if self.statsd is not None:
+                self.statsd.timing("http.request.phase.duration", duration, tags={"method": method, "endpoint": endpoint, "phase": phase})
+
+    def record_exception_fingerprint(self, fingerprint: str, exception_type: str):
+        """Count an exception occurrence by fingerprint
+        
+        Only the first max_exception_fingerprints fingerprints get their own
+        series, later ones are counted with fingerprint and type "other".
+        """
+        if fingerprint not in self._exception_fingerprints:
+            if len(self._exception_fingerprints) >= self.max_exception_fingerprints:
+                fingerprint = exception_type = "other"
+            else:
+                self._exception_fingerprints.add(fingerprint)
+        
+        self.exception_fingerprints_total.labels(
+            fingerprint=fingerprint,
+            exception_type=exception_type
+        ).inc()
+
+    def record_stream(self, method: str, endpoint: str, time_to_first_byte: float, duration: float, chunks: int):
+        """Record timing and chunk count of a streaming response"""
+        self.response_time_to_first_byte_seconds.labels(
+            method=method,
+            endpoint=endpoint
+        ).observe(time_to_first_byte)
+        
+        self.response_stream_duration_seconds.labels(
+            method=method,
+            endpoint=endpoint
+        ).observe(duration)
+        
+        self.response_stream_chunks.labels(
+            method=method,
+            endpoint=endpoint
+        ).observe(chunks)
+
+    def record_websocket(self, endpoint: str, duration: float, messages: Dict[str, int], message_bytes: Dict[str, int], close_code: int):
+        """Record a finished WebSocket connection
+        
+        Args:
+            endpoint: Path of the WebSocket endpoint
+            duration: Connection duration in seconds
+            messages: Number of messages per direction ("in" and "out")
+            message_bytes: Payload bytes per direction ("in" and "out")
+            close_code: WebSocket close code
+        """
+        self.websocket_connection_duration_seconds.labels(
+            endpoint=endpoint
+        ).observe(duration)
+        
+        for direction, count in messages.items():
+            self.websocket_messages_total.labels(
+                endpoint=endpoint,
+                direction=direction
+            ).inc(count)
+            self.websocket_message_bytes_total.labels(
+                endpoint=endpoint,
+                direction=direction
+            ).inc(message_bytes.get(direction, 0))
+        
+        self.websocket_closes_total.labels(
+            endpoint=endpoint,
+            code=str(close_code)
+        ).inc()
+
+    def record_http_client_request(self, client: str, method: str, peer: str, status: str, duration: float, pool_wait: Optional[float] = None, connections_created: int = 0):
+        """Record an outgoing request of a pooled HTTP client
+        
+        Args:
+            client: Name of the pooled client
+            method: HTTP method
+            peer: host:port the request was sent to
+            status: Response status code, or "error" if no response was received
+            duration: Latency in seconds until the response headers arrived
+            pool_wait: Time in seconds spent waiting for a connection, if known
+            connections_created: Number of connections opened for the request
+        """
+        self.http_client_request_duration_seconds.labels(
+            client=client,
+            method=method,
+            peer=peer,
+            status=status
+        ).observe(duration, exemplar=self.get_exemplar())
+        
+        if self.statsd is not None:
+            self.statsd.timing("http_client.request.duration", duration, tags={"client": client, "method": method, "peer": peer, "status": status})
+        
+        if pool_wait is not None:
+            self.http_client_pool_wait_seconds.labels(
+                client=client
+            ).observe(pool_wait)
+        
+        if connections_created:
+            self.http_client_connections_created_total.labels(
+                client=client,
+                peer=peer
+            ).inc(connections_created)
+
+    def record_background_task(self, task: str, queue_delay: float, duration: float, error: Optional[BaseException] = None):
+        """Record a finished background task
+        
+        Args:
+            task: Name of the task function
+            queue_delay: Time in seconds between the task being added and starting
+            duration: Execution time in seconds
+            error: Exception the task raised, if it failed
+        """
+        self.background_task_queue_delay_seconds.labels(
+            task=task
+        ).observe(queue_delay)
+        
+        self.background_task_duration_seconds.labels(
+            task=task,
+            status="failure" if error is not None else "success"
+        ).observe(duration)
+        
+        if self.statsd is not None:
+            self.statsd.timing("background_task.duration", duration, tags={
+                "task": task,
+                "status": "failure" if error is not None else "success"
+            })
+        
+        if error is not None:
+            self.background_task_failures_total.labels(
+                task=task,
+                exception_type=type(error).__name__
+            ).inc()
+
+    def record_threadpool(self, kind: str, wait: float, run: float):
+        """Record a threadpool call
+        
+        Args:
+            kind: "endpoint", "dependency", "background_task" or "other"
+            wait: Time in seconds waiting for a worker thread
+            run: Time in seconds running on the worker thread
+        """
+        self.threadpool_wait_seconds.labels(kind=kind).observe(wait)
+        self.threadpool_run_seconds.labels(kind=kind).observe(run)
+
+    def threadpool_busy(self, delta: int):
+        """Count threadpool threads starting (1) or finishing (-1) a call"""
+        self.threadpool_threads_busy.inc(delta)
+
+    def set_threadpool_limit(self, limit: float):
+        self.threadpool_threads_limit.set(limit)
+
+    def track_http_client_pools(self, get_transports: Callable[[], Iterable[Any]]):
+        """Export connection pool usage of the transports returned by get_transports"""
+        self._registry.register(HTTPClientPoolCollector(get_transports, self.namespace))
+
+    def track_heavy_hitters(self, get_trackers: Callable[[], Iterable[Any]]):
+        """Export the current top-K keys of the heavy-hitter trackers returned by get_trackers"""
+        self._registry.register(HeavyHitterCollector(get_trackers, self.namespace))
+
+    def track_span_spools(self, get_spools: Callable[[], Iterable[Any]]):
+        """Export spool depth and replay counters of the spools returned by get_spools"""
+        self._registry.register(SpanSpoolCollector(get_spools, self.namespace))
+
+    def track_span_attributes(self, get_policies: Callable[[], Iterable[Any]]):
+        """Export truncation and drop counters of the attribute policies returned by get_policies"""
+        self._registry.register(SpanAttributeCollector(get_policies, self.namespace))
+
+    def include(self, metrics: Union["FastAPIObservabilityMetrics", CollectorRegistry]):
+        """Expose the metrics of another instance or registry from this instance's /metrics
+        
+        Args:
+            metrics: FastAPIObservabilityMetrics of e.g. a mounted application,
+                or any Prometheus registry
+        """
+        self.exposition.add(getattr(metrics, "registry", metrics))
 
     async def get_metrics(self, request: Request = None) -> Response:
         """Get Prometheus metrics with OpenMetrics format"""
         return Response(
-            content=generate_latest(REGISTRY),
+            content=generate_latest(self.exposition),
             media_type=CONTENT_TYPE_LATEST
         ) 
\ No newline at end of file
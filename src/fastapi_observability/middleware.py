@@ -3,14 +3,22 @@ import uuid
 from fastapi import Request, Response
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.types import ASGIApp
-from typing import List, Optional, Union
-from opentelemetry import trace
-import structlog
+from typing import List, Optional, Union, TYPE_CHECKING
 from starlette.datastructures import URL
 from starlette.types import ASGIApp, Receive, Scope, Send
 
-from .logger import FastAPIObservabilityLogger
-from .metrics import FastAPIObservabilityMetrics
+from .errors import ExceptionAggregator
+from .policy import RoutePolicies, RoutePolicy
+from .queue_time import DEFAULT_QUEUE_TIME_HEADERS, get_queue_time
+from .runtime import RuntimeConfig, RuntimeSettings
+from .timing import ServerTiming, reset_server_timing, set_server_timing
+from .trace_context import get_trace_context, set_span_attribute
+
+if TYPE_CHECKING:
+    from .archive import RequestArchive
+    from .heavy_hitters import HeavyHitterTracker
+    from .logger import FastAPIObservabilityLogger
+    from .metrics import FastAPIObservabilityMetrics
 
 def get_path_with_query_string(scope):
     """Get the path with query string from the scope."""
@@ -20,69 +28,294 @@ def get_path_with_query_string(scope):
         path = f"{path}?{query_string}"
     return path
 
+def get_route_path(scope) -> str:
+    """Get the path template of the matched route, or the request path if no route matched."""
+    route = scope.get("route")
+    return getattr(route, "path", None) or scope.get("path", "")
+
+def get_message_size(message) -> int:
+    """Get the payload size in bytes of a WebSocket send/receive message."""
+    data = message.get("bytes")
+    if data is not None:
+        return len(data)
+    text = message.get("text") or ""
+    # Avoid encoding ASCII text just to measure it
+    return len(text) if text.isascii() else len(text.encode("utf-8"))
+
 class ObservabilityMiddleware(BaseHTTPMiddleware):
     def __init__(
         self,
         app: ASGIApp,
         service_name: str,
-        logger: FastAPIObservabilityLogger = None,
-        metrics: FastAPIObservabilityMetrics = None,
-        excluded_endpoints: Optional[List[str]] = None
+        logger: "FastAPIObservabilityLogger" = None,
+        metrics: "FastAPIObservabilityMetrics" = None,
+        excluded_endpoints: Optional[List[str]] = None,
+        errors: Optional[ExceptionAggregator] = None,
+        heavy_hitters: Optional[List["HeavyHitterTracker"]] = None,
+        queue_time_headers: Optional[List[str]] = None,
+        server_timing: bool = False,
+        server_timing_histograms: bool = False,
+        route_policies: Optional[RoutePolicies] = None,
+        runtime: Optional[RuntimeSettings] = None,
+        archive: Optional["RequestArchive"] = None
     ):
         super().__init__(app)
         self.service_name = service_name
         self.logger = logger
         self.metrics = metrics
-        self.excluded_endpoints = excluded_endpoints or []
-        
-        # Normalize excluded endpoints for easier comparison
-        self.normalized_excluded_endpoints = [
-            endpoint.lstrip('/') for endpoint in self.excluded_endpoints
-        ] if self.excluded_endpoints else []
+        self.errors = errors or ExceptionAggregator()
+        self.heavy_hitters = heavy_hitters or []
+        self.archive = archive
+        self.queue_time_headers = [
+            name.lower() for name in (DEFAULT_QUEUE_TIME_HEADERS if queue_time_headers is None else queue_time_headers)
+        ]
+        self.server_timing = server_timing
+        self.server_timing_histograms = server_timing_histograms
+        # Route policies and excluded endpoints, swappable at runtime
+        self.runtime = runtime or RuntimeSettings(
+            route_policies=route_policies,
+            excluded_endpoints=excluded_endpoints or ()
+        )
 
-    def is_excluded(self, path: str) -> bool:
+    def is_excluded(self, path: str, config: Optional[RuntimeConfig] = None) -> bool:
         """Check if the path is in the excluded endpoints list"""
+        config = config or self.runtime.config
         # Normalize the path for comparison
-        normalized_path = path.lstrip('/')
-        return normalized_path in self.normalized_excluded_endpoints
+        return path.lstrip('/') in config.excluded_endpoints
 
-    async def dispatch(self, request: Request, call_next):
-        # Clear any existing context variables
-        structlog.contextvars.clear_contextvars()
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "websocket":
+            await self.observe_websocket(scope, receive, send)
+        elif scope["type"] == "http" and self.metrics:
+            await super().__call__(scope, receive, self.observe_stream(scope, send))
+        else:
+            await super().__call__(scope, receive, send)
+
+    def observe_stream(self, scope: Scope, send: Send) -> Send:
+        """
+        Wrap the ASGI send channel to time streaming responses.
+        
+        ``dispatch`` only sees the response when its headers are ready. For
+        responses without a Content-Length (StreamingResponse, SSE) this records
+        the time to the first body chunk, the time until the last one was sent
+        and the number of chunks. Messages are passed through, never buffered.
+        """
+        start_time = time.perf_counter()
+        streaming = False
+        first_byte_time = None
+        chunks = 0
+
+        async def send_wrapper(message):
+            nonlocal streaming, first_byte_time, chunks
+            message_type = message["type"]
+            if message_type == "http.response.start":
+                streaming = not any(name.lower() == b"content-length" for name, _ in message.get("headers", ()))
+            elif message_type == "http.response.body" and streaming:
+                if message.get("body"):
+                    chunks += 1
+                    if first_byte_time is None:
+                        first_byte_time = time.perf_counter()
+                if not message.get("more_body", False):
+                    await send(message)
+                    if chunks and self.runtime.config.route_policies.for_scope(scope).metrics:
+                        end_time = time.perf_counter()
+                        self.metrics.record_stream(
+                            method=scope["method"],
+                            endpoint=get_route_path(scope),
+                            time_to_first_byte=first_byte_time - start_time,
+                            duration=end_time - start_time,
+                            chunks=chunks
+                        )
+                    return
+            await send(message)
+
+        return send_wrapper
+
+    async def observe_websocket(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """
+        Record connection duration, messages, bytes and close code of a WebSocket.
         
-        # Generate request ID and bind context variables
+        The receive and send channels are wrapped to count messages in each
+        direction; metrics and the log line are emitted once when the
+        connection ends.
+        """
         request_id = str(uuid.uuid4())
-        structlog.contextvars.bind_contextvars(
-            request_id=request_id
+        if self.logger:
+            self.logger.bind_request_context(request_id=request_id)
+
+        start_time = time.perf_counter()
+        messages = {"in": 0, "out": 0}
+        message_bytes = {"in": 0, "out": 0}
+        close_code = None
+
+        async def receive_wrapper():
+            nonlocal close_code
+            message = await receive()
+            message_type = message["type"]
+            if message_type == "websocket.receive":
+                messages["in"] += 1
+                message_bytes["in"] += get_message_size(message)
+            elif message_type == "websocket.disconnect" and close_code is None:
+                close_code = message.get("code", 1000)
+            return message
+
+        async def send_wrapper(message):
+            nonlocal close_code
+            message_type = message["type"]
+            if message_type == "websocket.send":
+                messages["out"] += 1
+                message_bytes["out"] += get_message_size(message)
+            elif message_type == "websocket.close" and close_code is None:
+                close_code = message.get("code", 1000)
+            await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        except Exception:
+            if close_code is None:
+                close_code = 1011
+            raise
+        finally:
+            # 1006: the connection ended without a close frame being observed
+            if close_code is None:
+                close_code = 1006
+            duration = time.perf_counter() - start_time
+            path = scope.get("path", "")
+            config = self.runtime.config
+            policy = config.route_policies.for_scope(scope)
+
+            if self.metrics and policy.metrics:
+                self.metrics.record_websocket(
+                    endpoint=get_route_path(scope),
+                    duration=duration,
+                    messages=messages,
+                    message_bytes=message_bytes,
+                    close_code=close_code
+                )
+            if self.logger and policy.access_log and not self.is_excluded(path, config):
+                self.logger.log_websocket(scope, close_code, duration, messages, message_bytes)
+
+    def record_queue_time(self, request: Request, now: float) -> Optional[float]:
+        """Record the time the request was queued before reaching the application"""
+        queue_time = get_queue_time(request.headers, now, self.queue_time_headers)
+        if queue_time is None:
+            return None
+        
+        request.state.queue_time = queue_time
+        set_span_attribute("http.request.queue_time", queue_time)
+        if self.metrics:
+            self.metrics.record_queue_time(queue_time)
+        return queue_time
+
+    def add_server_timing(self, request: Request, response: Response, timing: ServerTiming, dispatch_start: float, handler_start: float, handler_end: float):
+        """
+        Add the middleware's phases and send all phases in the Server-Timing header.
+        
+        ``app`` is the time until the response headers were ready, including
+        the phases registered by the handler. ``middleware`` is the time spent
+        in this middleware before and after it, up to this point.
+        """
+        now = time.perf_counter()
+        timing.add("app", handler_end - handler_start)
+        timing.add("middleware", (handler_start - dispatch_start) + (now - handler_end))
+        timing.add("total", now - dispatch_start)
+        response.headers.append("Server-Timing", timing.header_value())
+        
+        phases = timing.phases
+        for name, duration in phases:
+            set_span_attribute(f"server_timing.{name}", duration)
+        if self.metrics and self.server_timing_histograms:
+            self.metrics.record_phases(request.method, get_route_path(request.scope), phases)
+
+    def record_archive(self, archive: "RequestArchive", request: Request, response: Optional[Response], status_code: int, duration: float, client_host: str, trace_context: dict):
+        """Append the request to the request archive, with sizes from Content-Length when known"""
+        request_bytes = request.headers.get("content-length")
+        response_bytes = response.headers.get("content-length") if response is not None else None
+        archive.record(
+            route=get_route_path(request.scope),
+            method=request.method,
+            status=status_code,
+            duration=duration,
+            request_bytes=int(request_bytes) if request_bytes and request_bytes.isdigit() else -1,
+            response_bytes=int(response_bytes) if response_bytes and response_bytes.isdigit() else -1,
+            client=client_host,
+            trace_id=trace_context.get("trace_id", "")
         )
+
+    def record_exception(self, request: Request, url: str, error: Exception, policy: RoutePolicy, context: dict):
+        """Record an unhandled exception in the error aggregator, logs and the metrics allowed by the route policy"""
+        occurrence = self.errors.record(error)
+        
+        if self.logger:
+            self.logger.log_exception(error, occurrence, context=context)
+        
+        if self.metrics and policy.metrics:
+            self.metrics.record_exception(
+                method=request.method,
+                endpoint=url,
+                exception_type=type(error).__name__,
+                context=context
+            )
+            self.metrics.record_exception_fingerprint(occurrence.fingerprint, type(error).__name__)
+
+    async def dispatch(self, request: Request, call_next):
+        dispatch_start = time.perf_counter()
+        
+        # Policy of the route the request will be routed to, compiled on
+        # startup; work it disables is skipped for the whole request
+        config = self.runtime.config
+        policy = config.route_policies.for_request(request.scope, getattr(request.scope.get("app"), "routes", ()))
+        
+        # Generate request ID and bind context variables. Without an access log
+        # the ID is only generated if the request fails
+        request_id = None
+        if policy.access_log:
+            request_id = str(uuid.uuid4())
+            if self.logger:
+                self.logger.bind_request_context(request_id=request_id)
         
         # Get trace context from current span
-        current_span = trace.get_current_span()
-        trace_context = {}
-        if current_span:
-            span_context = current_span.get_span_context()
-            if span_context.is_valid:
-                trace_context = {
-                    "trace_id": trace.format_trace_id(span_context.trace_id),
-                    "span_id": trace.format_span_id(span_context.span_id)
-                }
+        trace_context = get_trace_context() if policy.tracing else {}
         
         # Start request timing
         start_time = time.time()
         
+        queue_time = None
+        if self.queue_time_headers and policy.metrics:
+            queue_time = self.record_queue_time(request, start_time)
+        
+        # Phase timings, extended by the handler through request.state.timing
+        timing = None
+        if self.server_timing and policy.metrics:
+            timing = ServerTiming()
+            if queue_time is not None:
+                timing.add("queue", queue_time)
+            request.state.timing = timing
+            timing_token = set_server_timing(timing)
+        
+        url = get_path_with_query_string(request.scope).removeprefix(request.scope.get('root_path', ''))
+        # Unhandled exceptions are turned into a 500 by the server error handler
+        response = None
+        status_code = 500
+        
         try:
+            handler_start = time.perf_counter()
             response = await call_next(request)
+            status_code = response.status_code
+            if timing is not None:
+                self.add_server_timing(request, response, timing, dispatch_start, handler_start, time.perf_counter())
             return response
         except Exception as e:
-            if self.logger:
-                self.logger.log_error(e, context={
-                    "request_id": request_id,
-                    **trace_context
-                })
+            if request_id is None:
+                request_id = str(uuid.uuid4())
+            self.record_exception(request, url, e, policy, context={
+                "request_id": request_id,
+                **trace_context
+            })
             raise
         finally:
-            status_code = response.status_code
-            url = get_path_with_query_string(request.scope).removeprefix(request.scope.get('root_path', ''))
+            if timing is not None:
+                reset_server_timing(timing_token)
             
             # Get client information
             if request.client:
@@ -96,29 +329,31 @@ class ObservabilityMiddleware(BaseHTTPMiddleware):
             http_version = request.scope.get("http_version", "1.1")
             
             # Only log if endpoint is not excluded or if it's an error response
-            if not self.is_excluded(url) or status_code >= 400:
+            if (policy.access_log and not self.is_excluded(url, config)) or status_code >= 400:
                 # Log request with all context
                 if self.logger:
                     self.logger.log_request(request, response, context={
-                        "request_id": request_id,
+                        "request_id": request_id or str(uuid.uuid4()),
                         **trace_context,
                         "client_host": client_host,
                         "client_port": client_port,
                         "http_version": http_version
                     })
             
+            duration = time.time() - start_time
+            if policy.metrics:
+                for tracker in self.heavy_hitters:
+                    tracker.record_request(request, response, duration)
+            
             # Record metrics if enabled
-            if self.metrics:
-                duration = time.time() - start_time
+            if self.metrics and policy.metrics:
                 self.metrics.record_request(
                     method=http_method,
                     endpoint=url,
                     status=status_code,
                     duration=duration,
-                    context={
-                        "request_id": request_id,
-                        **trace_context
-                    }
+                    context={"request_id": request_id, **trace_context} if request_id else trace_context
                 )
-        
-        return response 
\ No newline at end of file
+            
+            if self.archive is not None and policy.metrics:
+                self.record_archive(self.archive, request, response, status_code, duration, client_host, trace_context)
@@ -0,0 +1,63 @@
+import grpc  # type: ignore[import-untyped]
+from urllib.parse import urlparse
+from typing import Sequence
+from opentelemetry.exporter.otlp.proto.common.trace_encoder import encode_spans
+from opentelemetry.sdk.trace import ReadableSpan
+
+TRACE_EXPORT_METHOD = "/opentelemetry.proto.collector.trace.v1.TraceService/Export"
+
+def encode_spans_request(spans: Sequence[ReadableSpan]) -> bytes:
+    """
+    Encode finished spans as a serialized OTLP ExportTraceServiceRequest.
+
+    Serialized requests can be merged by concatenating their bytes, since
+    protobuf appends repeated fields when parsing concatenated messages. This
+    lets batches be combined without decoding them again.
+    """
+    return encode_spans(spans).SerializeToString()
+
+def parse_endpoint(endpoint: str):
+    """Split an OTLP endpoint URL into a gRPC target and whether it is insecure"""
+    parsed_url = urlparse(endpoint)
+    if parsed_url.netloc:
+        return parsed_url.netloc, parsed_url.scheme != "https"
+    return endpoint, True
+
+class OTLPTraceSender:
+    """
+    Send already serialized ExportTraceServiceRequest payloads over OTLP gRPC.
+
+    Unlike OTLPSpanExporter this does not take span objects, so payloads that
+    were encoded elsewhere (another process, a disk spool) are sent as-is
+    without being decoded and re-encoded.
+    """
+
+    def __init__(self, endpoint: str = "http://localhost:4317", compression: bool = True, timeout: float = 10.0):
+        self.endpoint = endpoint
+        self.compression = grpc.Compression.Gzip if compression else grpc.Compression.NoCompression
+        self.timeout = timeout
+
+        target, insecure = parse_endpoint(endpoint)
+        if insecure:
+            self._channel = grpc.insecure_channel(target)
+        else:
+            self._channel = grpc.secure_channel(target, grpc.ssl_channel_credentials())
+
+        # Identity serializer: the payload is already a serialized request
+        self._export = self._channel.unary_unary(
+            TRACE_EXPORT_METHOD,
+            request_serializer=None,
+            response_deserializer=None,
+        )
+
+    def send(self, payload: bytes) -> bool:
+        """Send one serialized request, returning True if the collector accepted it"""
+        try:
+            self._export(payload, timeout=self.timeout, compression=self.compression)
+            return True
+        except grpc.RpcError:
+            return False
+
+    def close(self):
+        """Close the gRPC channel"""
+        self._channel.close()
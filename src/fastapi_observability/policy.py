@@ -0,0 +1,210 @@
+"""
+Per-route observability policy.
+
+Policies decide per route whether requests are counted in metrics, written to
+the access log and traced, and at which ratio they are sampled. They are
+declared with the ``route_policy`` decorator on an endpoint or with a mapping
+of route path patterns, and are compiled once per route. Routes added later
+are compiled on their first request.
+
+    @app.get("/ping")
+    @route_policy(access_log=False, tracing=False)
+    async def ping():
+        return "pong"
+
+    FastAPIObservability(app, route_policies={"/internal/*": {"tracing": False}})
+"""
+from fnmatch import fnmatchcase
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple, Union
+from starlette.routing import Match
+
+# Attribute holding the declared settings on endpoint functions
+_DECLARED_ATTRIBUTE = "__observability_policy__"
+
+class RoutePolicy:
+    """
+    What to record for requests to a route.
+
+    Args:
+        metrics: Record request metrics (and heavy hitters) for the route
+        access_log: Write access log lines for the route; errors are always logged
+        tracing: Trace requests to the route
+        sample_ratio: Ratio of the route's traces to sample regardless of the
+            parent's decision, or None to leave it to the sampler
+    """
+
+    __slots__ = ("metrics", "access_log", "tracing", "sample_ratio")
+
+    def __init__(self, metrics: bool = True, access_log: bool = True, tracing: bool = True, sample_ratio: Optional[float] = None):
+        if sample_ratio is not None and not 0.0 <= sample_ratio <= 1.0:
+            raise ValueError(f"sample_ratio must be between 0 and 1, got {sample_ratio}")
+        self.metrics = metrics
+        self.access_log = access_log
+        self.tracing = tracing
+        self.sample_ratio = sample_ratio
+
+    def merge(self, **overrides) -> "RoutePolicy":
+        """Get a copy with some settings overridden"""
+        values = self.as_dict()
+        unknown = set(overrides) - set(values)
+        if unknown:
+            raise ValueError(f"Unknown route policy settings: {', '.join(sorted(unknown))}")
+        values.update(overrides)
+        return RoutePolicy(**values)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __eq__(self, other):
+        return isinstance(other, RoutePolicy) and all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        settings = ", ".join(f"{name}={getattr(self, name)}" for name in self.__slots__)
+        return f"RoutePolicy({settings})"
+
+def route_policy(**settings) -> Callable:
+    """
+    Declare the observability policy of an endpoint.
+
+    Apply it below the route decorator so the route sees the marked function.
+    Settings not given are taken from the default policy.
+
+    Args:
+        **settings: ``metrics``, ``access_log``, ``tracing`` and/or ``sample_ratio``
+    """
+    RoutePolicy().merge(**settings)
+
+    def decorator(endpoint):
+        setattr(endpoint, _DECLARED_ATTRIBUTE, settings)
+        return endpoint
+
+    return decorator
+
+class RoutePolicies:
+    """
+    Compiled route policies of an application.
+
+    A route's policy is its endpoint's ``route_policy`` settings, else the
+    first pattern matching its path template, applied over the default policy.
+    Overrides (see ``with_overrides``) are applied last.
+
+    Compiled policies are kept in this instance rather than on the routes, so
+    a copy with other overrides can be compiled while this one is in use.
+
+    Args:
+        patterns: Route path glob patterns (e.g. ``"/internal/*"``) mapped to
+            a RoutePolicy or a dict of settings, matched in order
+        default: Policy of routes without a declared policy
+    """
+
+    def __init__(
+        self,
+        patterns: Optional[Mapping[str, Union[RoutePolicy, Dict[str, Any]]]] = None,
+        default: Optional[RoutePolicy] = None,
+    ):
+        self.default = default or RoutePolicy()
+        self.patterns = [
+            (pattern, policy if isinstance(policy, RoutePolicy) else self.default.merge(**policy))
+            for pattern, policy in (patterns or {}).items()
+        ]
+        self.overrides: List[Tuple[str, Dict[str, Any]]] = []
+        # Routes and their policies by route id (routes are not hashable),
+        # and policies by route path template for lookups without a route
+        self._by_route: Dict[int, Tuple[Any, RoutePolicy]] = {}
+        self._by_path: Dict[str, RoutePolicy] = {}
+
+    def resolve(self, path: str, endpoint=None) -> RoutePolicy:
+        """Resolve the policy of a route from the overrides, its declaration or the patterns"""
+        policy = self._resolve_base(path, endpoint)
+        for pattern, settings in self.overrides:
+            if fnmatchcase(path, pattern):
+                return policy.merge(**settings)
+        return policy
+
+    def _resolve_base(self, path: str, endpoint) -> RoutePolicy:
+        settings = getattr(endpoint, _DECLARED_ATTRIBUTE, None)
+        if settings is not None:
+            return self.default.merge(**settings)
+        for pattern, policy in self.patterns:
+            if fnmatchcase(path, pattern):
+                return policy
+        return self.default
+
+    def compile_route(self, route) -> RoutePolicy:
+        """Resolve and store the policy of a route"""
+        path = getattr(route, "path", "")
+        policy = self.resolve(path, getattr(route, "endpoint", None))
+        self._by_route[id(route)] = (route, policy)
+        self._by_path[path] = policy
+        return policy
+
+    def compile(self, routes):
+        """Compile the policies of all routes, e.g. ``app.routes`` on startup"""
+        for route in routes:
+            self.compile_route(route)
+
+    def for_scope(self, scope) -> RoutePolicy:
+        """Get the policy of the route a request was routed to"""
+        route = scope.get("route")
+        if route is None:
+            return self.default
+        compiled = self._by_route.get(id(route))
+        if compiled is None:
+            return self.compile_route(route)
+        return compiled[1]
+
+    def for_request(self, scope, routes) -> RoutePolicy:
+        """
+        Get the policy of the route a request will be routed to.
+
+        Before routing, the route is matched against ``routes`` in order, as
+        the router does, descending into mounted routers.
+
+        Args:
+            scope: ASGI scope of the request
+            routes: Routes of the application, e.g. ``app.routes``
+        """
+        if scope.get("route") is not None:
+            return self.for_scope(scope)
+        route = None
+        while routes:
+            for candidate in routes:
+                match, child_scope = candidate.matches(scope)
+                if match == Match.FULL:
+                    route = candidate
+                    scope = {**scope, **child_scope}
+                    routes = getattr(candidate, "routes", None)
+                    break
+            else:
+                break
+        return self.for_scope({"route": route})
+
+    def for_path(self, path: str) -> RoutePolicy:
+        """Get the policy of a route path template, e.g. the ``http.route`` of a span"""
+        policy = self._by_path.get(path)
+        if policy is None:
+            policy = self._by_path[path] = self.resolve(path)
+        return policy
+
+    def with_overrides(self, overrides: Optional[Mapping[str, Dict[str, Any]]]) -> "RoutePolicies":
+        """
+        Get a copy whose policies have some settings overridden per route pattern.
+
+        Overrides take precedence over declarations and patterns, and change
+        only the settings they give. Routes compiled into this instance are
+        compiled into the copy before it is returned.
+
+        Args:
+            overrides: Route path glob patterns mapped to dicts of settings,
+                matched in order; replaces the overrides of this instance
+
+        Raises:
+            ValueError: If an override has unknown or invalid settings
+        """
+        policies = RoutePolicies(default=self.default)
+        policies.patterns = self.patterns
+        policies.overrides = [(pattern, dict(settings)) for pattern, settings in (overrides or {}).items()]
+        for _, settings in policies.overrides:
+            self.default.merge(**settings)
+        policies.compile([route for route, _ in list(self._by_route.values())])
+        return policies
@@ -0,0 +1,445 @@
+"""
+Continuous, low-overhead stack sampling attributed to routes.
+
+A ``StackSampler`` thread periodically takes the Python stacks of all threads
+with ``sys._current_frames()`` and counts them in memory as collapsed stacks,
+tagged with the route and trace ID of the request running on the thread.
+Threads waiting idle (in a selector, a lock or a queue) are skipped, so the
+profile shows where threads spend time while running.
+
+Requests are tagged by ``ProfiledApp``, which ObservabilityMiddleware wraps
+around the application: the sampler finds its frame while walking a stack.
+Sync endpoints run on threadpool threads, which are tagged by the task
+instrumentation through ``bind_thread_tags()``.
+
+Every ``export_interval`` seconds the counts are written to a directory as
+pprof (``.pb.gz``, for ``go tool pprof`` and continuous profiling backends)
+and collapsed stack files (for flame graph tools), and a new window starts.
+
+Sampling holds the GIL, so its cost is taken from the application. The
+sampler measures the time each pass takes and stretches the interval so the
+share of time spent sampling stays below ``max_overhead``.
+"""
+import gzip
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from types import FrameType
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .trace_context import get_current_span_context
+
+class ProfileTags:
+    """Route and trace ID of a request, for attributing samples"""
+
+    __slots__ = ("scope", "trace_id")
+
+    def __init__(self, scope, trace_id: str = ""):
+        self.scope = scope
+        self.trace_id = trace_id
+
+    @property
+    def route(self) -> str:
+        # Resolved when sampled, since the route is matched after tagging
+        route = self.scope.get("route")
+        return getattr(route, "path", None) or self.scope.get("path", "")
+
+_current_tags: ContextVar[Optional[ProfileTags]] = ContextVar("profile_tags", default=None)
+# Tags of requests by the id() of their ProfiledApp frame
+_frame_tags: Dict[int, ProfileTags] = {}
+# Tags of threads running a request's sync code, by thread ident
+_thread_tags: Dict[int, ProfileTags] = {}
+
+class ProfiledApp:
+    """
+    ASGI wrapper tagging the requests it runs for the stack sampler.
+
+    Its frame stays on the stack while the application handles a request,
+    so the sampler finds the request's tags by walking the stack.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        span_context = get_current_span_context()
+        tags = ProfileTags(scope, format(span_context.trace_id, "032x") if span_context is not None else "")
+        frame_id = id(sys._getframe())
+        _frame_tags[frame_id] = tags
+        token = _current_tags.set(tags)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current_tags.reset(token)
+            del _frame_tags[frame_id]
+
+_PROFILED_CODE = ProfiledApp.__call__.__code__
+
+@contextmanager
+def bind_thread_tags() -> Iterator[None]:
+    """Tag the current thread with the current request while it runs the enclosed block"""
+    tags = _current_tags.get()
+    if tags is None:
+        yield
+        return
+
+    thread_id = threading.get_ident()
+    _thread_tags[thread_id] = tags
+    try:
+        yield
+    finally:
+        _thread_tags.pop(thread_id, None)
+
+# Leaf functions of threads blocked waiting, by (file name, function name)
+_IDLE_FUNCTIONS = frozenset({
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("socket.py", "accept"),
+})
+
+def _is_idle(code) -> bool:
+    return (os.path.basename(code.co_filename), code.co_name) in _IDLE_FUNCTIONS
+
+def _qualname(code) -> str:
+    # co_qualname exists from Python 3.11
+    return getattr(code, "co_qualname", code.co_name)
+
+def _frame_name(code) -> str:
+    return f"{_qualname(code)} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class StackSampler:
+    """
+    Background sampler aggregating tagged stacks of all threads.
+
+    Args:
+        interval: Target time in seconds between samples
+        max_overhead: Maximum share of time spent sampling; the interval is
+            stretched when a pass takes longer than this allows
+        output_dir: Directory to write profiles to, or None to only keep the
+            current window in memory
+        export_interval: Length in seconds of a profile window
+        max_stacks: Maximum number of distinct tagged stacks per window;
+            further samples are counted without trace ID, or dropped
+        max_files: Number of windows to keep in ``output_dir``, across all
+            processes writing to it
+        include_idle: Whether to count threads that are waiting idle
+    """
+
+    def __init__(
+        self,
+        interval: float = 0.01,
+        max_overhead: float = 0.01,
+        output_dir: Optional[str] = None,
+        export_interval: float = 60.0,
+        max_stacks: int = 10000,
+        max_files: int = 60,
+        include_idle: bool = False,
+    ):
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        if not 0 < max_overhead <= 1:
+            raise ValueError("max_overhead must be between 0 and 1")
+        self.interval = interval
+        self.max_overhead = max_overhead
+        self.output_dir = output_dir
+        self.export_interval = export_interval
+        self.max_stacks = max_stacks
+        self.max_files = max_files
+        self.include_idle = include_idle
+
+        # (route, trace ID, stack of code objects from the outermost) -> samples
+        self._counts: Dict[Tuple[str, str, tuple], int] = {}
+        self.window_start = time.time()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        # Statistics of the sampler's own cost
+        self.samples = 0
+        self.dropped_samples = 0
+        self.passes = 0
+        self.sampling_time = 0.0
+        self.current_interval = interval
+        self._started_at = None
+
+    @property
+    def running(self) -> bool:
+        """Whether the sampler thread runs in the current process"""
+        return self._pid == os.getpid() and self._thread is not None and self._thread.is_alive()
+
+    @property
+    def overhead(self) -> float:
+        """Share of time spent sampling since the sampler started"""
+        if self._started_at is None:
+            return 0.0
+        elapsed = time.perf_counter() - self._started_at
+        return self.sampling_time / elapsed if elapsed > 0 else 0.0
+
+    def start(self):
+        """Start sampling in the current process, if not already running"""
+        if self.running:
+            return
+        if self.output_dir:
+            os.makedirs(self.output_dir, exist_ok=True)
+            # Windows left by workers that exited count towards max_files
+            self._remove_old_files(self.output_dir)
+        self._pid = os.getpid()
+        self._stop.clear()
+        with self._lock:
+            self._counts = {}
+            self.window_start = time.time()
+        self._started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Stop sampling and write the current window"""
+        thread = self._thread
+        if not self.running or thread is None:
+            return
+        self._stop.set()
+        thread.join(timeout)
+        self._thread = None
+        self.rotate()
+
+    def _run(self):
+        own_thread = threading.get_ident()
+        next_export = time.monotonic() + self.export_interval
+        average_cost = 0.0
+        while not self._stop.wait(self.current_interval):
+            start = time.perf_counter()
+            self.sample(own_thread)
+            cost = time.perf_counter() - start
+            self.passes += 1
+            self.sampling_time += cost
+            # Keep cost / (cost + interval) below max_overhead, reacting to a
+            # slow pass at once and to faster ones gradually
+            average_cost = max(cost, average_cost * 0.8 + cost * 0.2)
+            self.current_interval = max(self.interval, average_cost * (1 - self.max_overhead) / self.max_overhead)
+            if time.monotonic() >= next_export:
+                next_export += self.export_interval
+                self.rotate()
+
+    def sample(self, exclude_thread: Optional[int] = None):
+        """Take one sample of the stacks of all threads"""
+        frames = sys._current_frames()
+        with self._lock:
+            counts = self._counts
+            for thread_id, frame in frames.items():
+                if thread_id == exclude_thread:
+                    continue
+                if not self.include_idle and _is_idle(frame.f_code):
+                    continue
+
+                stack = []
+                tags = None
+                current: Optional[FrameType] = frame
+                while current is not None:
+                    code = current.f_code
+                    if tags is None and code is _PROFILED_CODE:
+                        tags = _frame_tags.get(id(current))
+                    stack.append(code)
+                    current = current.f_back
+                stack.reverse()
+                if tags is None:
+                    tags = _thread_tags.get(thread_id)
+
+                route, trace_id = (tags.route, tags.trace_id) if tags is not None else ("", "")
+                key = (route, trace_id, tuple(stack))
+                if key not in counts and len(counts) >= self.max_stacks:
+                    key = (route, "", key[2])
+                    if key not in counts:
+                        self.dropped_samples += 1
+                        continue
+                counts[key] = counts.get(key, 0) + 1
+                self.samples += 1
+
+    def snapshot(self) -> Dict[Tuple[str, str, tuple], int]:
+        """Counts of the current window by (route, trace ID, stack)"""
+        with self._lock:
+            return dict(self._counts)
+
+    def rotate(self):
+        """Start a new window, writing the finished one to ``output_dir`` if set"""
+        with self._lock:
+            counts, self._counts = self._counts, {}
+            start, self.window_start = self.window_start, time.time()
+        if self.output_dir and counts:
+            self._write(self.output_dir, counts, start)
+
+    def _write(self, output_dir: str, counts, start: float):
+        prefix = os.path.join(output_dir, f"profile-{os.getpid()}-{int(start * 1000)}")
+        with open(prefix + ".collapsed.tmp", "w") as collapsed:
+            collapsed.write(render_collapsed(counts))
+        os.replace(prefix + ".collapsed.tmp", prefix + ".collapsed")
+        with open(prefix + ".pb.gz.tmp", "wb") as pprof:
+            pprof.write(render_pprof(counts, self.interval, start, time.time() - start))
+        os.replace(prefix + ".pb.gz.tmp", prefix + ".pb.gz")
+        self._remove_old_files(output_dir)
+
+    def _remove_old_files(self, output_dir: str):
+        """Delete the oldest windows of any process beyond max_files"""
+        # profile-<pid>-<window start in ms>, ordered by window start
+        windows = sorted(
+            {
+                name.split(".", 1)[0] for name in os.listdir(output_dir)
+                if name.startswith("profile-") and name.endswith((".collapsed", ".pb.gz"))
+            },
+            key=lambda window: (int(window.rsplit("-", 1)[1]), window),
+        )
+        for window in windows[:max(len(windows) - self.max_files, 0)]:
+            for suffix in (".collapsed", ".pb.gz"):
+                try:
+                    os.remove(os.path.join(output_dir, window + suffix))
+                except FileNotFoundError:
+                    pass
+
+    def stats(self) -> Dict[str, float]:
+        """Sample counts and the sampler's own cost"""
+        return {
+            "samples": self.samples,
+            "dropped_samples": self.dropped_samples,
+            "passes": self.passes,
+            "mean_pass_seconds": self.sampling_time / self.passes if self.passes else 0.0,
+            "interval": self.current_interval,
+            "overhead": self.overhead,
+        }
+
+def render_collapsed(counts) -> str:
+    """
+    Render counts as collapsed stacks, one ``frames count`` line per stack.
+
+    The route is the root frame of each stack; samples of different traces
+    are summed, since the format has no labels.
+    """
+    totals: Dict[tuple, int] = {}
+    for (route, _, stack), count in counts.items():
+        key = (route, stack)
+        totals[key] = totals.get(key, 0) + count
+
+    lines = []
+    for (route, stack), count in totals.items():
+        frames = [f"route {route}" if route else "no route"] + [_frame_name(code) for code in stack]
+        lines.append(f"{';'.join(frames)} {count}")
+    lines.sort()
+    return "\n".join(lines) + ("\n" if lines else "")
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+def _field_varint(number: int, value: int) -> bytes:
+    return _varint(number << 3) + _varint(value)
+
+def _field_bytes(number: int, value: bytes) -> bytes:
+    return _varint(number << 3 | 2) + _varint(len(value)) + value
+
+def _packed(number: int, values: List[int]) -> bytes:
+    return _field_bytes(number, b"".join(_varint(value) for value in values))
+
+def render_pprof(counts, interval: float, start: float, duration: float) -> bytes:
+    """
+    Render counts as a gzipped pprof profile.
+
+    Each sample has a ``samples`` count and an estimated ``cpu`` time in
+    nanoseconds, and ``route`` and ``trace_id`` labels. Locations are
+    functions, identified by their first line.
+    """
+    strings: Dict[str, int] = {"": 0}
+
+    def string(value: str) -> int:
+        index = strings.get(value)
+        if index is None:
+            index = strings[value] = len(strings)
+        return index
+
+    functions: Dict[Any, int] = {}
+    function_messages = []
+    samples = []
+    period = int(interval * 1e9)
+    for (route, trace_id, stack), count in counts.items():
+        location_ids = []
+        for code in reversed(stack):
+            function_id = functions.get(code)
+            if function_id is None:
+                function_id = functions[code] = len(functions) + 1
+                function_messages.append(
+                    _field_varint(1, function_id)
+                    + _field_varint(2, string(_qualname(code)))
+                    + _field_varint(3, string(code.co_name))
+                    + _field_varint(4, string(code.co_filename))
+                    + _field_varint(5, code.co_firstlineno)
+                )
+            location_ids.append(function_id)
+        labels = b""
+        if route:
+            labels += _field_bytes(3, _field_varint(1, string("route")) + _field_varint(2, string(route)))
+        if trace_id:
+            labels += _field_bytes(3, _field_varint(1, string("trace_id")) + _field_varint(2, string(trace_id)))
+        samples.append(_packed(1, location_ids) + _packed(2, [count, count * period]) + labels)
+
+    profile = bytearray()
+    # sample_type: samples/count, cpu/nanoseconds
+    profile += _field_bytes(1, _field_varint(1, string("samples")) + _field_varint(2, string("count")))
+    profile += _field_bytes(1, _field_varint(1, string("cpu")) + _field_varint(2, string("nanoseconds")))
+    for sample in samples:
+        profile += _field_bytes(2, sample)
+    # One location per function, with the same ID
+    for code, function_id in functions.items():
+        line = _field_varint(1, function_id) + _field_varint(2, code.co_firstlineno)
+        profile += _field_bytes(4, _field_varint(1, function_id) + _field_bytes(4, line))
+    for message in function_messages:
+        profile += _field_bytes(5, message)
+    for value in strings:
+        profile += _field_bytes(6, value.encode("utf-8"))
+    profile += _field_varint(9, int(start * 1e9))
+    profile += _field_varint(10, int(duration * 1e9))
+    profile += _field_bytes(11, _field_varint(1, strings["cpu"]) + _field_varint(2, strings["nanoseconds"]))
+    profile += _field_varint(12, period)
+    return gzip.compress(bytes(profile))
+
+def create_profile_endpoint(sampler: StackSampler, token: str):
+    """
+    Create an endpoint serving the current profile window.
+
+    ``?format=collapsed`` returns collapsed stacks, the default is a gzipped
+    pprof profile. Requests must send ``Authorization: Bearer <token>``.
+
+    Args:
+        sampler: Stack sampler of the application
+        token: Secret token expected from callers
+    """
+    from starlette.responses import Response
+
+    from .runtime import require_token
+
+    @require_token(token)
+    async def endpoint(request):
+        counts = sampler.snapshot()
+        if request.query_params.get("format") == "collapsed":
+            return Response(render_collapsed(counts), media_type="text/plain")
+        duration = time.time() - sampler.window_start
+        return Response(
+            render_pprof(counts, sampler.interval, sampler.window_start, duration),
+            media_type="application/octet-stream",
+            headers={"Content-Disposition": 'attachment; filename="profile.pb.gz"'}
+        )
+
+    return endpoint
@@ -0,0 +1,75 @@
+"""
+Request queue time from load balancer timestamps.
+
+Load balancers and proxies can stamp the time they received a request, e.g.
+with nginx ``proxy_set_header X-Request-Start "t=${msec}";`` or the
+``X-Request-Start`` header Heroku's router sets. The difference to the time the
+request reaches the application is the time it spent queued in the load
+balancer, the server's accept backlog and the event loop. Queue time grows as
+soon as workers are saturated, before CPU usage does.
+"""
+from typing import Iterable, Optional
+
+DEFAULT_QUEUE_TIME_HEADERS = ("x-request-start", "x-queue-start")
+
+# Timestamps may be in seconds, milliseconds, microseconds or nanoseconds
+_UNIT_DIVISORS = (1, 1e3, 1e6, 1e9)
+
+def parse_request_start(value: str, now: float, max_queue_time: float = 3600.0, max_clock_skew: float = 1.0) -> Optional[float]:
+    """
+    Parse a request start header into seconds since the epoch.
+
+    Accepts values with or without a ``t=`` prefix, in seconds (with or without
+    a fraction), milliseconds, microseconds or nanoseconds; the unit is derived
+    from the magnitude. Timestamps implying a queue time above
+    ``max_queue_time`` or more than ``max_clock_skew`` in the future are
+    rejected as bogus.
+
+    Args:
+        value: Header value, e.g. "t=1700000000.123" or "1700000000123"
+        now: Current time in seconds since the epoch
+
+    Returns:
+        The request start time, or None if the value cannot be used
+    """
+    value = value.split(",", 1)[0].strip()
+    if value.startswith("t="):
+        value = value[2:]
+    try:
+        timestamp = float(value)
+    except ValueError:
+        return None
+    if timestamp <= 0:
+        return None
+
+    for divisor in _UNIT_DIVISORS:
+        start = timestamp / divisor
+        if start <= now + max_clock_skew:
+            break
+    else:
+        return None
+
+    if now - start > max_queue_time:
+        return None
+    # A start slightly in the future is clock skew between hosts
+    return min(start, now)
+
+def get_queue_time(headers, now: float, header_names: Iterable[str] = DEFAULT_QUEUE_TIME_HEADERS) -> Optional[float]:
+    """
+    Get the time in seconds a request was queued before reaching the application.
+
+    Args:
+        headers: Request headers
+        now: Time the request reached the application, in seconds since the epoch
+        header_names: Headers to read the request start from, first match wins
+
+    Returns:
+        The queue time, or None if no usable timestamp was found
+    """
+    for name in header_names:
+        value = headers.get(name)
+        if value:
+            start = parse_request_start(value, now)
+            if start is not None:
+                return now - start
+    return None
@@ -0,0 +1,374 @@
+"""
+Observability settings that can be changed while the application runs.
+
+The log level, trace sample ratio, route policy overrides and excluded
+endpoints are kept in an immutable ``RuntimeConfig`` snapshot. Readers take
+``settings.config`` once and use its fields; writers build a new snapshot and
+swap it in with a single assignment, so requests never see a half-applied
+change and the request path takes no lock.
+
+    observability.runtime.update(log_level="DEBUG", revert_after=300)
+    observability.runtime.update(route_policies={"/orders*": {"sample_ratio": 1.0}}, revert_after=300)
+
+Settings live in each process. With a ``shared_path``, changes are also
+written to a JSON file that the other workers of the service poll, so a change
+made through any one worker reaches all of them within ``poll_interval``.
+"""
+import functools
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, ContextManager, Dict, FrozenSet, Iterable, Iterator, List, Optional, Tuple, Union
+
+from .policy import RoutePolicies
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None  # type: ignore[assignment]
+
+logger = logging.getLogger(__name__)
+
+def get_level(level: Union[int, str]) -> int:
+    """Get the numeric value of a log level name or number"""
+    if isinstance(level, str):
+        value = logging.getLevelName(level.upper())
+        if not isinstance(value, int):
+            raise ValueError(f"Unknown log level: {level}")
+        return value
+    return int(level)
+
+class RuntimeConfig:
+    """
+    Immutable snapshot of the runtime settings.
+
+    Args:
+        log_level: Minimum level of log events
+        sample_ratio: Ratio of traces to sample, or None for the configured sampler
+        route_policies: Compiled route policies, including overrides
+        excluded_endpoints: Paths without access logs, as a list or a
+            comma-separated string
+    """
+
+    __slots__ = ("log_level", "sample_ratio", "route_policies", "excluded_endpoints")
+
+    def __init__(
+        self,
+        log_level: Union[int, str] = logging.INFO,
+        sample_ratio: Optional[float] = None,
+        route_policies: Optional[RoutePolicies] = None,
+        excluded_endpoints: Union[Iterable[str], str] = (),
+    ):
+        if sample_ratio is not None and not 0.0 <= sample_ratio <= 1.0:
+            raise ValueError(f"sample_ratio must be between 0 and 1, got {sample_ratio}")
+        if isinstance(excluded_endpoints, str):
+            excluded_endpoints = excluded_endpoints.split(",")
+        self.log_level = get_level(log_level)
+        self.sample_ratio = sample_ratio
+        self.route_policies = route_policies or RoutePolicies()
+        self.excluded_endpoints: FrozenSet[str] = frozenset(endpoint.strip().lstrip("/") for endpoint in excluded_endpoints)
+
+    def replace(self, **changes) -> "RuntimeConfig":
+        """
+        Get a copy with some settings changed.
+
+        ``route_policies`` is given as a mapping of route path patterns to
+        setting overrides (see ``RoutePolicies.with_overrides``).
+
+        Raises:
+            ValueError: If a setting is unknown or invalid
+        """
+        unknown = set(changes) - set(self.__slots__)
+        if unknown:
+            raise ValueError(f"Unknown runtime settings: {', '.join(sorted(unknown))}")
+
+        route_policies = self.route_policies
+        if "route_policies" in changes:
+            route_policies = route_policies.with_overrides(changes["route_policies"])
+        return RuntimeConfig(
+            log_level=changes.get("log_level", self.log_level),
+            sample_ratio=changes.get("sample_ratio", self.sample_ratio),
+            route_policies=route_policies,
+            excluded_endpoints=changes.get("excluded_endpoints", self.excluded_endpoints),
+        )
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "log_level": logging.getLevelName(self.log_level),
+            "sample_ratio": self.sample_ratio,
+            "route_policies": dict(self.route_policies.overrides),
+            "excluded_endpoints": sorted(self.excluded_endpoints),
+        }
+
+class RuntimeSettings:
+    """
+    Holder of the current RuntimeConfig of a process.
+
+    Changes are either permanent or reverted after a delay. A permanent change
+    is applied to the baseline too, so it outlives any temporary change in
+    effect; a temporary change is reverted to the baseline by a timer thread.
+
+    With ``shared_path``, the baseline, the current config and the revert time
+    are written to that file on every change, under an advisory lock, after
+    first applying any newer state from the file. ``start()`` runs a thread
+    polling the file's modification time in each worker and applying changes
+    written by the others. Reverts are scheduled at the same wall clock time
+    in every worker.
+
+    Args:
+        shared_path: JSON file shared by the workers of a service, or None to
+            keep settings per process
+        poll_interval: Seconds between checks of the shared file
+        **settings: Initial RuntimeConfig arguments, which become the baseline
+    """
+
+    def __init__(self, shared_path: Optional[str] = None, poll_interval: float = 1.0, **settings):
+        self.baseline = RuntimeConfig(**settings)
+        self.config = self.baseline
+        # Wall clock time at which the current config is reverted
+        self.revert_at: Optional[float] = None
+        self.shared_path = shared_path
+        self.poll_interval = poll_interval
+        self._listeners: List[Callable[[RuntimeConfig], None]] = []
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        # Inode and modification time of the shared file last applied
+        self._shared_version: Optional[Tuple[int, int]] = None
+        self._watcher_pid: Optional[int] = None
+
+    def add_listener(self, listener: Callable[[RuntimeConfig], None]):
+        """Call a function with the new config whenever it changes"""
+        self._listeners.append(listener)
+
+    def compile(self, routes):
+        """Compile the route policies of the baseline and the current config"""
+        self.baseline.route_policies.compile(routes)
+        self.config.route_policies.compile(routes)
+
+    def update(self, revert_after: Optional[float] = None, **changes) -> RuntimeConfig:
+        """
+        Change some settings of the current config.
+
+        Args:
+            revert_after: Seconds after which the current config is reverted to
+                the baseline, or None to make the change permanent
+            **changes: ``log_level``, ``sample_ratio``, ``route_policies``
+                and/or ``excluded_endpoints``
+
+        Returns:
+            The new current config
+
+        Raises:
+            ValueError: If a setting is unknown or invalid
+        """
+        if revert_after is not None and revert_after <= 0:
+            raise ValueError(f"revert_after must be positive, got {revert_after}")
+
+        with self._lock, self._shared_lock():
+            self._load_shared()
+            config = self.config.replace(**changes)
+            if revert_after is None:
+                self.baseline = self.baseline.replace(**changes)
+            else:
+                self._schedule_revert(time.time() + revert_after)
+            self._apply(config)
+            self._store_shared()
+        return config
+
+    def reset(self) -> RuntimeConfig:
+        """Revert the current config to the baseline"""
+        with self._lock, self._shared_lock():
+            self._load_shared()
+            self._cancel_revert()
+            self._apply(self.baseline)
+            self._store_shared()
+        return self.baseline
+
+    def sync(self):
+        """Apply the settings in the shared file if another process changed them"""
+        if self.shared_path is None:
+            return
+        with self._lock:
+            self._load_shared()
+
+    def start(self):
+        """Apply the shared settings and start polling them in the current process
+
+        Does nothing without a ``shared_path``. Calling it again in the same
+        process is a no-op; after a fork it starts a new polling thread.
+        """
+        if self.shared_path is None or self._watcher_pid == os.getpid():
+            return
+        # Read the file even if unchanged, to restart a revert timer lost in a fork
+        self._shared_version = None
+        self.sync()
+        self._watcher_pid = os.getpid()
+        thread = threading.Thread(target=self._poll_loop, name="runtime-settings", daemon=True)
+        thread.start()
+
+    def stop(self):
+        """Stop polling the shared settings"""
+        self._watcher_pid = None
+
+    def _poll_loop(self):
+        pid = os.getpid()
+        while self._watcher_pid == pid:
+            time.sleep(self.poll_interval)
+            try:
+                self.sync()
+            except Exception:
+                logger.exception("Failed to apply shared runtime settings from %s", self.shared_path)
+
+    def _shared_lock(self) -> ContextManager[None]:
+        """Lock the shared file against changes by other processes"""
+        if self.shared_path is None or fcntl is None:
+            return nullcontext()
+        return _file_lock(self.shared_path + ".lock")
+
+    def _load_shared(self):
+        if self.shared_path is None:
+            return
+        try:
+            stat = os.stat(self.shared_path)
+        except FileNotFoundError:
+            return
+        version = (stat.st_ino, stat.st_mtime_ns)
+        if version == self._shared_version:
+            return
+        with open(self.shared_path) as f:
+            state = json.load(f)
+        self._shared_version = version
+
+        # Each snapshot holds every setting, so replace() yields it whole
+        baseline = self.baseline.replace(**state["baseline"])
+        revert_at = state.get("revert_at")
+        self.baseline = baseline
+        if revert_at is not None and revert_at > time.time():
+            self._schedule_revert(revert_at)
+            self._apply(baseline.replace(**state["config"]))
+        else:
+            self._cancel_revert()
+            self._apply(baseline)
+
+    def _store_shared(self):
+        if self.shared_path is None:
+            return
+        state = {
+            "baseline": _settings_of(self.baseline),
+            "config": _settings_of(self.config),
+            "revert_at": self.revert_at,
+        }
+        # Written to a temporary file and renamed, so readers never see a partial file
+        temporary_path = f"{self.shared_path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w") as f:
+            json.dump(state, f)
+        os.replace(temporary_path, self.shared_path)
+        stat = os.stat(self.shared_path)
+        self._shared_version = (stat.st_ino, stat.st_mtime_ns)
+
+    def _apply(self, config: RuntimeConfig):
+        self.config = config
+        for listener in self._listeners:
+            listener(config)
+
+    def _schedule_revert(self, revert_at: float):
+        self._cancel_revert()
+        timer = threading.Timer(max(revert_at - time.time(), 0.0), self._revert)
+        timer.daemon = True
+        self._timer = timer
+        self.revert_at = revert_at
+        timer.start()
+
+    def _cancel_revert(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = None
+        self.revert_at = None
+
+    def _revert(self):
+        # Every worker reverts on its own timer; the shared file is not
+        # rewritten, since its revert time has passed for all of them
+        with self._lock:
+            # A later change may have rescheduled or cancelled the revert
+            if self._timer is not threading.current_thread():
+                return
+            self._timer = None
+            self.revert_at = None
+            self._apply(self.baseline)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {**self.config.as_dict(), "revert_at": self.revert_at, "pid": os.getpid()}
+
+def _settings_of(config: RuntimeConfig) -> Dict[str, Any]:
+    """Get the settings of a config as RuntimeConfig.replace() arguments"""
+    settings = config.as_dict()
+    settings["log_level"] = config.log_level
+    return settings
+
+@contextmanager
+def _file_lock(path: str) -> Iterator[None]:
+    """Hold an exclusive advisory lock on a file while the block runs"""
+    with open(path, "a") as lock_file:
+        # Closing the file releases the lock
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+def require_token(token: str) -> Callable:
+    """
+    Decorate an admin endpoint to answer 401 unless the request sends
+    ``Authorization: Bearer <token>``.
+
+    The header is compared in constant time.
+
+    Args:
+        token: Secret token expected from callers
+    """
+    from starlette.responses import JSONResponse
+
+    expected = f"Bearer {token}".encode()
+
+    def decorator(endpoint):
+        @functools.wraps(endpoint)
+        async def authorized(request):
+            authorization = request.headers.get("authorization", "").encode()
+            if not hmac.compare_digest(authorization, expected):
+                return JSONResponse({"error": "unauthorized"}, status_code=401)
+            return await endpoint(request)
+
+        return authorized
+
+    return decorator
+
+def create_admin_endpoint(settings: RuntimeSettings, token: str):
+    """
+    Create an endpoint that reads and changes the runtime settings.
+
+    ``GET`` returns the current settings, ``PUT`` applies the settings in the
+    JSON body (plus an optional ``revert_after``) and ``DELETE`` reverts to
+    the baseline. Requests must send ``Authorization: Bearer <token>``.
+
+    Args:
+        settings: Runtime settings of the application
+        token: Secret token expected from callers
+    """
+    from starlette.responses import JSONResponse
+
+    @require_token(token)
+    async def endpoint(request):
+        if request.method == "PUT":
+            try:
+                changes = json.loads(await request.body() or b"{}")
+                if not isinstance(changes, dict):
+                    raise ValueError("Expected a JSON object")
+                settings.update(**changes)
+            except (ValueError, TypeError) as e:
+                return JSONResponse({"error": str(e)}, status_code=400)
+        elif request.method == "DELETE":
+            settings.reset()
+        return JSONResponse(settings.as_dict())
+
+    return endpoint
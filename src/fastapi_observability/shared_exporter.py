@@ -0,0 +1,313 @@
+"""
+Per-host shared span exporter.
+
+With many worker processes per host, each running its own BatchSpanProcessor
+and OTLP gRPC channel, CPU, memory and collector connections grow with the
+worker count. In shared exporter mode workers encode finished spans as OTLP
+protobuf and hand them to one local exporter process over a Unix domain socket.
+That process merges the payloads of all workers into large batches and exports
+them gzip-compressed over a single gRPC channel.
+
+Run the exporter process next to the workers:
+
+    python -m fastapi_observability.shared_exporter \\
+        --socket /tmp/otel-spans.sock --endpoint http://otel-collector:4317
+
+and pass ``shared_exporter_socket="/tmp/otel-spans.sock"`` to FastAPIObservability.
+Spooling to disk is configured on the exporter process with ``--spool-dir``;
+its spool metrics are served with ``--metrics-port``.
+"""
+import argparse
+import logging
+import os
+import signal
+import socket
+import struct
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, List, Optional, Sequence, Tuple
+from opentelemetry.sdk.trace import ReadableSpan
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+
+from .otlp import OTLPTraceSender, encode_spans_request
+from .spool import SpanSpool, SpoolingSender
+
+logger = logging.getLogger(__name__)
+
+# Each frame is a header (payload length, span count) followed by a serialized
+# ExportTraceServiceRequest.
+_FRAME_HEADER = struct.Struct(">II")
+
+class SharedSpanExporter(SpanExporter):
+    """
+    Span exporter that hands encoded spans to the shared exporter process.
+
+    The socket connection is opened lazily and reopened after a fork or a
+    broken connection, so the exporter is safe to create before workers fork.
+    """
+
+    def __init__(self, socket_path: str, timeout: float = 5.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._sock: Optional[socket.socket] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self._sock = sock
+        self._pid = os.getpid()
+        return sock
+
+    def _close(self):
+        if self._sock is not None and self._pid == os.getpid():
+            self._sock.close()
+        self._sock = None
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        payload = encode_spans_request(spans)
+        frame = _FRAME_HEADER.pack(len(payload), len(spans)) + payload
+
+        with self._lock:
+            try:
+                sock = self._sock
+                if sock is None or self._pid != os.getpid():
+                    self._close()
+                    sock = self._connect()
+                sock.sendall(frame)
+            except OSError as e:
+                logger.warning("Failed to hand spans to shared exporter at %s: %s", self.socket_path, e)
+                self._close()
+                return SpanExportResult.FAILURE
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        with self._lock:
+            self._close()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return True
+
+class SharedExporterServer:
+    """
+    Host-side exporter that receives encoded spans from workers and exports them.
+
+    Payloads from all connections are merged by byte concatenation into batches
+    of at most ``max_batch_bytes`` and sent every ``flush_interval`` seconds, or
+    sooner once a batch is full. If more than ``max_queue_bytes`` are waiting
+    (e.g. the collector is down) new payloads are dropped.
+
+    Args:
+        socket_path: Unix domain socket path the workers connect to
+        otlp_endpoint: OTLP gRPC endpoint of the collector
+        max_batch_bytes: Maximum size of one export request
+        flush_interval: Maximum time in seconds a payload waits before export
+        max_queue_bytes: Maximum number of bytes waiting for export
+        compression: Whether to gzip export requests
+        sender: Optional sender, defaults to an OTLPTraceSender for otlp_endpoint
+        spool_dir: Directory for spooling batches to disk while the collector is
+            unavailable, instead of dropping them
+        spool_max_bytes: Maximum disk usage of the spool
+        metrics_port: Port to serve the ``otel_span_spool_*`` metrics of the
+            spool on, or None to not serve metrics
+    """
+
+    def __init__(
+        self,
+        socket_path: str,
+        otlp_endpoint: str = "http://localhost:4317",
+        max_batch_bytes: int = 3 * 1024 * 1024,
+        flush_interval: float = 1.0,
+        max_queue_bytes: int = 64 * 1024 * 1024,
+        compression: bool = True,
+        sender: Optional[OTLPTraceSender] = None,
+        spool_dir: Optional[str] = None,
+        spool_max_bytes: int = 256 * 1024 * 1024,
+        metrics_port: Optional[int] = None,
+    ):
+        self.socket_path = socket_path
+        self.max_batch_bytes = max_batch_bytes
+        self.flush_interval = flush_interval
+        self.max_queue_bytes = max_queue_bytes
+        self.sender = sender or OTLPTraceSender(otlp_endpoint, compression=compression)
+        self.metrics_port = metrics_port
+        # Batches go through the spooling sender, which needs their span count
+        self.spooling_sender: Optional[SpoolingSender] = None
+        if spool_dir:
+            self.spooling_sender = SpoolingSender(self.sender, SpanSpool(spool_dir, max_bytes=spool_max_bytes))
+
+        self.received_payloads = 0
+        self.exported_payloads = 0
+        self.dropped_payloads = 0
+        self.failed_exports = 0
+
+        # Payloads and their span counts
+        self._pending: Deque[Tuple[bytes, int]] = deque()
+        self._pending_bytes = 0
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._listener: Optional[socket.socket] = None
+        self._metrics_server: Any = None
+        self._threads: List[threading.Thread] = []
+
+    @property
+    def spool(self) -> Optional[SpanSpool]:
+        """SpanSpool of the server, or None without a spool directory"""
+        return self.spooling_sender.spool if self.spooling_sender is not None else None
+
+    def start(self):
+        """Bind the socket and start the accept and export threads"""
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(self.socket_path)
+        self._listener.listen(128)
+
+        if self.metrics_port is not None:
+            from prometheus_client import CollectorRegistry, start_http_server
+            from .metrics import SpanSpoolCollector
+            registry = CollectorRegistry()
+            registry.register(SpanSpoolCollector(lambda: [self.spool] if self.spool is not None else []))
+            self._metrics_server, _ = start_http_server(self.metrics_port, registry=registry)
+
+        for target, name in ((self._accept_loop, "accept"), (self._export_loop, "export")):
+            thread = threading.Thread(target=target, name=f"shared-exporter-{name}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0):
+        """Stop accepting spans and export what is still pending within the deadline"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._listener is not None:
+            # shutdown() wakes up the thread blocked in accept(), close() alone does not
+            try:
+                self._listener.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._listener.close()
+        for thread in self._threads:
+            thread.join(timeout)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        if self._metrics_server is not None:
+            self._metrics_server.shutdown()
+        if self.spooling_sender is not None:
+            self.spooling_sender.close()
+        else:
+            self.sender.close()
+
+    def serve_forever(self):
+        """Run until SIGTERM or SIGINT"""
+        stopped = threading.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *_: stopped.set())
+        self.start()
+        stopped.wait()
+        self.stop()
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn, _ = self._listener.accept()
+            except OSError:
+                return
+            thread = threading.Thread(target=self._read_loop, args=(conn,), name="shared-exporter-reader", daemon=True)
+            thread.start()
+
+    def _read_loop(self, conn):
+        with conn, conn.makefile("rb") as stream:
+            while True:
+                header = stream.read(_FRAME_HEADER.size)
+                if len(header) < _FRAME_HEADER.size:
+                    return
+                length, span_count = _FRAME_HEADER.unpack(header)
+                payload = stream.read(length)
+                if len(payload) < length:
+                    return
+                self._enqueue(payload, span_count)
+
+    def _enqueue(self, payload: bytes, span_count: int):
+        with self._condition:
+            self.received_payloads += 1
+            if self._pending_bytes + len(payload) > self.max_queue_bytes:
+                self.dropped_payloads += 1
+                return
+            self._pending.append((payload, span_count))
+            self._pending_bytes += len(payload)
+            if self._pending_bytes >= self.max_batch_bytes:
+                self._condition.notify()
+
+    def _take_batch(self) -> List[Tuple[bytes, int]]:
+        """Take pending payloads up to max_batch_bytes, always at least one"""
+        batch: List[Tuple[bytes, int]] = []
+        size = 0
+        while self._pending and (not batch or size + len(self._pending[0][0]) <= self.max_batch_bytes):
+            payload, span_count = self._pending.popleft()
+            batch.append((payload, span_count))
+            size += len(payload)
+        self._pending_bytes -= size
+        return batch
+
+    def _export_loop(self):
+        while True:
+            with self._condition:
+                deadline = time.monotonic() + self.flush_interval
+                while not self._stopping and self._pending_bytes < self.max_batch_bytes:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                batch = self._take_batch()
+                stopping = self._stopping and not self._pending
+
+            if batch:
+                self._export(batch)
+            if stopping:
+                return
+
+    def _export(self, batch: List[Tuple[bytes, int]]):
+        payload = b"".join(payload for payload, _ in batch)
+        if self.spooling_sender is not None:
+            sent = self.spooling_sender.send(payload, sum(span_count for _, span_count in batch))
+        else:
+            sent = self.sender.send(payload)
+        if sent:
+            self.exported_payloads += len(batch)
+        else:
+            self.failed_exports += 1
+            self.dropped_payloads += len(batch)
+            logger.warning("Failed to export %d span payloads to %s", len(batch), self.sender.endpoint)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-host shared span exporter for FastAPIObservability workers")
+    parser.add_argument("--socket", required=True, help="Unix domain socket path the workers connect to")
+    parser.add_argument("--endpoint", default="http://localhost:4317", help="OTLP gRPC endpoint of the collector")
+    parser.add_argument("--max-batch-bytes", type=int, default=3 * 1024 * 1024)
+    parser.add_argument("--flush-interval", type=float, default=1.0)
+    parser.add_argument("--max-queue-bytes", type=int, default=64 * 1024 * 1024)
+    parser.add_argument("--no-compression", action="store_true")
+    parser.add_argument("--spool-dir", help="spool batches to this directory while the collector is unavailable")
+    parser.add_argument("--spool-max-bytes", type=int, default=256 * 1024 * 1024)
+    parser.add_argument("--metrics-port", type=int, help="serve the spool metrics for Prometheus on this port")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format="%(asctime)s %(levelname)s %(message)s", level=logging.INFO)
+    SharedExporterServer(
+        socket_path=args.socket,
+        otlp_endpoint=args.endpoint,
+        max_batch_bytes=args.max_batch_bytes,
+        flush_interval=args.flush_interval,
+        max_queue_bytes=args.max_queue_bytes,
+        compression=not args.no_compression,
+        spool_dir=args.spool_dir,
+        spool_max_bytes=args.spool_max_bytes,
+        metrics_port=args.metrics_port,
+    ).serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,402 @@
+"""
+Disk-spooled span buffer for collector outages.
+
+When the collector is slow or down, BatchSpanProcessor fills its in-memory
+queue and starts dropping spans, exactly when traces are needed most. With a
+spool, payloads that fail to export and spans that would overflow the queue
+are appended to segment files on local disk instead. They are replayed in
+order, at a bounded rate, once the collector accepts exports again.
+
+Each process claims its own slot directory under the spool directory with an
+advisory lock. When a worker dies its lock is released, and the next worker to
+start takes the slot over and replays whatever was left in it.
+"""
+import builtins
+import logging
+import os
+import struct
+import threading
+import zlib
+from collections import deque
+from typing import BinaryIO, Deque, List, Optional, Sequence, Tuple
+from opentelemetry.sdk.trace import ReadableSpan, SpanProcessor
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter, SpanExportResult
+
+from .otlp import OTLPTraceSender, encode_spans_request
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None  # type: ignore[assignment]
+
+logger = logging.getLogger(__name__)
+
+# Each record is a header (payload length, span count, CRC32 of the payload)
+# followed by a serialized ExportTraceServiceRequest.
+_RECORD_HEADER = struct.Struct(">III")
+_SEGMENT_SUFFIX = ".seg"
+
+class SpanSpool:
+    """
+    Bounded, segment-rotated on-disk queue of encoded span payloads.
+
+    Records are appended to the newest segment and read from the oldest one.
+    Fully read segments are deleted. When the spool grows beyond ``max_bytes``
+    the oldest segments are dropped. Writes are not fsynced: spooled spans
+    survive a process crash but not necessarily a power loss.
+
+    Args:
+        directory: Spool directory, shared by all workers of a service
+        max_bytes: Maximum disk usage of this process's spool
+        segment_bytes: Size at which a new segment file is started
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 256 * 1024 * 1024, segment_bytes: int = 8 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = min(segment_bytes, max(max_bytes // 2, 1))
+
+        self.spooled_spans = 0
+        self.replayed_spans = 0
+        self.dropped_spans = 0
+        self.dropped_bytes = 0
+
+        self._lock = threading.Lock()
+        self._slot_dir, self._lock_file = self._claim_slot(directory)
+
+        # Per segment: [sequence number, size in bytes, unread records, unread spans]
+        self._segments: Deque[List[int]] = deque()
+        for name in sorted(os.listdir(self._slot_dir)):
+            if name.endswith(_SEGMENT_SUFFIX):
+                self._segments.append(self._scan_segment(int(name[:-len(_SEGMENT_SUFFIX)])))
+        self._next_seq = self._segments[-1][0] + 1 if self._segments else 0
+
+        self._write_file: Optional[BinaryIO] = None
+        self._read_file: Optional[BinaryIO] = None
+        self._read_seq: Optional[int] = None
+        self._peeked: Optional[Tuple[bytes, int]] = None
+
+    @staticmethod
+    def _claim_slot(directory: str):
+        """Lock the first slot directory not held by another live process"""
+        index = 0
+        while True:
+            slot_dir = os.path.join(directory, f"slot-{index}")
+            os.makedirs(slot_dir, exist_ok=True)
+            lock_file = open(os.path.join(slot_dir, ".lock"), "a")
+            if fcntl is None:
+                return slot_dir, lock_file
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return slot_dir, lock_file
+            except BlockingIOError:
+                lock_file.close()
+                index += 1
+
+    def _segment_path(self, seq: int) -> str:
+        return os.path.join(self._slot_dir, f"{seq:012d}{_SEGMENT_SUFFIX}")
+
+    def _scan_segment(self, seq: int):
+        """Count the records of a segment left over from a previous process"""
+        records = spans = 0
+        with open(self._segment_path(seq), "rb") as segment:
+            while True:
+                header = segment.read(_RECORD_HEADER.size)
+                if len(header) < _RECORD_HEADER.size:
+                    break
+                length, span_count, _ = _RECORD_HEADER.unpack(header)
+                segment.seek(length, os.SEEK_CUR)
+                records += 1
+                spans += span_count
+        return [seq, os.path.getsize(self._segment_path(seq)), records, spans]
+
+    @property
+    def bytes(self) -> int:
+        """Disk usage of the spool in bytes"""
+        return sum(segment[1] for segment in self._segments)
+
+    @property
+    def segments(self) -> int:
+        """Number of segment files"""
+        return len(self._segments)
+
+    @property
+    def pending_payloads(self) -> int:
+        """Number of payloads waiting to be replayed"""
+        return sum(segment[2] for segment in self._segments)
+
+    @property
+    def pending_spans(self) -> int:
+        """Number of spans waiting to be replayed"""
+        return sum(segment[3] for segment in self._segments)
+
+    # builtins.bytes, since the bytes property shadows the type in the class body
+    def append(self, payload: builtins.bytes, span_count: int = 0):
+        """Append an encoded payload to the newest segment"""
+        record = _RECORD_HEADER.pack(len(payload), span_count, zlib.crc32(payload)) + payload
+        with self._lock:
+            write_file = self._write_file
+            if write_file is None or self._segments[-1][1] + len(record) > self.segment_bytes:
+                write_file = self._rotate()
+            write_file.write(record)
+            write_file.flush()
+
+            segment = self._segments[-1]
+            segment[1] += len(record)
+            segment[2] += 1
+            segment[3] += span_count
+            self.spooled_spans += span_count
+
+            while self.bytes > self.max_bytes and len(self._segments) > 1:
+                self._drop_oldest()
+
+    def _rotate(self) -> BinaryIO:
+        if self._write_file is not None:
+            self._write_file.close()
+        seq = self._next_seq
+        self._next_seq += 1
+        self._write_file = write_file = open(self._segment_path(seq), "ab")
+        self._segments.append([seq, 0, 0, 0])
+        return write_file
+
+    def _drop_oldest(self):
+        seq, size, _, spans = self._segments.popleft()
+        if self._read_seq == seq:
+            self._close_reader()
+        self.dropped_spans += spans
+        self.dropped_bytes += size
+        os.unlink(self._segment_path(seq))
+        logger.warning("Span spool over %d bytes, dropped segment with %d spans", self.max_bytes, spans)
+
+    def _close_reader(self):
+        if self._read_file is not None:
+            self._read_file.close()
+        self._read_file = None
+        self._read_seq = None
+        self._peeked = None
+
+    def _finish_oldest(self):
+        """Delete the fully read oldest segment"""
+        seq = self._segments.popleft()[0]
+        self._close_reader()
+        if self._write_file is not None and not self._segments:
+            self._write_file.close()
+            self._write_file = None
+        os.unlink(self._segment_path(seq))
+
+    def peek(self):
+        """Return the oldest unread (payload, span_count), or None if the spool is empty"""
+        with self._lock:
+            while self._segments:
+                if self._peeked is not None:
+                    return self._peeked[0], self._peeked[1]
+
+                seq = self._segments[0][0]
+                if self._read_seq != seq:
+                    self._close_reader()
+                    self._read_file = open(self._segment_path(seq), "rb")
+                    self._read_seq = seq
+
+                header = self._read_file.read(_RECORD_HEADER.size)
+                if len(header) == _RECORD_HEADER.size:
+                    length, span_count, crc = _RECORD_HEADER.unpack(header)
+                    payload = self._read_file.read(length)
+                    if len(payload) == length and zlib.crc32(payload) == crc:
+                        self._peeked = (payload, span_count)
+                        continue
+
+                # End of the segment, or a torn or corrupted record after which
+                # the rest of the segment is unusable. Appends happen under the
+                # same lock, so anything still counted as unread is lost.
+                self.dropped_spans += self._segments[0][3]
+                self._finish_oldest()
+            return None
+
+    def commit(self):
+        """Mark the payload returned by the last peek() as replayed"""
+        with self._lock:
+            if self._peeked is None:
+                return
+            span_count = self._peeked[1]
+            self._peeked = None
+            self._segments[0][2] -= 1
+            self._segments[0][3] -= span_count
+            self.replayed_spans += span_count
+
+    def close(self):
+        with self._lock:
+            self._close_reader()
+            if self._write_file is not None:
+                self._write_file.close()
+                self._write_file = None
+            self._lock_file.close()
+
+class SpoolingSender:
+    """
+    Sender that spools payloads to disk while the collector is unavailable.
+
+    Has the same ``send()`` interface as OTLPTraceSender. After a failed
+    export, new payloads go straight to the spool so no time is spent waiting
+    on a collector that is down. A background thread replays the spool in order
+    at no more than ``replay_rate`` payloads per second, backing off
+    exponentially while exports keep failing. New payloads keep going to the
+    spool, behind the older ones, until it is empty, so the backlog drains only
+    if ``replay_rate`` exceeds the rate of new payloads.
+    """
+
+    def __init__(self, sender: OTLPTraceSender, spool: SpanSpool, replay_rate: float = 20.0, max_backoff: float = 30.0):
+        self.sender = sender
+        self.spool = spool
+        self.endpoint = sender.endpoint
+        self.replay_rate = replay_rate
+        self.max_backoff = max_backoff
+
+        self._healthy = True
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._replay_loop, name="span-spool-replay", daemon=True)
+        self._thread.start()
+
+    def send(self, payload: bytes, span_count: int = 0) -> bool:
+        """Send a payload, spooling it if the collector is unavailable or a backlog remains"""
+        # A payload being replayed stays pending until committed
+        if self._healthy and not self.spool.pending_payloads and self.sender.send(payload):
+            return True
+        self._healthy = False
+        self.spool_payload(payload, span_count)
+        return True
+
+    def spool_payload(self, payload: bytes, span_count: int = 0):
+        """Spool a payload without trying to send it first"""
+        self.spool.append(payload, span_count)
+        self._wakeup.set()
+
+    def _replay_loop(self):
+        backoff = 1.0
+        while not self._stopping.is_set():
+            record = self.spool.peek()
+            if record is None:
+                if self._wakeup.wait(1.0):
+                    self._wakeup.clear()
+                continue
+
+            if self.sender.send(record[0]):
+                self.spool.commit()
+                self._healthy = True
+                backoff = 1.0
+                self._stopping.wait(1.0 / self.replay_rate)
+            else:
+                self._healthy = False
+                self._stopping.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+    def close(self, timeout: float = 5.0):
+        self._stopping.set()
+        self._wakeup.set()
+        self._thread.join(timeout)
+        self.sender.close()
+        self.spool.close()
+
+class SpoolingSpanExporter(SpanExporter):
+    """Span exporter that sends OTLP payloads through a SpoolingSender"""
+
+    def __init__(self, sender: SpoolingSender):
+        self.sender = sender
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        self.sender.send(encode_spans_request(spans), len(spans))
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        self.sender.close()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return True
+
+class _QueueAccountingExporter(SpanExporter):
+    """Tells a SpoolingSpanProcessor how many queued spans have been exported"""
+
+    def __init__(self, processor: "SpoolingSpanProcessor"):
+        self._processor = processor
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        with self._processor._queued_lock:
+            self._processor._queued -= len(spans)
+        return self._processor.exporter.export(spans)
+
+    def shutdown(self):
+        self._processor.exporter.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self._processor.exporter.force_flush(timeout_millis)
+
+class SpoolingSpanProcessor(SpanProcessor):
+    """
+    Batch span processor that spools spans instead of dropping them on overflow.
+
+    Spans are batched by a regular BatchSpanProcessor. Once ``max_queue_size``
+    spans are waiting, further spans are collected in batches of
+    ``overflow_batch_size`` and appended to the spool directly.
+    """
+
+    def __init__(self, exporter: SpoolingSpanExporter, max_queue_size: int = 2048, overflow_batch_size: int = 128, **kwargs):
+        self.exporter = exporter
+        self.spool = exporter.sender.spool
+        self.max_queue_size = max_queue_size
+        self.overflow_batch_size = overflow_batch_size
+        # Spans handed to the batch processor and not exported yet
+        self._queued = 0
+        self._queued_lock = threading.Lock()
+        self._overflow: List[ReadableSpan] = []
+        self._overflow_lock = threading.Lock()
+        self._processor = BatchSpanProcessor(_QueueAccountingExporter(self), max_queue_size=max_queue_size, **kwargs)
+
+    def on_start(self, span, parent_context=None):
+        self._processor.on_start(span, parent_context=parent_context)
+
+    def on_end(self, span: ReadableSpan):
+        if not span.context.trace_flags.sampled:
+            return
+        with self._queued_lock:
+            queued = self._queued < self.max_queue_size
+            if queued:
+                self._queued += 1
+        if queued:
+            self._processor.on_end(span)
+            return
+
+        with self._overflow_lock:
+            self._overflow.append(span)
+            if len(self._overflow) < self.overflow_batch_size:
+                return
+            overflow, self._overflow = self._overflow, []
+        self.exporter.sender.spool_payload(encode_spans_request(overflow), len(overflow))
+
+    def _spool_overflow(self):
+        with self._overflow_lock:
+            overflow, self._overflow = self._overflow, []
+        if overflow:
+            self.exporter.sender.spool_payload(encode_spans_request(overflow), len(overflow))
+
+    def shutdown(self):
+        self._spool_overflow()
+        self._processor.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        self._spool_overflow()
+        return self._processor.force_flush(timeout_millis)
+
+def create_spooling_processor(
+    otlp_endpoint: str,
+    spool_dir: str,
+    max_bytes: int = 256 * 1024 * 1024,
+    replay_rate: float = 20.0,
+    sender: Optional[OTLPTraceSender] = None,
+) -> SpoolingSpanProcessor:
+    """Create a span processor exporting to otlp_endpoint with a disk spool in spool_dir"""
+    spooling_sender = SpoolingSender(
+        sender or OTLPTraceSender(otlp_endpoint),
+        SpanSpool(spool_dir, max_bytes=max_bytes),
+        replay_rate=replay_rate,
+    )
+    return SpoolingSpanProcessor(SpoolingSpanExporter(spooling_sender))
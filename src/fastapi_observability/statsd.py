@@ -0,0 +1,229 @@
+"""
+Aggregated StatsD/DogStatsD emission for deployments that cannot be scraped.
+
+Sending a UDP packet per observation costs a system call on every request.
+Instead, StatsDEmitter aggregates in process: counters are summed per metric
+and tag set, and timings are kept per metric and tag set up to a sample
+limit, beyond which a uniform reservoir sample is kept and sent with its
+sample rate so the server scales counts back up. A background thread flushes
+the aggregates every ``flush_interval`` seconds as newline-separated lines
+packed into datagrams of at most ``max_packet_size`` bytes.
+
+With the DogStatsD protocol, lines carry tags and all timing values of a
+metric share one line (``name:1.2:3.4|d|@0.5|#tag:value``). With plain
+StatsD, tags are not sent and each timing value is a line of its own.
+"""
+import logging
+import os
+import random
+import socket
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_NAME_TRANSLATION = str.maketrans({":": "_", "|": "_", "@": "_", "\n": "_"})
+_TAG_TRANSLATION = str.maketrans({",": "_", "|": "_", "#": "_", "\n": "_"})
+
+def _format_value(value: float) -> str:
+    return format(value, ".6g") if isinstance(value, float) else str(value)
+
+class StatsDEmitter:
+    """
+    In-process aggregation of counters and timings, flushed over UDP.
+
+    Recording only takes a lock and updates a dict. The flush thread is
+    started in each process by ``start()``; ``stop()`` sends what is left.
+
+    Args:
+        host: StatsD server or agent host
+        port: StatsD server or agent UDP port
+        prefix: Prefix of all metric names, joined with a dot
+        tags: Tags added to every metric (DogStatsD only)
+        protocol: "dogstatsd" or "statsd"
+        flush_interval: Seconds between flushes
+        max_packet_size: Maximum datagram payload in bytes
+        max_samples: Timing values kept per metric and tag set per interval
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8125,
+        prefix: str = "",
+        tags: Optional[Dict[str, str]] = None,
+        protocol: str = "dogstatsd",
+        flush_interval: float = 10.0,
+        max_packet_size: int = 1432,
+        max_samples: int = 1000,
+    ):
+        if protocol not in ("dogstatsd", "statsd"):
+            raise ValueError(f"Unknown StatsD protocol {protocol!r}, expected 'dogstatsd' or 'statsd'")
+        if flush_interval <= 0:
+            raise ValueError("flush_interval must be positive")
+        if max_packet_size < 64:
+            raise ValueError("max_packet_size must be at least 64 bytes")
+        self.host = host
+        self.port = port
+        self.prefix = f"{prefix.translate(_NAME_TRANSLATION)}." if prefix else ""
+        self.protocol = protocol
+        self.flush_interval = flush_interval
+        self.max_packet_size = max_packet_size
+        self.max_samples = max_samples
+        self.global_tags = self._format_tags((tags or {}).items())
+
+        # (name, formatted tags) -> sum
+        self._counters: Dict[Tuple[str, str], float] = {}
+        # (name, formatted tags) -> [observations seen, kept values]
+        self._timings: Dict[Tuple[str, str], list] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._socket: Optional[socket.socket] = None
+        self._pid: Optional[int] = None
+
+        self.packets_sent = 0
+        self.send_errors = 0
+
+    @staticmethod
+    def _format_tags(tags: Iterable[Tuple[str, str]]) -> str:
+        return ",".join(f"{key}:{value}".translate(_TAG_TRANSLATION) for key, value in tags)
+
+    def _key(self, name: str, tags: Optional[Dict[str, str]]) -> Tuple[str, str]:
+        if self.protocol == "statsd" or not tags:
+            return name, ""
+        return name, self._format_tags(tags.items())
+
+    def increment(self, name: str, value: float = 1, tags: Optional[Dict[str, str]] = None):
+        """Add to a counter"""
+        key = self._key(name, tags)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def timing(self, name: str, seconds: float, tags: Optional[Dict[str, str]] = None):
+        """Record a duration, sent in milliseconds"""
+        key = self._key(name, tags)
+        value = seconds * 1000
+        with self._lock:
+            timing = self._timings.get(key)
+            if timing is None:
+                self._timings[key] = [1, [value]]
+                return
+            timing[0] += 1
+            values = timing[1]
+            if len(values) < self.max_samples:
+                values.append(value)
+            else:
+                # Reservoir sampling keeps a uniform sample of the interval
+                index = random.randrange(timing[0])
+                if index < self.max_samples:
+                    values[index] = value
+
+    @property
+    def running(self) -> bool:
+        """Whether the flush thread runs in the current process"""
+        return self._pid == os.getpid() and self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start the flush thread in the current process, if not already running"""
+        if self.running:
+            return
+        if self._pid != os.getpid():
+            # Aggregates inherited across a fork were the parent's to send
+            with self._lock:
+                self._counters = {}
+                self._timings = {}
+            self._socket = None
+        self._pid = os.getpid()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="statsd-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the flush thread and send the remaining aggregates"""
+        thread = self._thread
+        if not self.running or thread is None:
+            return
+        self._stop.set()
+        thread.join(timeout)
+        self._thread = None
+        self.flush()
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """Send and reset the aggregates of the current interval"""
+        with self._lock:
+            counters, self._counters = self._counters, {}
+            timings, self._timings = self._timings, {}
+        lines = self.render(counters, timings)
+        for packet in self.pack(lines):
+            self._send(packet)
+
+    def render(self, counters: Dict[Tuple[str, str], float], timings: Dict[Tuple[str, str], list]) -> List[str]:
+        """Render aggregates as protocol lines"""
+        lines = []
+        for (name, tags), total in counters.items():
+            lines.append(self._line(name, [_format_value(total)], "c", 1.0, tags))
+        timing_type = "d" if self.protocol == "dogstatsd" else "ms"
+        for (name, tags), (seen, values) in timings.items():
+            rate = len(values) / seen
+            formatted = [_format_value(value) for value in values]
+            if self.protocol == "statsd":
+                lines.extend(self._line(name, [text], timing_type, rate, tags) for text in formatted)
+                continue
+            # Pack as many values per line as fit in a packet
+            overhead = len(self._line(name, [], timing_type, rate, tags)) + 1
+            chunk: List[str] = []
+            size = overhead
+            for text in formatted:
+                if chunk and size + len(text) + 1 > self.max_packet_size:
+                    lines.append(self._line(name, chunk, timing_type, rate, tags))
+                    chunk, size = [], overhead
+                chunk.append(text)
+                size += len(text) + 1
+            lines.append(self._line(name, chunk, timing_type, rate, tags))
+        return lines
+
+    def _line(self, name: str, values: List[str], metric_type: str, rate: float, tags: str) -> str:
+        line = f"{self.prefix}{name.translate(_NAME_TRANSLATION)}:{':'.join(values)}|{metric_type}"
+        if rate < 1:
+            line += f"|@{rate:.4g}"
+        if self.protocol == "dogstatsd":
+            all_tags = ",".join(part for part in (self.global_tags, tags) if part)
+            if all_tags:
+                line += f"|#{all_tags}"
+        return line
+
+    def pack(self, lines: Iterable[str]) -> List[bytes]:
+        """Join lines into datagrams of at most max_packet_size bytes"""
+        packets, current = [], b""
+        for line in lines:
+            encoded = line.encode("utf-8")
+            if current and len(current) + 1 + len(encoded) > self.max_packet_size:
+                packets.append(current)
+                current = b""
+            current = current + b"\n" + encoded if current else encoded
+        if current:
+            packets.append(current)
+        return packets
+
+    def _send(self, packet: bytes):
+        try:
+            sock = self._socket
+            if sock is None:
+                family, kind, proto, _, address = socket.getaddrinfo(self.host, self.port, type=socket.SOCK_DGRAM)[0]
+                sock = self._socket = socket.socket(family, kind, proto)
+                sock.setblocking(False)
+                sock.connect(address)
+            sock.send(packet)
+            self.packets_sent += 1
+        except OSError as e:
+            # A missing agent must not affect the application
+            self.send_errors += 1
+            logger.debug("Failed to send StatsD packet to %s:%s: %s", self.host, self.port, e)
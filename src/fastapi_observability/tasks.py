@@ -0,0 +1,238 @@
+"""
+Instrumentation of background tasks and threadpool-run sync code.
+
+Background tasks run after the response was sent, and sync endpoints and
+dependencies run on the anyio threadpool, so neither shows up in the request
+metrics. ``instrument_tasks`` patches Starlette's ``BackgroundTask`` and the
+threadpool calls of FastAPI and Starlette to record:
+
+- for background tasks, the delay between being added and starting, the
+  execution time and failures, in a span of its own linked to the request
+- for threadpool calls, the time waiting for a worker thread and the time
+  running on it, plus the number of busy threads and the thread limit
+
+The patches are process-wide, but record nothing by themselves: each
+application wraps its requests in ``TaskInstrumentationApp``, which selects
+the tracer and metrics their background tasks and threadpool calls record to. Several applications in one
+process therefore each keep their own timings.
+"""
+import functools
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import anyio.to_thread
+import fastapi.dependencies.utils
+import fastapi.routing
+import starlette.background
+from starlette.background import BackgroundTask
+
+from .profiling import bind_thread_tags
+from .timing import get_server_timing
+from .trace_context import get_current_span_context, set_span_attribute
+
+def get_task_name(func) -> str:
+    """Get the name of a task function, looking through functools.partial"""
+    while isinstance(func, functools.partial):
+        func = func.func
+    return getattr(func, "__qualname__", None) or type(func).__qualname__
+
+class TaskInstrumentation:
+    """
+    Records background task and threadpool timings to a tracer and metrics.
+
+    Args:
+        tracer_provider: Tracer provider for background task spans, or None
+        metrics: FastAPIObservabilityMetrics to record to, or None
+    """
+
+    def __init__(self, tracer_provider=None, metrics=None):
+        self.tracer = tracer_provider.get_tracer(__name__) if tracer_provider is not None else None
+        self.metrics = metrics
+
+    def start_span(self, name: str, link, queue_delay: float):
+        """Start a span for a background task, linked to the span that added it"""
+        if self.tracer is None:
+            return nullcontext()
+
+        from opentelemetry.context import Context
+        from opentelemetry.trace import Link
+        # A new trace: the request's trace has usually ended by now
+        return self.tracer.start_as_current_span(
+            f"background {name}",
+            context=Context(),
+            links=[Link(link)] if link is not None else None,
+            attributes={"background_task.name": name, "background_task.queue_delay": queue_delay},
+        )
+
+    def record_threadpool(self, kind: str, wait: float, run: float):
+        """Record a threadpool call, in metrics and the current request's phases"""
+        if self.metrics:
+            self.metrics.record_threadpool(kind, wait, run)
+        if kind == "endpoint":
+            set_span_attribute("threadpool.wait_time", wait)
+            timing = get_server_timing()
+            if timing is not None:
+                timing.add("threadpool_wait", wait)
+
+    @contextmanager
+    def activate(self) -> Iterator[None]:
+        """Record the tasks and threadpool calls of the enclosed block to this instrumentation"""
+        token = _current_instrumentation.set(self)
+        try:
+            yield
+        finally:
+            _current_instrumentation.reset(token)
+
+# Instrumentation of the application handling the current request
+_current_instrumentation: ContextVar[Optional[TaskInstrumentation]] = ContextVar(
+    "task_instrumentation", default=None
+)
+# Patched attributes: (owner, name) -> original value
+_originals: Dict[Tuple[Any, str], Any] = {}
+
+class TaskInstrumentationApp:
+    """
+    ASGI wrapper recording the background tasks and threadpool calls of its
+    requests to one TaskInstrumentation.
+
+    Args:
+        app: ASGI application
+        instrumentation: TaskInstrumentation to record to
+    """
+
+    def __init__(self, app, instrumentation: TaskInstrumentation):
+        self.app = app
+        self.instrumentation = instrumentation
+
+    async def __call__(self, scope, receive, send):
+        with self.instrumentation.activate():
+            await self.app(scope, receive, send)
+
+def _background_task_init(self, func, *args, **kwargs):
+    _originals[(BackgroundTask, "__init__")](self, func, *args, **kwargs)
+    instrumentation = _current_instrumentation.get()
+    if instrumentation is not None:
+        self.func = _wrap_task(instrumentation, func, self.is_async)
+
+def _wrap_task(instrumentation: TaskInstrumentation, func, is_async: bool):
+    """
+    Wrap a background task function to record its run.
+
+    The function is wrapped rather than ``BackgroundTask.__call__``, which
+    the OpenTelemetry FastAPI instrumentation patches and restores on its own.
+    """
+    name = get_task_name(func)
+    enqueued = time.perf_counter()
+    link = get_current_span_context()
+
+    if is_async:
+        @functools.wraps(func)
+        async def task(*args, **kwargs):
+            with _run_task(instrumentation, name, enqueued, link):
+                return await func(*args, **kwargs)
+    else:
+        @functools.wraps(func)
+        def task(*args, **kwargs):
+            with _run_task(instrumentation, name, enqueued, link):
+                return func(*args, **kwargs)
+    return task
+
+@contextmanager
+def _run_task(instrumentation: TaskInstrumentation, name: str, enqueued: float, link):
+    start_time = time.perf_counter()
+    queue_delay = start_time - enqueued
+    error = None
+    with instrumentation.start_span(name, link, queue_delay):
+        try:
+            yield
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if instrumentation.metrics:
+                instrumentation.metrics.record_background_task(name, queue_delay, time.perf_counter() - start_time, error)
+
+def _threadpool_wrapper(original, kind_of):
+    """Wrap a run_in_threadpool function to time the wait for a thread and the run"""
+
+    @functools.wraps(original)
+    async def run_in_threadpool(func, *args, **kwargs):
+        instrumentation = _current_instrumentation.get()
+        if instrumentation is None:
+            return await original(func, *args, **kwargs)
+
+        metrics = instrumentation.metrics
+        if metrics:
+            metrics.set_threadpool_limit(anyio.to_thread.current_default_thread_limiter().total_tokens)
+        submitted = time.perf_counter()
+        started = None
+
+        def run():
+            nonlocal started
+            started = time.perf_counter()
+            if metrics:
+                metrics.threadpool_busy(1)
+            try:
+                # Attribute profile samples of the thread to the request
+                with bind_thread_tags():
+                    return func(*args, **kwargs)
+            finally:
+                if metrics:
+                    metrics.threadpool_busy(-1)
+
+        try:
+            return await original(run)
+        finally:
+            # Not started if cancelled while waiting for a thread
+            if started is not None:
+                instrumentation.record_threadpool(kind_of(func), started - submitted, time.perf_counter() - started)
+
+    return run_in_threadpool
+
+def _routing_kind(func) -> str:
+    # FastAPI runs sync endpoints through _run_sync_endpoint
+    return "endpoint" if func is getattr(fastapi.routing, "_run_sync_endpoint", None) else "other"
+
+def _patch(owner, name, value):
+    if (owner, name) not in _originals:
+        _originals[(owner, name)] = getattr(owner, name)
+    setattr(owner, name, value)
+
+def instrument_tasks(tracer_provider=None, metrics=None) -> TaskInstrumentation:
+    """
+    Instrument background tasks and threadpool calls.
+
+    Patches FastAPI and Starlette once per process. Only requests run through
+    ``TaskInstrumentationApp`` with the returned instrumentation, or within its
+    ``activate()``, are recorded to it.
+
+    Args:
+        tracer_provider: Tracer provider for background task spans, or None
+            for no spans
+        metrics: FastAPIObservabilityMetrics to record to, or None
+
+    Returns:
+        The TaskInstrumentation to select per request
+    """
+    instrumentation = TaskInstrumentation(tracer_provider, metrics)
+    if _originals:
+        return instrumentation
+
+    _patch(BackgroundTask, "__init__", _background_task_init)
+    # Modules look run_in_threadpool up in their own namespace on each call
+    _patch(fastapi.routing, "run_in_threadpool", _threadpool_wrapper(fastapi.routing.run_in_threadpool, _routing_kind))
+    _patch(fastapi.dependencies.utils, "run_in_threadpool", _threadpool_wrapper(
+        fastapi.dependencies.utils.run_in_threadpool, lambda func: "dependency"
+    ))
+    _patch(starlette.background, "run_in_threadpool", _threadpool_wrapper(
+        starlette.background.run_in_threadpool, lambda func: "background_task"
+    ))
+    return instrumentation
+
+def uninstrument_tasks():
+    """Remove the instrumentation of background tasks and threadpool calls"""
+    for (owner, name), value in _originals.items():
+        setattr(owner, name, value)
+    _originals.clear()
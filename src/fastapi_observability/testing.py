@@ -0,0 +1,347 @@
+"""
+Test helpers for applications and benchmarks using FastAPIObservability.
+
+The in-memory exporters plug into FastAPIObservability through its
+constructor, so tests neither start OTLP exporters nor write logs and spans
+to the console, and each test gets metrics of its own:
+
+    spans = InMemorySpanExporter()
+    logs = InMemoryLogExporter()
+    registry = IsolatedRegistry()
+    observability = FastAPIObservability(
+        app,
+        span_exporters=[spans],
+        metrics_registry=registry,
+        log_sink=logs,
+    )
+"""
+import gzip
+import socket
+import threading
+from concurrent import futures
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+import grpc  # type: ignore[import-untyped]
+from opentelemetry.proto.collector.trace.v1.trace_service_pb2 import (
+    ExportTraceServiceRequest,
+    ExportTraceServiceResponse,
+)
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter as _InMemorySpanExporter
+from prometheus_client import CollectorRegistry
+
+from .otlp import TRACE_EXPORT_METHOD
+
+class InMemorySpanExporter(_InMemorySpanExporter):
+    """
+    Span exporter keeping finished spans in memory.
+
+    Unlike the SDK exporter it keeps accepting spans after a shutdown, since
+    ``FastAPIObservability.shutdown()`` and ``startup()`` stop and restart the
+    exporters of an application under test.
+    """
+
+    def shutdown(self):
+        pass
+
+    def span_names(self) -> List[str]:
+        """Names of all finished spans, in the order they ended"""
+        return [span.name for span in self.get_finished_spans()]
+
+    def get_spans(self, name: str):
+        """Finished spans with the given name"""
+        return [span for span in self.get_finished_spans() if span.name == name]
+
+class IsolatedRegistry(CollectorRegistry):
+    """
+    Prometheus registry of its own, e.g. per test.
+
+    Metrics registered in the default registry cannot be registered again in
+    the same process; pass a new IsolatedRegistry as ``metrics_registry`` to
+    create any number of instrumented applications.
+    """
+
+    def get_value(self, name: str, labels: Optional[Dict[str, str]] = None, default: float = 0.0) -> float:
+        """
+        Get the value of a sample, e.g. ``get_value("http_requests_total", {"status": "200"})``.
+
+        Args:
+            name: Sample name, including suffixes like ``_total`` or ``_count``
+            labels: Labels the sample must have; further labels are ignored
+            default: Value returned if no sample matches
+
+        Returns:
+            The summed value of the matching samples
+        """
+        labels = labels or {}
+        values = [
+            sample.value
+            for metric in self.collect()
+            for sample in metric.samples
+            if sample.name == name and all(sample.labels.get(key) == value for key, value in labels.items())
+        ]
+        return sum(values) if values else default
+
+    def sample_names(self) -> List[str]:
+        """Names of all samples currently exported"""
+        return sorted({sample.name for metric in self.collect() for sample in metric.samples})
+
+class InMemoryLogExporter:
+    """
+    Log sink keeping structured log events in memory.
+
+    Events are the event dicts after all processors ran, i.e. with level,
+    timestamp and trace IDs, and nothing is written to stdout.
+    """
+
+    def __init__(self):
+        self.events: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def __call__(self, event_dict: Dict[str, Any]):
+        with self._lock:
+            self.events.append(dict(event_dict))
+
+    def get_events(self, level: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Logged events, optionally only those of a level like ``"error"``"""
+        with self._lock:
+            events = list(self.events)
+        if level is not None:
+            events = [event for event in events if event.get("level") == level]
+        return events
+
+    def messages(self) -> List[str]:
+        """Messages of the logged events"""
+        return [event.get("event", "") for event in self.get_events()]
+
+    def clear(self):
+        with self._lock:
+            self.events.clear()
+
+class LocalOTLPReceiver:
+    """
+    Lightweight stand-in for an OTLP collector that records received spans.
+
+    Listens for OTLP trace exports on a local port, by default a free one,
+    over gRPC or, with ``protocol="http"``, HTTP with protobuf payloads.
+
+    Example:
+        with LocalOTLPReceiver() as receiver:
+            observability = FastAPIObservability(app, otlp_endpoint=receiver.endpoint)
+            ...
+            assert receiver.wait_for_spans(1)
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, max_workers: int = 4, protocol: str = "grpc"):
+        if protocol not in ("grpc", "http"):
+            raise ValueError(f"Unknown OTLP protocol {protocol!r}, expected 'grpc' or 'http'")
+        self.host = host
+        self.protocol = protocol
+        # Set to False to simulate a collector outage
+        self.available = True
+        self.requests: List[ExportTraceServiceRequest] = []
+        self.span_count = 0
+        self._condition = threading.Condition()
+        self._http_server: Optional[ThreadingHTTPServer] = None
+        self._grpc_server: Any = None
+        self._thread: Optional[threading.Thread] = None
+
+        if protocol == "http":
+            self._http_server = ThreadingHTTPServer((host, port), self._http_handler())
+            self._http_server.daemon_threads = True
+            self.port = self._http_server.server_address[1]
+            return
+
+        service, method = TRACE_EXPORT_METHOD.lstrip("/").split("/")
+        handler = grpc.method_handlers_generic_handler(service, {
+            method: grpc.unary_unary_rpc_method_handler(
+                self._export,
+                request_deserializer=ExportTraceServiceRequest.FromString,
+                response_serializer=ExportTraceServiceResponse.SerializeToString,
+            )
+        })
+        self._grpc_server = grpc.server(futures.ThreadPoolExecutor(max_workers=max_workers))
+        self._grpc_server.add_generic_rpc_handlers((handler,))
+        self.port = self._grpc_server.add_insecure_port(f"{host}:{port}")
+
+    @property
+    def endpoint(self) -> str:
+        """OTLP endpoint URL to pass to exporters, including the path for HTTP"""
+        if self.protocol == "http":
+            return f"http://{self.host}:{self.port}/v1/traces"
+        return f"http://{self.host}:{self.port}"
+
+    def _export(self, request, context):
+        if not self.available:
+            context.abort(grpc.StatusCode.UNAVAILABLE, "collector unavailable")
+        self._record(request)
+        return ExportTraceServiceResponse()
+
+    def _http_handler(self):
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.path != "/v1/traces":
+                    self.send_response(404)
+                elif not receiver.available:
+                    self.send_response(503)
+                else:
+                    if self.headers.get("Content-Encoding") == "gzip":
+                        body = gzip.decompress(body)
+                    receiver._record(ExportTraceServiceRequest.FromString(body))
+                    body = ExportTraceServiceResponse().SerializeToString()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/x-protobuf")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def _record(self, request):
+        spans = sum(
+            len(scope_spans.spans)
+            for resource_spans in request.resource_spans
+            for scope_spans in resource_spans.scope_spans
+        )
+        with self._condition:
+            self.requests.append(request)
+            self.span_count += spans
+            self._condition.notify_all()
+
+    def span_names(self):
+        """Names of all received spans, in arrival order"""
+        with self._condition:
+            requests = list(self.requests)
+        return [
+            span.name
+            for request in requests
+            for resource_spans in request.resource_spans
+            for scope_spans in resource_spans.scope_spans
+            for span in scope_spans.spans
+        ]
+
+    def wait_for_spans(self, count: int, timeout: float = 5.0) -> bool:
+        """Wait until at least ``count`` spans were received"""
+        with self._condition:
+            return self._condition.wait_for(lambda: self.span_count >= count, timeout)
+
+    def start(self):
+        if self._http_server is not None:
+            self._thread = threading.Thread(target=self._http_server.serve_forever, name="otlp-http-receiver", daemon=True)
+            self._thread.start()
+        else:
+            self._grpc_server.start()
+        return self
+
+    def stop(self, grace: Optional[float] = None):
+        if self._http_server is not None:
+            self._http_server.shutdown()
+            self._http_server.server_close()
+        else:
+            self._grpc_server.stop(grace).wait()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+class LocalStatsDReceiver:
+    """
+    Local UDP server that parses received StatsD and DogStatsD lines.
+
+    Example:
+        with LocalStatsDReceiver() as receiver:
+            observability = FastAPIObservability(app, statsd_host=receiver.host, statsd_port=receiver.port)
+            ...
+            assert receiver.counter("http.requests", {"status": "200"}) == 10
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.bind((host, port))
+        self._socket.settimeout(0.1)
+        self.port = self._socket.getsockname()[1]
+        self.packets: List[bytes] = []
+        # (name, values, type, sample rate, tags) per received line
+        self.lines: List[tuple] = []
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _serve(self):
+        while not self._stop.is_set():
+            try:
+                packet = self._socket.recv(65535)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            lines = [self.parse(line) for line in packet.decode("utf-8").split("\n") if line]
+            with self._condition:
+                self.packets.append(packet)
+                self.lines.extend(lines)
+                self._condition.notify_all()
+
+    @staticmethod
+    def parse(line: str) -> tuple:
+        """Parse a line into name, values, type, sample rate and tags"""
+        parts = line.split("|")
+        name, values = parts[0].split(":", 1)
+        rate, tags = 1.0, {}
+        for part in parts[2:]:
+            if part.startswith("@"):
+                rate = float(part[1:])
+            elif part.startswith("#"):
+                tags = dict(tag.split(":", 1) for tag in part[1:].split(","))
+        return name, [float(value) for value in values.split(":")], parts[1], rate, tags
+
+    def _matching(self, name: str, tags: Optional[Dict[str, str]]):
+        with self._condition:
+            lines = list(self.lines)
+        return [
+            line for line in lines
+            if line[0] == name and all(line[4].get(key) == value for key, value in (tags or {}).items())
+        ]
+
+    def counter(self, name: str, tags: Optional[Dict[str, str]] = None) -> float:
+        """Total of a counter over all lines whose tags include ``tags``"""
+        return sum(sum(values) / rate for _, values, _, rate, _ in self._matching(name, tags))
+
+    def timings(self, name: str, tags: Optional[Dict[str, str]] = None) -> List[float]:
+        """Received timing values, without scaling for the sample rate"""
+        return [value for _, values, _, _, _ in self._matching(name, tags) for value in values]
+
+    def timing_count(self, name: str, tags: Optional[Dict[str, str]] = None) -> float:
+        """Number of timing observations, scaled up by the sample rate"""
+        return sum(len(values) / rate for _, values, _, rate, _ in self._matching(name, tags))
+
+    def wait_for_packets(self, count: int, timeout: float = 5.0) -> bool:
+        """Wait until at least ``count`` datagrams were received"""
+        with self._condition:
+            return self._condition.wait_for(lambda: len(self.packets) >= count, timeout)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._serve, name="statsd-receiver", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._socket.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
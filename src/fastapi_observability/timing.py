@@ -0,0 +1,89 @@
+"""
+Per-request phase timings for the Server-Timing response header.
+
+With server timing enabled, ObservabilityMiddleware creates a ``ServerTiming``
+for every request, available as ``request.state.timing`` and through
+``get_server_timing()``. Handlers add their own phases to it:
+
+    @app.get("/items")
+    async def items():
+        with measure("db", "item query"):
+            rows = await database.fetch_all(query)
+        return rows
+
+The middleware adds its own phases, sends all of them in the ``Server-Timing``
+header and records them as span attributes and, optionally, histograms.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+_current_timing: ContextVar[Optional["ServerTiming"]] = ContextVar("server_timing", default=None)
+
+class ServerTiming:
+    """Named phase durations of one request, in insertion order"""
+
+    def __init__(self):
+        # name -> [duration in seconds, description]
+        self._phases: Dict[str, list] = {}
+
+    def add(self, name: str, duration: float, description: Optional[str] = None):
+        """Add a phase duration in seconds; durations of the same name are summed"""
+        phase = self._phases.get(name)
+        if phase is None:
+            self._phases[name] = [duration, description]
+        else:
+            phase[0] += duration
+            if description is not None:
+                phase[1] = description
+
+    @contextmanager
+    def measure(self, name: str, description: Optional[str] = None) -> Iterator[None]:
+        """Measure the duration of the enclosed block as a phase"""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start_time, description)
+
+    @property
+    def phases(self) -> List[Tuple[str, float]]:
+        """Phase names and durations in seconds"""
+        return [(name, phase[0]) for name, phase in self._phases.items()]
+
+    def header_value(self) -> str:
+        """Format the phases as a Server-Timing header value, durations in milliseconds"""
+        metrics = []
+        for name, (duration, description) in self._phases.items():
+            metric = f"{name};dur={duration * 1000:.1f}"
+            if description:
+                escaped = description.replace("\\", "\\\\").replace('"', '\\"')
+                metric += f';desc="{escaped}"'
+            metrics.append(metric)
+        return ", ".join(metrics)
+
+def get_server_timing() -> Optional[ServerTiming]:
+    """Get the ServerTiming of the current request, if server timing is enabled"""
+    return _current_timing.get()
+
+def set_server_timing(timing: Optional[ServerTiming]):
+    """Set the ServerTiming of the current request, returns a token to reset it"""
+    return _current_timing.set(timing)
+
+def reset_server_timing(token):
+    _current_timing.reset(token)
+
+@contextmanager
+def measure(name: str, description: Optional[str] = None) -> Iterator[None]:
+    """
+    Measure the enclosed block as a phase of the current request.
+
+    Does nothing outside a request or when server timing is disabled.
+    """
+    timing = _current_timing.get()
+    if timing is None:
+        yield
+        return
+    with timing.measure(name, description):
+        yield
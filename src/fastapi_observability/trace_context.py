@@ -0,0 +1,57 @@
+import sys
+from typing import Dict
+
+
+def get_current_span_context():
+    """
+    Get the span context of the active OpenTelemetry span.
+
+    The OpenTelemetry API is only consulted if something has already imported it,
+    so services running with tracing disabled never pay for loading it. If nothing
+    imported the API, no span can be active.
+
+    Returns:
+        The active span context, or None if there is no valid span
+    """
+    trace = sys.modules.get("opentelemetry.trace")
+    if trace is None:
+        return None
+
+    current_span = trace.get_current_span()
+    if current_span:
+        span_context = current_span.get_span_context()
+        if span_context.is_valid:
+            return span_context
+    return None
+
+
+def get_trace_context() -> Dict[str, str]:
+    """
+    Get the trace and span IDs of the active OpenTelemetry span.
+
+    Returns:
+        Dict containing trace_id and span_id if available
+    """
+    span_context = get_current_span_context()
+    if span_context is None:
+        return {}
+
+    return {
+        "trace_id": format(span_context.trace_id, "032x"),
+        "span_id": format(span_context.span_id, "016x"),
+    }
+
+
+def set_span_attribute(key: str, value) -> None:
+    """
+    Set an attribute on the active OpenTelemetry span, if it is recording.
+
+    Like get_current_span_context, this never imports the OpenTelemetry API.
+    """
+    trace = sys.modules.get("opentelemetry.trace")
+    if trace is None:
+        return
+
+    current_span = trace.get_current_span()
+    if current_span.is_recording():
+        current_span.set_attribute(key, value)
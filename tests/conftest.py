@@ -2,10 +2,26 @@ import pytest
 from fastapi import FastAPI
 from fastapi.testclient import TestClient
 from fastapi_observability import FastAPIObservability
+from fastapi_observability.testing import InMemoryLogExporter, InMemorySpanExporter, IsolatedRegistry
 import os
 
 @pytest.fixture
-def app():
+def span_exporter():
+    """Collect the spans of the test application in memory"""
+    return InMemorySpanExporter()
+
+@pytest.fixture
+def log_exporter():
+    """Collect the log events of the test application in memory"""
+    return InMemoryLogExporter()
+
+@pytest.fixture
+def metrics_registry():
+    """Create a Prometheus registry for the test application"""
+    return IsolatedRegistry()
+
+@pytest.fixture
+def app(span_exporter, log_exporter, metrics_registry):
     """Create a FastAPI application with observability enabled"""
     app = FastAPI()
     observability = FastAPIObservability(
@@ -14,6 +30,9 @@ def app():
         enable_structlog=True,
         enable_prometheus=True,
         enable_opentelemetry=True,
+        span_exporters=[span_exporter],
+        metrics_registry=metrics_registry,
+        log_sink=log_exporter,
     )
     return app
 
@@ -23,7 +42,7 @@ def client(app):
     return TestClient(app)
 
 @pytest.fixture
-def minimal_app():
+def minimal_app(metrics_registry):
     """Create a FastAPI application with minimal observability"""
     app = FastAPI()
     observability = FastAPIObservability(
@@ -32,6 +51,7 @@ def minimal_app():
         enable_structlog=False,
         enable_prometheus=True,
         enable_opentelemetry=False,
+        metrics_registry=metrics_registry,
     )
     return app
 
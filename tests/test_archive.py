@@ -0,0 +1,128 @@
+import os
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from fastapi_observability import FastAPIObservability
+from fastapi_observability.archive import ACTIVE_SUFFIX, RequestArchive, list_archive, main, read_archive, summarize
+
+def test_records_written_in_batches(tmp_path):
+    archive = RequestArchive(str(tmp_path), batch_size=3, format="columns")
+    for index in range(7):
+        archive.record("/items/{id}", "GET", 200, index / 1000, 10, 100 + index, "10.0.0.1", "ab" * 16, timestamp=1000.0 + index)
+    archive.record("/ünïcode", "POST", 503, 0.5)
+    archive.close()
+
+    (path,) = list_archive(str(tmp_path))
+    columns = read_archive(path)
+    assert columns["route"] == ["/items/{id}"] * 7 + ["/ünïcode"]
+    assert list(columns["status"]) == [200] * 7 + [503]
+    assert list(columns["duration"]) == [index / 1000 for index in range(7)] + [0.5]
+    assert list(columns["request_bytes"]) == [10] * 7 + [-1]
+    assert list(columns["response_bytes"])[:7] == list(range(100, 107))
+    assert columns["trace_id"][0] == "ab" * 16
+    assert columns["timestamp"][0] == 1000.0
+    assert archive.written_records == 8
+
+def test_truncated_batch_ignored(tmp_path):
+    archive = RequestArchive(str(tmp_path), format="columns")
+    archive.record("/a", "GET", 200, 0.1)
+    archive.flush()
+    archive.record("/b", "GET", 200, 0.2)
+    archive.close()
+
+    (path,) = list_archive(str(tmp_path))
+    size = os.path.getsize(path)
+    with open(path, "r+b") as file:
+        file.truncate(size - 5)
+    assert read_archive(path)["route"] == ["/a"]
+
+def test_rotation_and_retention(tmp_path):
+    archive = RequestArchive(str(tmp_path), rotate_bytes=1, format="columns")
+    archive.record("/route/0", "GET", 200, 0.01)
+    archive.flush()
+    (first,) = list_archive(str(tmp_path))
+    # Room for three and a half files
+    archive.max_bytes = int(os.path.getsize(first) * 3.5)
+    for index in range(1, 10):
+        archive.record(f"/route/{index}", "GET", 200, 0.01)
+        archive.flush()
+    archive.close()
+
+    files = list_archive(str(tmp_path))
+    assert len(files) == 3
+    assert sum(os.path.getsize(path) for path in files) <= archive.max_bytes
+    # The newest files are kept
+    assert read_archive(files[-1])["route"] == ["/route/9"]
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(ACTIVE_SUFFIX)]
+
+def test_files_of_dead_workers(tmp_path):
+    """Test that active files of dead workers are finished and count towards max_bytes"""
+    dead = RequestArchive(str(tmp_path), format="columns")
+    for index in range(3):
+        dead.record(f"/dead/{index}", "GET", 200, 0.01)
+        dead.flush()
+        if index < 2:
+            dead._finish()
+    # Simulate the worker dying with its file still active
+    dead._writer.close()
+    dead._active_lock.close()
+    dead._pid = None
+    size = os.path.getsize(list_archive(str(tmp_path))[0])
+
+    live = RequestArchive(str(tmp_path), format="columns")
+    live.record("/live", "GET", 200, 0.01)
+    live.flush()
+    other = RequestArchive(str(tmp_path), max_bytes=size * 2, format="columns")
+    other.record("/other", "GET", 200, 0.01)
+
+    # The active file of the live archive is left alone
+    assert [name for name in os.listdir(tmp_path) if name.endswith(ACTIVE_SUFFIX)] == [os.path.basename(live._path) + ACTIVE_SUFFIX]
+    routes = [read_archive(path)["route"] for path in list_archive(str(tmp_path))]
+    assert routes == [["/dead/1"], ["/dead/2"]]
+    live.close()
+    other.close()
+
+def test_pending_records_bounded(tmp_path):
+    archive = RequestArchive(str(tmp_path), max_pending=5, batch_size=100, flush_interval=60, format="columns")
+    for _ in range(8):
+        archive.record("/a", "GET", 200, 0.1)
+    assert archive.dropped_records == 3
+    archive.close()
+    assert archive.written_records == 5
+
+def test_middleware_archives_requests(tmp_path, capsys):
+    app = FastAPI()
+
+    @app.post("/items/{item_id}")
+    async def create_item(item_id: int):
+        return {"item_id": item_id}
+
+    observability = FastAPIObservability(
+        app,
+        enable_structlog=False,
+        enable_prometheus=False,
+        enable_opentelemetry=False,
+        request_archive_dir=str(tmp_path)
+    )
+    with TestClient(app) as client:
+        for index in range(20):
+            client.post(f"/items/{index}", content=b"x" * 12)
+
+    (path,) = list_archive(str(tmp_path))
+    columns = read_archive(path)
+    assert columns["route"] == ["/items/{item_id}"] * 20
+    assert set(columns["method"]) == {"POST"}
+    assert set(columns["request_bytes"]) == {12}
+    assert all(size > 0 for size in columns["response_bytes"])
+    assert observability.request_archive.dropped_records == 0
+
+    (row,) = summarize(str(tmp_path))
+    assert row["requests"] == 20 and row["errors"] == 0
+    assert row["p50"] <= row["p99"] <= row["max"]
+
+    main([str(tmp_path)])
+    assert "/items/{item_id}" in capsys.readouterr().out
+
+def test_invalid_settings(tmp_path):
+    with pytest.raises(ValueError):
+        RequestArchive(str(tmp_path), format="csv")
@@ -0,0 +1,128 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from opentelemetry import trace
+from opentelemetry.instrumentation.httpx import HTTPXClientInstrumentor
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from fastapi_observability import FastAPIObservability
+from fastapi_observability.attributes import SpanAttributePolicy, SpanLimitAccounting
+from fastapi_observability.instrumentation import instrument_httpx
+from fastapi_observability.testing import InMemorySpanExporter, IsolatedRegistry
+
+@pytest.fixture
+def observed_app():
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: int):
+        span = trace.get_current_span()
+        for index in range(20):
+            span.set_attribute(f"item.attribute_{index}", index)
+            span.add_event(f"event {index}")
+        return {"item_id": item_id}
+
+    spans = InMemorySpanExporter()
+    registry = IsolatedRegistry()
+    FastAPIObservability(
+        app,
+        enable_structlog=False,
+        metrics_registry=registry,
+        span_exporters=[spans],
+        capture_headers=True,
+        span_headers=["x-request-id", "user-agent"],
+        span_attribute_max_length=16,
+        span_max_attributes=24,
+        span_max_events=5,
+    )
+    return app, spans, registry
+
+@pytest.fixture
+def peer():
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Length", "2")
+            self.send_header("X-Service-Name", "inventory")
+            self.send_header("X-Request-Id", "r" * 40)
+            self.end_headers()
+            self.wfile.write(b"ok")
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+    HTTPXClientInstrumentor().uninstrument()
+
+def test_policy_compiles_allowlist():
+    policy = SpanAttributePolicy(headers=["X-Request-Id"], max_value_length=4)
+    assert policy.asgi_request_headers([(b"x-request-id", b"abcdef"), (b"user-agent", b"curl"), (b"x-request-id", b"ab")]) == {
+        "http.request.header.x_request_id": ("abcd", "ab")
+    }
+    assert policy.http_headers(httpx.Headers({"X-Request-Id": "1"}), response=True) == {"http.response.header.x_request_id": ("1",)}
+    limits = policy.span_limits()
+    assert (limits.max_span_attributes, limits.max_events, limits.max_span_attribute_length) == (64, 32, 4)
+
+def test_invalid_policy():
+    with pytest.raises(ValueError):
+        SpanAttributePolicy(headers=["Authorization"])
+    with pytest.raises(ValueError):
+        SpanAttributePolicy(max_attributes=0)
+
+def test_server_spans_bounded(observed_app):
+    app, spans, registry = observed_app
+    with TestClient(app) as client:
+        client.get(
+            "/items/1?" + "q=x" * 20,
+            headers={"X-Request-Id": "abc", "User-Agent": "u" * 40, "Authorization": "Bearer secret", "Accept": "*/*"}
+        )
+        # Counters are exported from the application's own metrics
+        metrics = client.get("/metrics").text
+
+    (span,) = spans.get_spans("GET /items/{item_id}")
+    attributes = span.attributes
+    assert attributes["http.query_string"] == ("q=x" * 20)[:16]
+    assert attributes["http.request.header.x_request_id"] == ("abc",)
+    assert attributes["http.request.header.user_agent"] == ("u" * 16,)
+    assert not [key for key in attributes if "authorization" in key or "accept" in key]
+    assert len(attributes) == 24
+    assert len(span.events) == 5
+
+    # Two values truncated by the hook, and asgi.event.type of the three
+    # internal send spans ("http.response.start", ...) by the SDK
+    assert [span.attributes["asgi.event.type"] for span in spans.get_spans("GET /items/{item_id} http send")] == [
+        "http.response.st", "http.response.bo", "http.response.bo"
+    ]
+    assert registry.get_value("otel_span_attribute_values_truncated_total") == 5
+    assert registry.get_value("otel_span_events_dropped_total") == 15
+    assert registry.get_value("otel_span_attributes_dropped_total") == span.dropped_attributes > 0
+    assert "otel_span_attributes_dropped_total" in metrics
+
+def test_client_spans_set_in_one_call(peer):
+    spans = InMemorySpanExporter()
+    policy = SpanAttributePolicy(headers=["x-request-id"], max_value_length=16)
+    tracer_provider = TracerProvider(span_limits=policy.span_limits())
+    tracer_provider.add_span_processor(SpanLimitAccounting(policy))
+    tracer_provider.add_span_processor(SimpleSpanProcessor(spans))
+    instrument_httpx(tracer_provider=tracer_provider, capture_headers=True, attribute_policy=policy)
+
+    with httpx.Client() as client:
+        assert client.get(f"{peer}/items", headers={"X-Request-Id": "abc"}).status_code == 200
+
+    (span,) = spans.get_finished_spans()
+    assert span.attributes["http.status_code"] == 200
+    assert span.attributes["http.response_content_length"] == 2
+    assert span.attributes["peer.service"] == "inventory"
+    assert span.attributes["http.request.header.x_request_id"] == ("abc",)
+    assert span.attributes["http.response.header.x_request_id"] == ("r" * 16,)
+    # The SDK truncated the URL, the hook the response header
+    assert span.attributes["http.url"] == "http://127.0.0.1"
+    assert policy.truncated_values == 2
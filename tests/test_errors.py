@@ -0,0 +1,95 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from fastapi_observability.errors import ExceptionAggregator, fingerprint_exception
+from fastapi_observability.middleware import ObservabilityMiddleware
+from unittest.mock import MagicMock
+
+def fail(message, error_type=ValueError):
+    raise error_type(message)
+
+def fail_elsewhere(message):
+    raise ValueError(message)
+
+def capture(function, *args):
+    try:
+        function(*args)
+    except Exception as e:
+        return e
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_fingerprint_ignores_message():
+    """Test that errors raised at the same place share a fingerprint"""
+    first = fingerprint_exception(capture(fail, "user 1 not found"))
+    second = fingerprint_exception(capture(fail, "user 2 not found"))
+    assert first == second
+    assert len(first) == 16
+
+def test_fingerprint_distinguishes_type_and_location():
+    """Test that the exception type and raising frames change the fingerprint"""
+    base = fingerprint_exception(capture(fail, "error"))
+    assert fingerprint_exception(capture(fail, "error", KeyError)) != base
+    assert fingerprint_exception(capture(fail_elsewhere, "error")) != base
+
+def test_tracebacks_limited_per_window():
+    """Test that tracebacks are logged for the first occurrences of each window"""
+    clock = FakeClock()
+    aggregator = ExceptionAggregator(traceback_limit=2, window=60, clock=clock)
+
+    occurrences = [aggregator.record(capture(fail, f"error {i}")) for i in range(4)]
+    assert [o.log_traceback for o in occurrences] == [True, True, False, False]
+    assert [o.count for o in occurrences] == [1, 2, 3, 4]
+
+    clock.now += 60
+    occurrence = aggregator.record(capture(fail, "error"))
+    assert occurrence.log_traceback
+    assert occurrence.suppressed == 2
+
+    (group,) = aggregator.groups()
+    assert group["count"] == 5
+    assert group["first_seen"] == 1000.0
+    assert group["last_seen"] == 1060.0
+    assert group["exception_type"] == "ValueError"
+    assert group["location"].endswith("test_errors:fail")
+
+def test_fingerprints_bounded():
+    """Test that the least recently seen group is evicted"""
+    aggregator = ExceptionAggregator(max_fingerprints=2)
+    aggregator.record(capture(fail, "error"))
+    aggregator.record(capture(fail, "error", KeyError))
+    aggregator.record(capture(fail, "error"))
+    aggregator.record(capture(fail_elsewhere, "error"))
+
+    assert [group["exception_type"] for group in aggregator.groups()] == ["ValueError", "ValueError"]
+    assert aggregator.evicted == 1
+
+def test_middleware_records_unhandled_exception():
+    """Test that unhandled exceptions are aggregated, logged and counted as 500"""
+    logger = MagicMock()
+    metrics = MagicMock()
+    errors = ExceptionAggregator()
+    app = FastAPI()
+    app.add_middleware(ObservabilityMiddleware, service_name="test-service", logger=logger, metrics=metrics, errors=errors)
+
+    @app.get("/error")
+    async def error():
+        raise ValueError("boom")
+
+    client = TestClient(app, raise_server_exceptions=False)
+    assert client.get("/error").status_code == 500
+
+    (group,) = errors.groups()
+    occurrence = logger.log_exception.call_args.args[1]
+    assert occurrence.fingerprint == group["fingerprint"]
+    assert occurrence.log_traceback
+    assert logger.log_request.call_args.args[1] is None
+
+    assert metrics.record_exception.call_args.kwargs["exception_type"] == "ValueError"
+    metrics.record_exception_fingerprint.assert_called_once_with(group["fingerprint"], "ValueError")
+    assert metrics.record_request.call_args.kwargs["status"] == 500
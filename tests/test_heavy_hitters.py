@@ -0,0 +1,83 @@
+import random
+import pytest
+from collections import Counter
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from fastapi_observability.heavy_hitters import HeavyHitterTracker, SpaceSaving
+from fastapi_observability.metrics import HeavyHitterCollector
+from fastapi_observability.middleware import ObservabilityMiddleware
+from unittest.mock import MagicMock
+
+def test_space_saving_exact_below_capacity():
+    """Test that counts are exact while all keys fit"""
+    summary = SpaceSaving(capacity=5)
+    for key in "aabacab":
+        summary.add(key, size=10, duration=0.5)
+
+    assert [(e["key"], e["count"], e["error"]) for e in summary.top(3)] == [("a", 4, 0), ("b", 2, 0), ("c", 1, 0)]
+    assert summary.top(1)[0]["bytes"] == 40
+    assert summary.top(1)[0]["duration_sum"] == 2.0
+
+def test_space_saving_bounded_and_finds_heavy_hitters():
+    """Test fixed memory, error bounds and the guarantee for frequent keys"""
+    rng = random.Random(7)
+    stream = [f"heavy-{i}" for i in range(5) for _ in range(200)]
+    stream += [f"client-{rng.randrange(10000)}" for _ in range(4000)]
+    rng.shuffle(stream)
+    true_counts = Counter(stream)
+
+    summary = SpaceSaving(capacity=50)
+    for key in stream:
+        summary.add(key)
+        assert summary._min_count == min(entry[0] for entry in summary._entries.values())
+
+    assert len(summary) == 50
+    top = summary.top(5)
+    assert {entry["key"] for entry in top} == {f"heavy-{i}" for i in range(5)}
+    for entry in summary.top(50):
+        assert entry["count"] - entry["error"] <= true_counts[entry["key"]] <= entry["count"]
+
+def test_tracker_window_and_hashing():
+    """Test that header keys are hashed and the summary is cleared per window"""
+    now = [0.0]
+    tracker = HeavyHitterTracker("api_keys", "header:X-API-Key", window=60, clock=lambda: now[0])
+    assert tracker.hash_keys
+
+    tracker.record("secret-key")
+    (entry,) = tracker.top()
+    assert entry["key"] != "secret-key"
+    assert len(entry["key"]) == 16
+
+    now[0] = 61
+    tracker.record("other-key")
+    assert len(tracker.top()) == 1
+
+def test_unsupported_key():
+    with pytest.raises(ValueError):
+        HeavyHitterTracker("bad", "cookie:session")
+
+def test_middleware_records_keys_and_collector_exports_top_k():
+    """Test client IP and path parameter keys recorded by the middleware"""
+    clients = HeavyHitterTracker("clients", "client_ip")
+    tenants = HeavyHitterTracker("tenants", "path_param:tenant", top_k=1)
+    app = FastAPI()
+    app.add_middleware(ObservabilityMiddleware, service_name="test-service", metrics=MagicMock(), heavy_hitters=[clients, tenants])
+
+    @app.get("/tenants/{tenant}/items")
+    async def items(tenant: str):
+        return {"tenant": tenant}
+
+    client = TestClient(app)
+    for tenant in ("acme", "acme", "globex"):
+        client.get(f"/tenants/{tenant}/items")
+    client.get("/missing")
+
+    assert [(e["key"], e["count"]) for e in clients.top()] == [("testclient", 4)]
+    (entry,) = tenants.top()
+    assert (entry["key"], entry["count"]) == ("acme", 2)
+    assert entry["bytes"] == 2 * len('{"tenant":"acme"}')
+
+    metrics = {metric.name: metric for metric in HeavyHitterCollector(lambda: [clients, tenants]).collect()}
+    samples = metrics["http_heavy_hitter_requests"].samples
+    assert [(s.labels["tracker"], s.labels["key"], s.value) for s in samples] == [("clients", "testclient", 4), ("tenants", "acme", 2)]
+    assert metrics["http_heavy_hitter_duration_seconds_sum"].samples[0].value > 0
@@ -0,0 +1,149 @@
+import asyncio
+import pytest
+import pytest_asyncio
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from opentelemetry.instrumentation.httpx import HTTPXClientInstrumentor
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.trace import SpanKind
+from fastapi_observability import FastAPIObservability
+from fastapi_observability.http_client import HTTPClientPool
+from fastapi_observability.instrumentation import instrument_httpx
+from unittest.mock import MagicMock
+
+@pytest_asyncio.fixture
+async def server():
+    """Local keep-alive HTTP server echoing the traceparent header"""
+    connections = []
+
+    async def handle(reader, writer):
+        connections.append(writer)
+        while True:
+            try:
+                head = await reader.readuntil(b"\r\n\r\n")
+            except asyncio.IncompleteReadError:
+                return
+            headers = dict(
+                line.split(": ", 1)
+                for line in head.decode().split("\r\n")[1:]
+                if line
+            )
+            body = headers.get("traceparent", "").encode()
+            writer.write(b"HTTP/1.1 200 OK\r\ncontent-length: %d\r\n\r\n%s" % (len(body), body))
+            await writer.drain()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}", connections
+    server.close()
+    for writer in connections:
+        writer.close()
+
+@pytest.fixture
+def span_exporter():
+    return InMemorySpanExporter()
+
+@pytest.fixture
+def tracer_provider(span_exporter):
+    tracer_provider = TracerProvider()
+    tracer_provider.add_span_processor(SimpleSpanProcessor(span_exporter))
+    return tracer_provider
+
+@pytest.mark.asyncio
+async def test_connections_are_reused(server):
+    """Test that requests share one pooled connection and are recorded per peer"""
+    url, connections = server
+    metrics = MagicMock()
+    pool = HTTPClientPool(metrics=metrics)
+    client = pool.get("downstream", base_url=url)
+    assert pool.get("downstream") is client
+
+    for _ in range(3):
+        response = await client.get("/")
+        assert response.status_code == 200
+
+    assert len(connections) == 1
+    transport = client._transport
+    assert transport.pool_connections() == (0, 1)
+
+    calls = [call.kwargs for call in metrics.record_http_client_request.call_args_list]
+    assert len(calls) == 3
+    assert [call["connections_created"] for call in calls] == [1, 0, 0]
+    assert all(call["peer"] == url.split("//")[1] for call in calls)
+    assert all(call["client"] == "downstream" and call["status"] == "200" for call in calls)
+    assert all(call["pool_wait"] is not None and call["pool_wait"] <= call["duration"] for call in calls)
+    metrics.track_http_client_pools.assert_called_once()
+
+    await pool.aclose()
+    assert client.is_closed
+
+@pytest.mark.asyncio
+async def test_trace_context_propagated(server, tracer_provider, span_exporter):
+    """Test that the client span is created and its context sent to the peer"""
+    url, _ = server
+    pool = HTTPClientPool(tracer_provider=tracer_provider)
+    client = pool.get(base_url=url)
+
+    response = await client.get("/items")
+    await pool.aclose()
+
+    (span,) = span_exporter.get_finished_spans()
+    assert span.name == "GET"
+    assert span.attributes["http.response.status_code"] == 200
+    assert span.attributes["url.full"] == f"{url}/items"
+    trace_id = format(span.context.trace_id, "032x")
+    span_id = format(span.context.span_id, "016x")
+    assert response.text.startswith(f"00-{trace_id}-{span_id}-")
+
+@pytest.mark.asyncio
+async def test_one_client_span_with_global_instrumentation(server, tracer_provider, span_exporter):
+    """Test that the global HTTPX instrumentation does not trace pooled requests again"""
+    url, _ = server
+    instrument_httpx(tracer_provider=tracer_provider)
+    try:
+        pool = HTTPClientPool(tracer_provider=tracer_provider)
+        response = await pool.get(base_url=url).get("/items")
+        await pool.aclose()
+    finally:
+        HTTPXClientInstrumentor().uninstrument()
+
+    (span,) = [span for span in span_exporter.get_finished_spans() if span.kind == SpanKind.CLIENT]
+    assert span.instrumentation_scope.name == "fastapi_observability.http_client"
+    assert response.text.split("-")[2] == format(span.context.span_id, "016x")
+
+@pytest.mark.asyncio
+async def test_failed_request_recorded(tracer_provider, span_exporter):
+    """Test that connection failures are recorded with an error status"""
+    metrics = MagicMock()
+    pool = HTTPClientPool(tracer_provider=tracer_provider, metrics=metrics)
+    client = pool.get()
+
+    with pytest.raises(Exception):
+        await client.get("http://127.0.0.1:1/")
+    await pool.aclose()
+
+    assert metrics.record_http_client_request.call_args.kwargs["status"] == "error"
+    (span,) = span_exporter.get_finished_spans()
+    assert not span.status.is_ok
+    assert span.events[0].name == "exception"
+
+def test_clients_closed_on_lifespan_shutdown():
+    """Test that pooled clients are closed with the lifespan and recreated afterwards"""
+    app = FastAPI()
+    observability = FastAPIObservability(
+        app=app,
+        service_name="test-service",
+        enable_structlog=False,
+        enable_prometheus=False,
+        enable_opentelemetry=False,
+    )
+
+    with TestClient(app):
+        client = observability.http_client("downstream")
+        assert observability.http_client("downstream") is client
+        assert not client.is_closed
+
+    assert client.is_closed
+    assert observability.http_client("downstream") is not client
@@ -0,0 +1,55 @@
+import itertools
+import os
+import subprocess
+import sys
+import pytest
+
+import fastapi_observability
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(fastapi_observability.__file__)))
+
+SNIPPET = """
+import sys
+import fastapi
+baseline = set(sys.modules)
+from fastapi_observability import FastAPIObservability
+FastAPIObservability(
+    fastapi.FastAPI(),
+    enable_structlog={structlog},
+    enable_prometheus={prometheus},
+    enable_opentelemetry={opentelemetry},
+    otlp_endpoint="http://127.0.0.1:1",
+)
+print(",".join(sorted(set(sys.modules) - baseline)))
+"""
+
+def loaded_modules(structlog, prometheus, opentelemetry):
+    """Construct FastAPIObservability in a fresh interpreter and return the modules it imported"""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [SRC_DIR, env.get("PYTHONPATH")]))
+    code = SNIPPET.format(structlog=structlog, prometheus=prometheus, opentelemetry=opentelemetry)
+    result = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+    return set(result.stdout.strip().splitlines()[-1].split(","))
+
+@pytest.mark.parametrize("structlog,prometheus,opentelemetry", list(itertools.product((False, True), repeat=3)))
+def test_subsystems_imported_only_when_enabled(structlog, prometheus, opentelemetry):
+    """Test that each subsystem is imported only when its toggle is enabled"""
+    modules = loaded_modules(structlog, prometheus, opentelemetry)
+    
+    assert ("structlog" in modules) == structlog
+    assert ("prometheus_client" in modules) == prometheus
+    assert ("opentelemetry.sdk.trace" in modules) == opentelemetry
+    assert ("opentelemetry.exporter.otlp.proto.grpc.trace_exporter" in modules) == opentelemetry
+    assert ("opentelemetry.instrumentation.httpx" in modules) == opentelemetry
+    if not opentelemetry:
+        assert not any(module.startswith("opentelemetry.") for module in modules)
+
+def test_lazy_package_attributes():
+    """Test that component classes remain importable from the package"""
+    from fastapi_observability import FastAPIObservabilityMetrics, ObservabilityMiddleware
+    from fastapi_observability.metrics import FastAPIObservabilityMetrics as metrics_class
+    assert FastAPIObservabilityMetrics is metrics_class
+    assert ObservabilityMiddleware is not None
+    
+    with pytest.raises(AttributeError):
+        fastapi_observability.does_not_exist
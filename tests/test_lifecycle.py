@@ -0,0 +1,123 @@
+import os
+import time
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from opentelemetry.sdk.trace import SpanProcessor, TracerProvider
+from fastapi_observability import FastAPIObservability
+from fastapi_observability.instrumentation import ForkSafeSpanProcessor, shutdown_telemetry
+
+class RecordingProcessor(SpanProcessor):
+    """Span processor that records calls instead of exporting"""
+    def __init__(self, flush_delay=0.0):
+        self.ended = []
+        self.flush_delay = flush_delay
+        self.is_shutdown = False
+
+    def on_end(self, span):
+        self.ended.append(span)
+
+    def force_flush(self, timeout_millis=30000):
+        time.sleep(self.flush_delay)
+        return True
+
+    def shutdown(self):
+        self.is_shutdown = True
+
+def make_provider(processors):
+    """Create a tracer provider whose fork-safe processor yields the given processors"""
+    provider = TracerProvider()
+    provider.fork_safe_processor = ForkSafeSpanProcessor(lambda: processors)
+    provider.add_span_processor(provider.fork_safe_processor)
+    return provider
+
+def test_fork_safe_processor_start_is_idempotent():
+    """Test that exporters are created once per process"""
+    calls = []
+    processor = ForkSafeSpanProcessor(lambda: calls.append(1) or [RecordingProcessor()])
+    assert not processor.started
+
+    processor.start()
+    processor.start()
+    assert processor.started
+    assert len(calls) == 1
+
+def test_spans_dropped_until_started():
+    """Test that spans ending before startup are not exported"""
+    recorder = RecordingProcessor()
+    provider = make_provider([recorder])
+    tracer = provider.get_tracer(__name__)
+
+    with tracer.start_as_current_span("before"):
+        pass
+    provider.fork_safe_processor.start()
+    with tracer.start_as_current_span("after"):
+        pass
+
+    assert [span.name for span in recorder.ended] == ["after"]
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+def test_forked_child_discards_inherited_exporters():
+    """Test that a forked worker does not reuse the parent's exporters"""
+    processor = ForkSafeSpanProcessor(lambda: [RecordingProcessor()])
+    processor.start()
+
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0 if not processor.started else 1)
+    _, status = os.waitpid(pid, 0)
+
+    assert os.WEXITSTATUS(status) == 0
+    assert processor.started
+
+def test_shutdown_telemetry_flushes_and_stops():
+    """Test flushing and stopping exporters"""
+    recorder = RecordingProcessor()
+    provider = make_provider([recorder])
+    provider.fork_safe_processor.start()
+
+    assert shutdown_telemetry(provider, timeout=1.0) is True
+    assert recorder.is_shutdown
+    assert not provider.fork_safe_processor.started
+
+def test_shutdown_telemetry_respects_deadline():
+    """Test that a stuck exporter does not block shutdown past the deadline"""
+    provider = make_provider([RecordingProcessor(flush_delay=2.0)])
+    provider.fork_safe_processor.start()
+
+    start = time.monotonic()
+    assert shutdown_telemetry(provider, timeout=0.1) is False
+    assert time.monotonic() - start < 1.0
+
+def test_deferred_exporters_follow_lifespan():
+    """Test that deferred exporters start on lifespan startup and stop on shutdown"""
+    app = FastAPI()
+    observability = FastAPIObservability(
+        app=app,
+        service_name="test-service",
+        enable_structlog=False,
+        enable_prometheus=False,
+        enable_opentelemetry=True,
+        otlp_endpoint="http://127.0.0.1:1",
+        defer_exporters=True,
+        shutdown_timeout=1.0,
+    )
+    processor = observability.tracer_provider.fork_safe_processor
+    assert not processor.started
+
+    with TestClient(app):
+        assert processor.started
+
+    assert not processor.started
+    assert observability.shutdown() is True
+
+def test_shutdown_without_opentelemetry():
+    """Test that shutdown works when tracing is disabled"""
+    app = FastAPI()
+    observability = FastAPIObservability(
+        app=app,
+        enable_structlog=False,
+        enable_prometheus=False,
+        enable_opentelemetry=False,
+    )
+    assert observability.shutdown() is True
@@ -60,4 +60,133 @@ def test_log_error():
     logger.log_error("Test error", context={"key": "value"})
     
     # Test error logging without context
-    logger.log_error("Test error") 
\ No newline at end of file
+    logger.log_error("Test error") 
+def test_trace_context_processor():
+    """Test that span IDs are added per event and cached per span"""
+    from opentelemetry.sdk.trace import TracerProvider
+    from fastapi_observability.logger import TraceContextProcessor
+    
+    processor = TraceContextProcessor()
+    tracer = TracerProvider().get_tracer(__name__)
+    
+    assert processor(None, "info", {"event": "outside"}) == {"event": "outside"}
+    
+    with tracer.start_as_current_span("request") as span:
+        event_dict = processor(None, "info", {"event": "inside"})
+        assert event_dict["trace_id"] == format(span.get_span_context().trace_id, "032x")
+        assert event_dict["span_id"] == format(span.get_span_context().span_id, "016x")
+        assert processor(None, "info", {})["trace_id"] is event_dict["trace_id"]
+        
+        # Explicitly bound IDs are kept
+        assert processor(None, "info", {"trace_id": "bound"}) == {"trace_id": "bound"}
+        
+        with tracer.start_as_current_span("child") as child:
+            assert processor(None, "info", {})["span_id"] == format(child.get_span_context().span_id, "016x")
+    
+    assert len(processor._cache) == 2
+
+def test_get_logger_reused():
+    """Test that get_logger does not bind a new logger per call"""
+    logger = FastAPIObservabilityLogger("test-service")
+    assert logger.get_logger() is logger.get_logger()
+
+@pytest.fixture
+def restore_logging():
+    """Restore the stdlib logging configuration changed by unified logging"""
+    import logging
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    yield
+    root.handlers, root.level = handlers, level
+    for name in ("uvicorn.access", "noisy"):
+        logging.getLogger(name).handlers = []
+        logging.getLogger(name).setLevel(logging.NOTSET)
+
+def test_unified_logging(restore_logging):
+    """Test that stdlib and structlog events share one handler and processor chain"""
+    import io
+    import logging
+    from opentelemetry.sdk.trace import TracerProvider
+    
+    logger = FastAPIObservabilityLogger("test-service", unified_logging=True, logger_levels={"noisy": "WARNING"})
+    stream = io.StringIO()
+    logger.handler.setStream(stream)
+    
+    # A server installing its own handler after the application was imported
+    access_logger = logging.getLogger("uvicorn.access")
+    access_logger.addHandler(logging.StreamHandler(io.StringIO()))
+    access_logger.propagate = False
+    logger.configure_stdlib_logging()
+    
+    tracer = TracerProvider().get_tracer(__name__)
+    with tracer.start_as_current_span("request") as span:
+        trace_id = format(span.get_span_context().trace_id, "032x")
+        logger.bind_request_context(request_id="abc")
+        logger.get_logger().info("from structlog")
+        access_logger.info('%s - "%s %s HTTP/%s" %d', "127.0.0.1:1234", "GET", "/", "1.1", 200)
+        logging.getLogger("noisy").info("filtered out")
+    logger.flush()
+    
+    lines = stream.getvalue().splitlines()
+    assert len(lines) == 2
+    assert lines[0].endswith(f"req_id=abc trace_id={trace_id} - from structlog")
+    assert lines[1].endswith(f'req_id=abc trace_id={trace_id} - 127.0.0.1:1234 - "GET / HTTP/1.1" 200')
+    assert " INFO " in lines[1]
+
+def test_buffered_handler_flushes_warnings():
+    """Test that the buffered handler flushes immediately only at flush_level"""
+    import logging
+    from fastapi_observability.logger import BufferedStreamHandler
+    
+    stream = MagicMock()
+    handler = BufferedStreamHandler(stream, flush_interval=60)
+    handler.emit(logging.makeLogRecord({"msg": "info", "levelno": logging.INFO}))
+    stream.flush.assert_not_called()
+    handler.emit(logging.makeLogRecord({"msg": "warning", "levelno": logging.WARNING}))
+    stream.flush.assert_called_once()
+
+def test_runtime_log_level(restore_logging):
+    """Test that runtime level changes apply to cached loggers and stdlib logging"""
+    import io
+    import logging
+    from fastapi_observability.runtime import RuntimeSettings
+    
+    runtime = RuntimeSettings()
+    logger = FastAPIObservabilityLogger("test-service", unified_logging=True, runtime=runtime)
+    stream = io.StringIO()
+    logger.handler.setStream(stream)
+    service_logger = logger.get_logger()
+    
+    service_logger.debug("hidden")
+    runtime.update(log_level="DEBUG", revert_after=60)
+    assert logging.getLogger().level == logging.DEBUG
+    service_logger.debug("structlog debug")
+    logging.getLogger("app").debug("stdlib debug")
+    runtime.reset()
+    assert logging.getLogger().level == logging.INFO
+    service_logger.debug("hidden again")
+    logger.flush()
+    
+    lines = stream.getvalue().splitlines()
+    assert [line.split(" - ")[-1] for line in lines] == ["structlog debug", "stdlib debug"]
+
+def test_runtime_level_filters_before_processing(restore_logging):
+    """Test that filtered events return before an event dict is built"""
+    import logging
+    from unittest.mock import patch
+    from fastapi_observability.runtime import RuntimeSettings
+    
+    runtime = RuntimeSettings(log_level="WARNING")
+    events = []
+    logger = FastAPIObservabilityLogger("test-service", runtime=runtime, log_sink=events.append)
+    service_logger = logger.get_logger().bind()
+    
+    with patch.object(type(service_logger), "_process_event") as process_event:
+        service_logger.info("hidden")
+        service_logger.log(logging.DEBUG, "hidden")
+    process_event.assert_not_called()
+    
+    runtime.update(log_level="INFO")
+    service_logger.info("shown %s", "now")
+    service_logger.log(logging.DEBUG, "hidden")
+    assert [event["event"] for event in events] == ["shown now"]
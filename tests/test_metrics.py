@@ -40,14 +40,12 @@ def test_record_request(metrics):
     assert metrics.requests_total.labels(
         method="GET",
         endpoint="/test",
-        status="200",
-        service="test-service"
+        status="200"
     )._value.get() == 1.0
     
     assert metrics.request_duration_seconds.labels(
         method="GET",
-        endpoint="/test",
-        service="test-service"
+        endpoint="/test"
     )._sum.get() == 0.1
 
 def test_record_exception(metrics):
@@ -58,8 +56,7 @@ def test_record_exception(metrics):
     assert metrics.exceptions_total.labels(
         method="GET",
         endpoint="/test",
-        exception_type="ValueError",
-        service="test-service"
+        exception_type="ValueError"
     )._value.get() == 1.0
 
 def test_get_metrics(metrics):
@@ -67,4 +64,43 @@ def test_get_metrics(metrics):
     response = metrics.get_metrics()
     assert response.status_code == 200
     assert "text/plain" in response.headers["content-type"]
-    assert "http_requests_total" in response.body.decode() 
\ No newline at end of file
+    assert "http_requests_total" in response.body.decode()
+
+def test_const_labels_and_namespace():
+    """Test that the service and constant labels are added to every sample of a namespaced instance"""
+    registry = CollectorRegistry()
+    metrics = FastAPIObservabilityMetrics("orders", registry, namespace="shop", const_labels={"region": "eu"})
+    metrics.record_request("GET", "/orders", 200, 0.1)
+    metrics.record_queue_time(0.01)
+
+    labels = {"method": "GET", "endpoint": "/orders", "status": "200", "service": "orders", "region": "eu"}
+    assert registry.get_sample_value("shop_http_requests_total", labels) == 1.0
+    assert registry.get_sample_value("shop_http_request_queue_time_seconds_count", {"service": "orders", "region": "eu"}) == 1.0
+    assert registry.get_sample_value("http_requests_total", labels) is None
+
+def test_instances_in_one_process():
+    """Test that instances have registries of their own, and duplicates in a shared one are rejected"""
+    first = FastAPIObservabilityMetrics("first")
+    second = FastAPIObservabilityMetrics("second")
+    first.record_request("GET", "/", 200, 0.1)
+    assert first.registry.get_sample_value("http_requests_total", {"method": "GET", "endpoint": "/", "status": "200", "service": "first"}) == 1.0
+    assert second.registry.get_sample_value("http_requests_total", {"method": "GET", "endpoint": "/", "status": "200", "service": "first"}) is None
+
+    with pytest.raises(ValueError):
+        FastAPIObservabilityMetrics("third", first.registry)
+
+@pytest.mark.asyncio
+async def test_composite_exposition():
+    """Test that included instances are exposed by one endpoint, with each family once"""
+    parent = FastAPIObservabilityMetrics("parent", include_default_registry=False)
+    child = FastAPIObservabilityMetrics("child")
+    parent.include(child)
+    parent.include(child)
+    parent.record_request("GET", "/", 200, 0.1)
+    child.record_request("GET", "/items", 200, 0.1)
+
+    body = (await parent.get_metrics()).body.decode()
+    assert body.count("# TYPE http_requests counter") == 1
+    assert 'http_requests_total{endpoint="/",method="GET",service="parent",status="200"} 1.0' in body
+    assert 'http_requests_total{endpoint="/items",method="GET",service="child",status="200"} 1.0' in body
+    assert "process_cpu_seconds" not in body
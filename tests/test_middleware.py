@@ -2,6 +2,7 @@ import pytest
 from fastapi_observability.middleware import ObservabilityMiddleware
 from fastapi_observability.logger import FastAPIObservabilityLogger
 from fastapi_observability.metrics import FastAPIObservabilityMetrics
+from fastapi_observability.testing import IsolatedRegistry
 from unittest.mock import patch, MagicMock
 import time
 
@@ -9,7 +10,7 @@ import time
 def middleware():
     """Create a middleware instance with mocked dependencies"""
     logger = FastAPIObservabilityLogger("test-service")
-    metrics = FastAPIObservabilityMetrics("test-service")
+    metrics = FastAPIObservabilityMetrics("test-service", IsolatedRegistry())
     return ObservabilityMiddleware(
         app=MagicMock(),
         service_name="test-service",
@@ -43,8 +44,7 @@ async def test_middleware_successful_request(middleware):
     assert middleware.metrics.requests_total.labels(
         method="GET",
         endpoint="/test",
-        status="200",
-        service="test-service"
+        status="200"
     )._value.get() == 1.0
 
 async def test_middleware_failed_request(middleware):
@@ -69,8 +69,7 @@ async def test_middleware_failed_request(middleware):
     assert middleware.metrics.exceptions_total.labels(
         method="GET",
         endpoint="/test",
-        exception_type="ValueError",
-        service="test-service"
+        exception_type="ValueError"
     )._value.get() == 1.0
 
 async def test_middleware_without_logger(middleware):
@@ -99,8 +98,7 @@ async def test_middleware_without_logger(middleware):
     assert middleware.metrics.requests_total.labels(
         method="GET",
         endpoint="/test",
-        status="200",
-        service="test-service"
+        status="200"
     )._value.get() == 1.0
 
 async def test_middleware_without_metrics(middleware):
@@ -0,0 +1,181 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from fastapi_observability.instrumentation import RuntimeSampler
+from fastapi_observability.middleware import ObservabilityMiddleware
+from fastapi_observability.policy import RoutePolicies, RoutePolicy, route_policy
+from fastapi_observability.runtime import RuntimeSettings
+from unittest.mock import MagicMock
+
+def create_app(route_policies, logger=None, metrics=None):
+    app = FastAPI()
+    app.add_middleware(
+        ObservabilityMiddleware,
+        service_name="test-service",
+        logger=logger,
+        metrics=metrics,
+        route_policies=route_policies
+    )
+
+    @app.get("/ping")
+    @route_policy(access_log=False, tracing=False)
+    async def ping():
+        return "pong"
+
+    @app.get("/internal/{name}")
+    async def internal(name: str):
+        if name == "fail":
+            raise ValueError("boom")
+        return {"name": name}
+
+    @app.get("/orders")
+    async def orders():
+        return []
+
+    return app
+
+def test_resolve_precedence():
+    """Test that declarations win over patterns, which win over the default"""
+    policies = RoutePolicies({"/internal/*": {"metrics": False}, "/*": RoutePolicy(tracing=False)})
+
+    @route_policy(access_log=False)
+    def endpoint():
+        pass
+
+    assert policies.resolve("/internal/{name}", endpoint) == RoutePolicy(access_log=False)
+    assert policies.resolve("/internal/{name}") == RoutePolicy(metrics=False)
+    assert policies.resolve("/orders") == RoutePolicy(tracing=False)
+    assert RoutePolicies().resolve("/orders") == RoutePolicy()
+
+def test_unknown_setting_rejected():
+    with pytest.raises(ValueError):
+        route_policy(sampling=0.5)
+    with pytest.raises(ValueError):
+        RoutePolicies({"/x": {"logs": False}})
+
+def test_compile_routes():
+    """Test compiling on startup and lazily for routes added later"""
+    policies = RoutePolicies({"/internal/*": {"metrics": False}})
+    app = create_app(policies)
+    policies.compile(app.routes)
+
+    routes = {route.path: route for route in app.routes}
+    assert policies.for_scope({"route": routes["/ping"]}) == RoutePolicy(access_log=False, tracing=False)
+    assert policies.for_scope({"route": routes["/internal/{name}"]}) == RoutePolicy(metrics=False)
+    assert policies.for_path("/ping").tracing is False
+
+    app.get("/late")(lambda: {})
+    late = app.routes[-1]
+    assert policies.for_scope({"route": late}) == RoutePolicy()
+    assert policies.for_path("/late") == RoutePolicy()
+
+def test_overrides():
+    """Test that overrides change only their settings, even of declared policies"""
+    policies = RoutePolicies({"/internal/*": {"metrics": False}})
+    app = create_app(policies)
+    policies.compile(app.routes)
+    routes = {route.path: route for route in app.routes}
+
+    overridden = policies.with_overrides({"/ping": {"tracing": True}, "/internal/*": {"sample_ratio": 1.0}})
+    assert overridden.for_scope({"route": routes["/ping"]}) == RoutePolicy(access_log=False)
+    assert overridden.for_path("/internal/{name}") == RoutePolicy(metrics=False, sample_ratio=1.0)
+    assert overridden.for_path("/orders") == RoutePolicy()
+    # The original is unchanged
+    assert policies.for_scope({"route": routes["/ping"]}).tracing is False
+
+    with pytest.raises(ValueError):
+        policies.with_overrides({"/ping": {"sample_ratio": 2}})
+
+def test_for_request_matches_before_routing():
+    """Test that the policy of a request is found before the router sets its route"""
+    policies = RoutePolicies({"/internal/*": {"metrics": False}})
+    app = create_app(policies)
+
+    def scope(path):
+        return {"type": "http", "method": "GET", "path": path, "root_path": ""}
+
+    assert policies.for_request(scope("/ping"), app.routes).access_log is False
+    assert policies.for_request(scope("/internal/status"), app.routes).metrics is False
+    assert policies.for_request(scope("/missing"), app.routes) == policies.default
+
+def test_middleware_applies_policy():
+    """Test that disabled access logs and metrics are skipped per route"""
+    logger = MagicMock()
+    metrics = MagicMock()
+    policies = RoutePolicies({"/internal/*": {"metrics": False}})
+    client = TestClient(create_app(policies, logger, metrics), raise_server_exceptions=False)
+
+    client.get("/ping")
+    logger.log_request.assert_not_called()
+    assert metrics.record_request.call_args.kwargs["endpoint"] == "/ping"
+
+    metrics.reset_mock()
+    client.get("/internal/status")
+    metrics.record_request.assert_not_called()
+    assert logger.log_request.call_count == 1
+
+    # Errors are logged regardless of the policy
+    client.get("/internal/fail")
+    logger.log_exception.assert_called_once()
+    assert logger.log_request.call_count == 2
+
+def test_disabled_work_is_skipped():
+    """Test that a route without metrics skips queue time, timing, exception metrics and the archive"""
+    logger = MagicMock()
+    metrics = MagicMock()
+    archive = MagicMock()
+    app = FastAPI()
+    app.add_middleware(
+        ObservabilityMiddleware,
+        service_name="test-service",
+        logger=logger,
+        metrics=metrics,
+        server_timing=True,
+        route_policies=RoutePolicies({"/internal/*": {"metrics": False, "access_log": False}}),
+        archive=archive
+    )
+
+    @app.get("/internal/{name}")
+    async def internal(name: str):
+        if name == "fail":
+            raise ValueError("boom")
+        return {"name": name}
+
+    client = TestClient(app, raise_server_exceptions=False)
+    response = client.get("/internal/status", headers={"X-Request-Start": "t=1"})
+    assert "server-timing" not in response.headers
+    logger.bind_request_context.assert_not_called()
+    metrics.record_queue_time.assert_not_called()
+    archive.record.assert_not_called()
+
+    # Errors are still logged with a request ID, but not counted
+    client.get("/internal/fail")
+    logger.log_exception.assert_called_once()
+    assert logger.log_exception.call_args.kwargs["context"]["request_id"]
+    metrics.record_exception.assert_not_called()
+    metrics.record_exception_fingerprint.assert_not_called()
+    archive.record.assert_not_called()
+
+def test_sampler_drops_routes_without_tracing():
+    """Test that server spans and their children are dropped per route"""
+    policies = RoutePolicies()
+    span_exporter = InMemorySpanExporter()
+    tracer_provider = TracerProvider(sampler=RuntimeSampler(RuntimeSettings(route_policies=policies)))
+    tracer_provider.add_span_processor(SimpleSpanProcessor(span_exporter))
+
+    app = create_app(policies)
+    policies.compile(app.routes)
+    FastAPIInstrumentor.instrument_app(app, tracer_provider=tracer_provider)
+    try:
+        client = TestClient(app)
+        client.get("/ping")
+        assert span_exporter.get_finished_spans() == ()
+
+        client.get("/orders")
+        assert "GET /orders" in {span.name for span in span_exporter.get_finished_spans()}
+    finally:
+        FastAPIInstrumentor.uninstrument_app(app)
@@ -0,0 +1,187 @@
+import gzip
+import os
+import threading
+import time
+from collections import namedtuple
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from fastapi_observability import FastAPIObservability
+from fastapi_observability.profiling import StackSampler, render_collapsed, render_pprof
+from fastapi_observability.tasks import uninstrument_tasks
+from fastapi_observability.testing import InMemorySpanExporter, IsolatedRegistry
+
+def busy(seconds: float):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+def read_varint(data: bytes, position: int):
+    result = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        result |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return result, position
+
+def read_packed(data: bytes):
+    values, position = [], 0
+    while position < len(data):
+        value, position = read_varint(data, position)
+        values.append(value)
+    return values
+
+def read_fields(data: bytes):
+    """Decode the top-level fields of a protobuf message as (number, value) pairs"""
+    fields, position = [], 0
+    while position < len(data):
+        key, position = read_varint(data, position)
+        if key & 7 == 0:
+            value, position = read_varint(data, position)
+        else:
+            length, position = read_varint(data, position)
+            value, position = data[position:position + length], position + length
+        fields.append((key >> 3, value))
+    return fields
+
+@pytest.fixture
+def profiled_app(tmp_path):
+    app = FastAPI()
+
+    @app.get("/busy/{n}")
+    async def busy_async(n: int):
+        busy(0.3)
+        return {}
+
+    @app.get("/sync")
+    def busy_sync():
+        busy(0.3)
+        return {}
+
+    spans = InMemorySpanExporter()
+    observability = FastAPIObservability(
+        app,
+        enable_structlog=False,
+        metrics_registry=IsolatedRegistry(),
+        span_exporters=[spans],
+        enable_profiling=True,
+        profiling_dir=str(tmp_path),
+        profiling_interval=0.002,
+        profiling_max_overhead=0.5,
+        admin_token="secret",
+    )
+    yield app, observability, spans
+    observability.shutdown()
+    uninstrument_tasks()
+
+def test_samples_tagged_with_route_and_trace(profiled_app):
+    app, observability, spans = profiled_app
+    with TestClient(app) as client:
+        client.get("/busy/1")
+        client.get("/sync")
+        counts = observability.profiler.snapshot()
+
+    (span,) = spans.get_spans("GET /busy/{n}")
+    trace_id = format(span.context.trace_id, "032x")
+    busy_samples = {
+        (route, sample_trace_id): count
+        for (route, sample_trace_id, stack), count in counts.items()
+        if stack[-1] is busy.__code__
+    }
+    assert busy_samples.get(("/busy/{n}", trace_id), 0) > 10
+    # Sync endpoints are attributed through the threadpool thread
+    assert any(route == "/sync" and count > 10 for (route, _), count in busy_samples.items())
+
+def test_profiles_written_and_served(profiled_app, tmp_path):
+    app, observability, _ = profiled_app
+    with TestClient(app) as client:
+        client.get("/busy/2")
+        assert client.get("/observability/profile").status_code == 401
+        collapsed = client.get("/observability/profile?format=collapsed", headers={"Authorization": "Bearer secret"}).text
+        assert "route /busy/{n};" in collapsed
+        assert "busy (test_profiling.py:" in collapsed
+        response = client.get("/observability/profile", headers={"Authorization": "Bearer secret"})
+        assert response.status_code == 200
+        assert read_fields(gzip.decompress(response.content))
+
+    # The window is written on shutdown
+    names = sorted(os.listdir(tmp_path))
+    assert [name.rsplit(".", 2)[-1] for name in names] == ["collapsed", "gz"]
+
+def test_overhead_capped():
+    """Test that the interval is stretched so sampling stays below the overhead cap"""
+    stop = threading.Event()
+    workers = [threading.Thread(target=lambda: [busy(0.01) for _ in iter(stop.is_set, True)]) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+
+    sampler = StackSampler(interval=1e-6, max_overhead=0.05)
+    sampler.start()
+    time.sleep(0.5)
+    sampler.stop()
+    stop.set()
+    for worker in workers:
+        worker.join()
+
+    stats = sampler.stats()
+    assert stats["passes"] > 10
+    assert stats["interval"] > 1e-4
+    assert stats["overhead"] <= 0.05
+    assert sampler.samples >= stats["passes"]
+
+def test_render_formats():
+    counts = {
+        ("/items/{id}", "ab" * 16, (test_render_formats.__code__, busy.__code__)): 3,
+        ("/items/{id}", "cd" * 16, (test_render_formats.__code__, busy.__code__)): 2,
+        ("", "", (busy.__code__,)): 1,
+    }
+    assert render_collapsed(counts).splitlines() == [
+        f"no route;busy (test_profiling.py:{busy.__code__.co_firstlineno}) 1",
+        f"route /items/{{id}};test_render_formats (test_profiling.py:{test_render_formats.__code__.co_firstlineno});"
+        f"busy (test_profiling.py:{busy.__code__.co_firstlineno}) 5",
+    ]
+
+    fields = read_fields(gzip.decompress(render_pprof(counts, 0.01, time.time(), 1.0)))
+    strings = [value.decode() for number, value in fields if number == 6]
+    assert strings[0] == ""
+    assert {"samples", "cpu", "route", "trace_id", "/items/{id}", "ab" * 16, "busy"} <= set(strings)
+    samples = [read_fields(value) for number, value in fields if number == 2]
+    assert len(samples) == 3
+    # Leaf location first; values are the count and the estimated CPU time
+    location_ids, values = (read_packed(value) for _, value in samples[0][:2])
+    assert location_ids == [1, 2]
+    assert values == [3, 30_000_000]
+    assert dict(fields)[12] == 10_000_000
+
+def test_render_without_qualname():
+    """Test code objects of Python < 3.11, which have no co_qualname"""
+    code = namedtuple("Code", "co_name co_filename co_firstlineno")("busy", "/app/test_profiling.py", 7)
+    counts = {("/items/{id}", "", (code,)): 1}
+    assert render_collapsed(counts).splitlines() == ["route /items/{id};busy (test_profiling.py:7) 1"]
+    fields = read_fields(gzip.decompress(render_pprof(counts, 0.01, time.time(), 1.0)))
+    assert b"busy" in [value for number, value in fields if number == 6]
+
+def test_windows_of_other_processes_rotated(tmp_path):
+    """Test that max_files counts the windows of all processes in the directory"""
+    for window in ("profile-101-1000", "profile-202-2000", "profile-303-3000"):
+        for suffix in (".collapsed", ".pb.gz"):
+            (tmp_path / (window + suffix)).write_bytes(b"")
+
+    sampler = StackSampler(output_dir=str(tmp_path), max_files=2)
+    sampler.start()
+    assert sorted(os.listdir(tmp_path))[0].startswith("profile-202-2000")
+    busy(0.05)
+    sampler.stop()
+
+    windows = {name.split(".", 1)[0] for name in os.listdir(tmp_path)}
+    windows.remove("profile-303-3000")
+    (window,) = windows
+    assert window.startswith(f"profile-{os.getpid()}-")
+
+def test_invalid_settings():
+    with pytest.raises(ValueError):
+        StackSampler(interval=0)
+    with pytest.raises(ValueError):
+        StackSampler(max_overhead=0)
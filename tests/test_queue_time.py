@@ -0,0 +1,78 @@
+import time
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from fastapi_observability.middleware import ObservabilityMiddleware
+from fastapi_observability.queue_time import get_queue_time, parse_request_start
+from unittest.mock import MagicMock
+
+NOW = 1700000000.5
+
+@pytest.mark.parametrize("value", [
+    "t=1700000000.25",
+    "1700000000.25",
+    "t=1700000000250",
+    "t=1700000000250000",
+    "1700000000250000000",
+    "t=1700000000.25, t=1699999999.0",
+])
+def test_parse_request_start_units(value):
+    """Test seconds, milliseconds, microseconds and nanoseconds"""
+    assert parse_request_start(value, NOW) == pytest.approx(1700000000.25)
+
+@pytest.mark.parametrize("value", ["", "t=", "abc", "t=-5", "0", "t=1690000000.0"])
+def test_parse_request_start_rejects_bogus_values(value):
+    """Test unparsable values and queue times above an hour"""
+    assert parse_request_start(value, NOW) is None
+
+def test_clock_skew_clamped():
+    """Test that a start slightly in the future counts as no queue time"""
+    assert parse_request_start("t=1700000000.9", NOW) == NOW
+    assert parse_request_start("t=1700000010.0", NOW) is None
+
+def test_queue_time_header_precedence():
+    headers = {"x-queue-start": "t=1700000000.0", "x-request-start": "t=1700000000.4"}
+    assert get_queue_time(headers, NOW) == pytest.approx(0.1)
+    assert get_queue_time({"x-queue-start": "t=1700000000.0"}, NOW) == pytest.approx(0.5)
+    assert get_queue_time({}, NOW) is None
+
+def test_middleware_records_queue_time():
+    """Test the queue time metric, request state and server span attribute"""
+    metrics = MagicMock()
+    span_exporter = InMemorySpanExporter()
+    tracer_provider = TracerProvider()
+    tracer_provider.add_span_processor(SimpleSpanProcessor(span_exporter))
+
+    app = FastAPI()
+    app.add_middleware(ObservabilityMiddleware, service_name="test-service", metrics=metrics)
+
+    @app.get("/")
+    async def root(request: Request):
+        return {"queue_time": request.state.queue_time}
+
+    FastAPIInstrumentor.instrument_app(app, tracer_provider=tracer_provider)
+    try:
+        client = TestClient(app)
+        response = client.get("/", headers={"X-Request-Start": f"t={time.time() - 0.25:.3f}"})
+    finally:
+        FastAPIInstrumentor.uninstrument_app(app)
+
+    queue_time = metrics.record_queue_time.call_args.args[0]
+    assert 0.24 <= queue_time < 1.0
+    assert response.json()["queue_time"] == queue_time
+
+    (server_span,) = [span for span in span_exporter.get_finished_spans() if span.name == "GET /"]
+    assert server_span.attributes["http.request.queue_time"] == queue_time
+
+def test_middleware_without_header():
+    metrics = MagicMock()
+    app = FastAPI()
+    app.add_middleware(ObservabilityMiddleware, service_name="test-service", metrics=metrics)
+    app.get("/")(lambda: {})
+
+    TestClient(app).get("/")
+    metrics.record_queue_time.assert_not_called()
@@ -0,0 +1,183 @@
+import logging
+import multiprocessing
+import os
+import time
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from opentelemetry.sdk.trace.sampling import Decision, StaticSampler
+from opentelemetry.trace import SpanKind
+from fastapi_observability.instrumentation import RuntimeSampler
+from fastapi_observability.middleware import ObservabilityMiddleware
+from fastapi_observability.policy import RoutePolicies
+from fastapi_observability.runtime import RuntimeSettings, create_admin_endpoint
+from unittest.mock import MagicMock
+
+def test_update_and_reset():
+    """Test that changes build on the current config and reset restores the baseline"""
+    runtime = RuntimeSettings(excluded_endpoints=["/health"])
+    baseline = runtime.config
+
+    runtime.update(log_level="DEBUG", revert_after=60)
+    config = runtime.update(sample_ratio=0.5, revert_after=60)
+    assert (config.log_level, config.sample_ratio) == (logging.DEBUG, 0.5)
+    assert config.excluded_endpoints == {"health"}
+    assert runtime.revert_at > time.time()
+    assert baseline.log_level == logging.INFO
+
+    assert runtime.reset() is baseline
+    assert runtime.config is baseline
+    assert runtime.revert_at is None
+
+def test_permanent_change_survives_revert():
+    runtime = RuntimeSettings()
+    runtime.update(log_level="DEBUG", revert_after=60)
+    runtime.update(excluded_endpoints="health,/metrics")
+    assert runtime.config.log_level == logging.DEBUG
+
+    config = runtime.reset()
+    assert config.log_level == logging.INFO
+    assert config.excluded_endpoints == {"health", "metrics"}
+
+def test_revert_timer():
+    """Test that temporary changes revert, and that a newer change reschedules the revert"""
+    runtime = RuntimeSettings()
+    listener = MagicMock()
+    runtime.add_listener(listener)
+
+    runtime.update(log_level="DEBUG", revert_after=0.05)
+    runtime.update(sample_ratio=1.0, revert_after=0.3)
+    time.sleep(0.15)
+    assert runtime.config.sample_ratio == 1.0
+
+    deadline = time.time() + 5
+    while runtime.config is not runtime.baseline and time.time() < deadline:
+        time.sleep(0.02)
+    assert runtime.config is runtime.baseline
+    assert listener.call_count == 3
+    assert listener.call_args.args[0] is runtime.baseline
+
+@pytest.mark.parametrize("changes", [
+    {"log_level": "LOUD"},
+    {"sample_ratio": 1.5},
+    {"route_policies": {"/x": {"sampling": True}}},
+    {"verbose": True},
+    {"revert_after": 0},
+])
+def test_invalid_changes(changes):
+    runtime = RuntimeSettings()
+    with pytest.raises(ValueError):
+        runtime.update(**changes)
+    assert runtime.config is runtime.baseline
+
+def test_sampler_follows_runtime_config():
+    """Test the runtime sample ratio and per-route ratio overrides"""
+    runtime = RuntimeSettings()
+    sampler = RuntimeSampler(runtime, delegate=StaticSampler(Decision.RECORD_AND_SAMPLE))
+
+    def decision(route):
+        return sampler.should_sample(None, 1 << 120, "GET", kind=SpanKind.SERVER, attributes={"http.route": route}).decision
+
+    assert decision("/orders") == Decision.RECORD_AND_SAMPLE
+    runtime.update(sample_ratio=0.0, route_policies={"/orders": {"sample_ratio": 1.0}}, revert_after=60)
+    assert decision("/orders") == Decision.RECORD_AND_SAMPLE
+    assert decision("/items") == Decision.DROP
+    runtime.update(route_policies={"/orders": {"tracing": False}}, revert_after=60)
+    assert decision("/orders") == Decision.DROP
+    runtime.reset()
+    assert decision("/items") == Decision.RECORD_AND_SAMPLE
+
+def test_middleware_exclusions_swapped():
+    logger = MagicMock()
+    runtime = RuntimeSettings(route_policies=RoutePolicies())
+    app = FastAPI()
+    app.add_middleware(ObservabilityMiddleware, service_name="test-service", logger=logger, runtime=runtime)
+    app.get("/health")(lambda: {})
+    client = TestClient(app)
+
+    client.get("/health")
+    assert logger.log_request.call_count == 1
+    runtime.update(excluded_endpoints=["/health"], revert_after=60)
+    client.get("/health")
+    assert logger.log_request.call_count == 1
+
+def test_admin_endpoint():
+    """Test authentication, updates, validation and reset through the admin endpoint"""
+    runtime = RuntimeSettings()
+    app = FastAPI()
+    app.add_route("/config", create_admin_endpoint(runtime, "secret"), methods=["GET", "PUT", "DELETE"])
+    client = TestClient(app)
+    headers = {"Authorization": "Bearer secret"}
+
+    assert client.get("/config").status_code == 401
+    assert client.put("/config", json={"log_level": "DEBUG"}, headers={"Authorization": "Bearer wrong"}).status_code == 401
+    assert client.get("/config", headers=headers).json()["log_level"] == "INFO"
+
+    response = client.put("/config", headers=headers, json={
+        "log_level": "DEBUG",
+        "route_policies": {"/orders*": {"sample_ratio": 1.0}},
+        "revert_after": 300
+    })
+    assert response.status_code == 200
+    settings = response.json()
+    assert settings["log_level"] == "DEBUG"
+    assert settings["route_policies"] == {"/orders*": {"sample_ratio": 1.0}}
+    assert settings["revert_at"] > time.time()
+    assert runtime.config.log_level == logging.DEBUG
+
+    response = client.put("/config", headers=headers, json={"sample_ratio": "all"})
+    assert response.status_code == 400
+
+    assert client.delete("/config", headers=headers).json()["log_level"] == "INFO"
+    assert runtime.config is runtime.baseline
+
+def test_shared_settings_between_workers(tmp_path):
+    """Test that a change through one worker is merged with and applied by the others"""
+    path = str(tmp_path / "runtime.json")
+    first = RuntimeSettings(shared_path=path)
+    second = RuntimeSettings(shared_path=path)
+
+    first.update(log_level="DEBUG")
+    config = second.update(sample_ratio=0.5, revert_after=60)
+    assert (config.log_level, config.sample_ratio) == (logging.DEBUG, 0.5)
+
+    first.sync()
+    assert (first.config.log_level, first.config.sample_ratio) == (logging.DEBUG, 0.5)
+    assert first.revert_at == second.revert_at
+    assert first.baseline.sample_ratio is None
+
+    first.reset()
+    second.sync()
+    assert (second.config.log_level, second.config.sample_ratio) == (logging.DEBUG, None)
+    assert second.revert_at is None
+    assert second.as_dict()["pid"] == os.getpid()
+
+def _watch_worker(runtime, results):
+    """Record the log levels a worker goes through"""
+    runtime.start()
+    levels = ["INFO"]
+    deadline = time.time() + 10
+    while len(levels) < 3 and time.time() < deadline:
+        level = logging.getLevelName(runtime.config.log_level)
+        if level != levels[-1]:
+            levels.append(level)
+        time.sleep(0.01)
+    results.put((os.getpid(), levels))
+
+def test_shared_settings_forked_workers(tmp_path):
+    """Test that forked workers pick up a temporary change and its revert"""
+    context = multiprocessing.get_context("fork")
+    runtime = RuntimeSettings(shared_path=str(tmp_path / "runtime.json"), poll_interval=0.02)
+    results = context.Queue()
+    workers = [context.Process(target=_watch_worker, args=(runtime, results)) for _ in range(2)]
+    for worker in workers:
+        worker.start()
+
+    time.sleep(0.2)
+    runtime.update(log_level="DEBUG", revert_after=1.0)
+    outcomes = dict(results.get(timeout=15) for _ in workers)
+    for worker in workers:
+        worker.join(5)
+
+    assert set(outcomes) == {worker.pid for worker in workers}
+    assert all(levels == ["INFO", "DEBUG", "INFO"] for levels in outcomes.values())
@@ -0,0 +1,124 @@
+import os
+import socket
+import urllib.request
+import pytest
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor, SpanExportResult
+from fastapi_observability.instrumentation import setup_telemetry
+from fastapi_observability.shared_exporter import SharedExporterServer, SharedSpanExporter
+from fastapi_observability.testing import LocalOTLPReceiver
+
+@pytest.fixture
+def receiver():
+    """Start a stand-in OTLP receiver"""
+    with LocalOTLPReceiver() as receiver:
+        yield receiver
+
+@pytest.fixture
+def socket_path(tmp_path):
+    """Unix socket path short enough for AF_UNIX limits"""
+    path = f"/tmp/fastapi-obs-{os.getpid()}-{tmp_path.name[-8:]}.sock"
+    yield path
+    if os.path.exists(path):
+        os.unlink(path)
+
+def make_tracer(exporter):
+    """Create a tracer that exports every span synchronously"""
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    return provider.get_tracer(__name__)
+
+def test_spans_relayed_to_collector(receiver, socket_path):
+    """Test that spans handed over by a worker reach the collector"""
+    server = SharedExporterServer(socket_path, otlp_endpoint=receiver.endpoint, flush_interval=0.05)
+    server.start()
+    try:
+        tracer = make_tracer(SharedSpanExporter(socket_path))
+        for name in ("first", "second", "third"):
+            with tracer.start_as_current_span(name):
+                pass
+
+        assert receiver.wait_for_spans(3)
+        assert receiver.span_names() == ["first", "second", "third"]
+    finally:
+        server.stop()
+
+def test_payloads_from_workers_are_merged(receiver, socket_path):
+    """Test that payloads from several workers are exported in one request"""
+    server = SharedExporterServer(socket_path, otlp_endpoint=receiver.endpoint, flush_interval=0.5)
+    server.start()
+    try:
+        tracers = [make_tracer(SharedSpanExporter(socket_path)) for _ in range(4)]
+        for index, tracer in enumerate(tracers):
+            with tracer.start_as_current_span(f"worker-{index}"):
+                pass
+
+        assert receiver.wait_for_spans(4)
+        assert len(receiver.requests) == 1
+        assert sorted(receiver.span_names()) == ["worker-0", "worker-1", "worker-2", "worker-3"]
+    finally:
+        server.stop()
+    assert server.exported_payloads == 4
+
+def test_pending_spans_exported_on_stop(receiver, socket_path):
+    """Test that stopping the server exports what is still pending"""
+    server = SharedExporterServer(socket_path, otlp_endpoint=receiver.endpoint, flush_interval=60)
+    server.start()
+    tracer = make_tracer(SharedSpanExporter(socket_path))
+    with tracer.start_as_current_span("pending"):
+        pass
+
+    # Wait until the server has read the frame before stopping it
+    for _ in range(100):
+        if server.received_payloads:
+            break
+        receiver.wait_for_spans(1, timeout=0.01)
+    server.stop()
+
+    assert receiver.span_names() == ["pending"]
+
+def test_export_fails_without_server(socket_path):
+    """Test that the worker exporter reports failure when no server is listening"""
+    exporter = SharedSpanExporter(socket_path, timeout=0.5)
+    provider = TracerProvider()
+    span = provider.get_tracer(__name__).start_span("orphan")
+    span.end()
+
+    assert exporter.export([span]) == SpanExportResult.FAILURE
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def test_spans_spooled_during_outage(receiver, socket_path, tmp_path):
+    """Test that the server spools with span counts and serves its spool metrics"""
+    receiver.available = False
+    port = free_port()
+    server = SharedExporterServer(
+        socket_path,
+        otlp_endpoint=receiver.endpoint,
+        flush_interval=0.05,
+        spool_dir=str(tmp_path),
+        metrics_port=port,
+    )
+    server.start()
+    try:
+        tracer = make_tracer(SharedSpanExporter(socket_path))
+        for name in ("first", "second", "third"):
+            with tracer.start_as_current_span(name):
+                pass
+        for _ in range(100):
+            if server.spool.spooled_spans == 3:
+                break
+            receiver.wait_for_spans(1, timeout=0.05)
+        assert server.spool.spooled_spans == 3
+
+        metrics = urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics").read().decode()
+        assert "otel_span_spool_spooled_spans_total 3.0" in metrics
+    finally:
+        server.stop()
+
+def test_spool_dir_rejected_with_shared_exporter(socket_path, tmp_path):
+    with pytest.raises(ValueError):
+        setup_telemetry("test-service", shared_exporter_socket=socket_path, spool_dir=str(tmp_path))
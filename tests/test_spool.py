@@ -0,0 +1,211 @@
+import os
+import threading
+import time
+import pytest
+from opentelemetry.sdk.trace import TracerProvider
+from fastapi_observability.otlp import OTLPTraceSender
+from fastapi_observability.spool import SpanSpool, SpoolingSender, SpoolingSpanExporter, SpoolingSpanProcessor
+from fastapi_observability.testing import LocalOTLPReceiver
+
+@pytest.fixture
+def receiver():
+    """Start a stand-in OTLP receiver"""
+    with LocalOTLPReceiver() as receiver:
+        yield receiver
+
+def drain(spool):
+    """Read and commit every pending payload"""
+    payloads = []
+    while True:
+        record = spool.peek()
+        if record is None:
+            return payloads
+        payloads.append(record)
+        spool.commit()
+
+def test_spool_replays_in_order_across_segments(tmp_path):
+    """Test that payloads come back in append order across segment rotation"""
+    spool = SpanSpool(str(tmp_path), max_bytes=1024 * 1024, segment_bytes=64)
+    for index in range(10):
+        spool.append(f"payload-{index}".encode(), span_count=index)
+
+    assert spool.segments > 1
+    assert spool.pending_payloads == 10
+    assert spool.pending_spans == sum(range(10))
+    assert drain(spool) == [(f"payload-{index}".encode(), index) for index in range(10)]
+    assert spool.bytes == 0
+    assert spool.replayed_spans == sum(range(10))
+
+def test_spool_disk_usage_capped(tmp_path):
+    """Test that the oldest segments are dropped once the cap is exceeded"""
+    spool = SpanSpool(str(tmp_path), max_bytes=1000, segment_bytes=200)
+    for _ in range(50):
+        spool.append(b"x" * 80, span_count=1)
+
+    assert spool.bytes <= 1000
+    assert spool.dropped_spans > 0
+    assert spool.pending_spans + spool.dropped_spans == 50
+
+def test_spool_survives_restart(tmp_path):
+    """Test that a new process replays what a previous one left in the spool"""
+    spool = SpanSpool(str(tmp_path))
+    spool.append(b"first", span_count=1)
+    spool.append(b"second", span_count=1)
+    spool.close()
+
+    reopened = SpanSpool(str(tmp_path))
+    assert reopened.pending_payloads == 2
+    assert [payload for payload, _ in drain(reopened)] == [b"first", b"second"]
+
+def test_spool_slots_are_exclusive(tmp_path):
+    """Test that two live spools in one directory never share a slot"""
+    first = SpanSpool(str(tmp_path))
+    second = SpanSpool(str(tmp_path))
+    first.append(b"first", span_count=1)
+    second.append(b"second", span_count=1)
+
+    assert drain(first) == [(b"first", 1)]
+    assert drain(second) == [(b"second", 1)]
+
+def test_spool_skips_torn_record(tmp_path):
+    """Test that a record cut short by a crash is dropped, not replayed"""
+    spool = SpanSpool(str(tmp_path))
+    spool.append(b"complete", span_count=1)
+    spool.append(b"torn-record", span_count=1)
+    spool.close()
+
+    slot_dir = os.path.join(str(tmp_path), "slot-0")
+    segment = os.path.join(slot_dir, [name for name in os.listdir(slot_dir) if name.endswith(".seg")][0])
+    with open(segment, "r+b") as f:
+        f.truncate(os.path.getsize(segment) - 3)
+
+    reopened = SpanSpool(str(tmp_path))
+    assert drain(reopened) == [(b"complete", 1)]
+    assert reopened.dropped_spans == 1
+
+def test_spooled_spans_replayed_after_outage(tmp_path, receiver):
+    """Test that spans exported during an outage reach the collector once it recovers"""
+    receiver.available = False
+    sender = SpoolingSender(
+        OTLPTraceSender(receiver.endpoint, timeout=1.0),
+        SpanSpool(str(tmp_path)),
+        replay_rate=1000,
+        max_backoff=0.1,
+    )
+    exporter = SpoolingSpanExporter(sender)
+    tracer = TracerProvider().get_tracer(__name__)
+    try:
+        for name in ("first", "second", "third"):
+            span = tracer.start_span(name)
+            span.end()
+            exporter.export([span])
+        assert sender.spool.spooled_spans == 3
+
+        receiver.available = True
+        assert receiver.wait_for_spans(3)
+        assert receiver.span_names() == ["first", "second", "third"]
+    finally:
+        exporter.shutdown()
+
+class FlakySender:
+    """Sender recording the payloads it accepts while ``available``"""
+
+    endpoint = "flaky"
+
+    def __init__(self):
+        self.available = False
+        self.payloads = []
+
+    def send(self, payload):
+        if self.available:
+            self.payloads.append(payload)
+        return self.available
+
+    def close(self):
+        pass
+
+def test_new_payloads_queue_behind_backlog(tmp_path):
+    """Test that payloads sent while a backlog is replayed arrive after it"""
+    flaky = FlakySender()
+    sender = SpoolingSender(flaky, SpanSpool(str(tmp_path)), replay_rate=20, max_backoff=0.05)
+    try:
+        for index in range(5):
+            sender.send(f"payload-{index}".encode(), 1)
+
+        flaky.available = True
+        deadline = time.time() + 5
+        while not flaky.payloads and time.time() < deadline:
+            time.sleep(0.005)
+        for index in range(5, 10):
+            sender.send(f"payload-{index}".encode(), 1)
+        while sender.spool.pending_payloads and time.time() < deadline:
+            time.sleep(0.01)
+
+        assert flaky.payloads == [f"payload-{index}".encode() for index in range(10)]
+        sender.send(b"payload-10", 1)
+        assert flaky.payloads[-1] == b"payload-10"
+    finally:
+        sender.close()
+
+def test_queue_overflow_is_spooled(tmp_path, receiver):
+    """Test that spans ending while the queue is full are spooled instead of dropped"""
+    receiver.available = False
+    sender = SpoolingSender(OTLPTraceSender(receiver.endpoint, timeout=1.0), SpanSpool(str(tmp_path)), max_backoff=60)
+    processor = SpoolingSpanProcessor(SpoolingSpanExporter(sender), max_queue_size=4, overflow_batch_size=2, max_export_batch_size=4)
+    provider = TracerProvider()
+    provider.add_span_processor(processor)
+    tracer = provider.get_tracer(__name__)
+    try:
+        # Simulate a full queue
+        processor._queued = processor.max_queue_size
+        for index in range(3):
+            with tracer.start_as_current_span(f"span-{index}"):
+                pass
+        assert sender.spool.spooled_spans == 2
+        
+        processor.force_flush()
+        assert sender.spool.spooled_spans == 3
+        assert sender.spool.dropped_spans == 0
+    finally:
+        processor.shutdown()
+
+def test_queue_count_settles_after_flush(tmp_path):
+    """Test that the queued span count returns to zero with spans ending on many threads"""
+    flaky = FlakySender()
+    flaky.available = True
+    sender = SpoolingSender(flaky, SpanSpool(str(tmp_path)))
+    processor = SpoolingSpanProcessor(SpoolingSpanExporter(sender), max_queue_size=10000, schedule_delay_millis=1)
+    provider = TracerProvider()
+    provider.add_span_processor(processor)
+    tracer = provider.get_tracer(__name__)
+
+    def end_spans():
+        for _ in range(500):
+            tracer.start_span("span").end()
+
+    threads = [threading.Thread(target=end_spans) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    try:
+        processor.force_flush()
+        assert processor._queued == 0
+        assert sender.spool.spooled_spans == 0
+    finally:
+        processor.shutdown()
+
+def test_spool_metrics_collected(tmp_path):
+    """Test that spool depth and replay counters are exported"""
+    from fastapi_observability.metrics import SpanSpoolCollector
+    spool = SpanSpool(str(tmp_path))
+    spool.append(b"payload", span_count=3)
+    
+    samples = {
+        metric.name: metric.samples[0].value
+        for metric in SpanSpoolCollector(lambda: [spool]).collect()
+    }
+    assert samples["otel_span_spool_pending_spans"] == 3
+    assert samples["otel_span_spool_spooled_spans"] == 3
+    assert samples["otel_span_spool_replayed_spans"] == 0
+    assert samples["otel_span_spool_bytes"] > 0
@@ -0,0 +1,93 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from fastapi_observability import FastAPIObservability
+from fastapi_observability.statsd import StatsDEmitter
+from fastapi_observability.testing import LocalStatsDReceiver
+
+@pytest.fixture
+def receiver():
+    with LocalStatsDReceiver() as receiver:
+        yield receiver
+
+def test_aggregated_into_few_packets(receiver):
+    emitter = StatsDEmitter(receiver.host, receiver.port, prefix="orders", tags={"env": "test"}, max_packet_size=512)
+    for index in range(1000):
+        emitter.increment("requests", tags={"status": "200" if index % 4 else "500"})
+        emitter.timing("duration", index / 1000, tags={"route": "/items/{id}"})
+    emitter.flush()
+
+    assert receiver.wait_for_packets(emitter.packets_sent)
+    assert emitter.packets_sent < 20
+    assert all(len(packet) <= 512 for packet in receiver.packets)
+    assert receiver.counter("orders.requests", {"status": "200", "env": "test"}) == 750
+    assert receiver.counter("orders.requests", {"status": "500"}) == 250
+    assert sorted(receiver.timings("orders.duration", {"route": "/items/{id}"})) == [float(index) for index in range(1000)]
+    assert {line[2] for line in receiver.lines} == {"c", "d"}
+
+    # Aggregates are reset after each flush
+    sent = emitter.packets_sent
+    emitter.flush()
+    assert emitter.packets_sent == sent
+
+def test_timings_sampled_beyond_limit(receiver):
+    emitter = StatsDEmitter(receiver.host, receiver.port, max_samples=100)
+    for _ in range(1000):
+        emitter.timing("duration", 0.005)
+    emitter.flush()
+
+    assert receiver.wait_for_packets(emitter.packets_sent)
+    assert len(receiver.timings("duration")) == 100
+    assert receiver.timing_count("duration") == pytest.approx(1000)
+    assert receiver.timings("duration")[0] == 5.0
+
+def test_plain_statsd_protocol(receiver):
+    emitter = StatsDEmitter(receiver.host, receiver.port, protocol="statsd", tags={"env": "test"})
+    emitter.increment("requests", 3, tags={"status": "200"})
+    emitter.increment("requests", 2, tags={"status": "500"})
+    emitter.timing("duration", 0.25)
+    emitter.timing("duration", 0.5)
+    emitter.flush()
+
+    assert receiver.wait_for_packets(1)
+    assert sorted(receiver.packets[0].decode().split("\n")) == ["duration:250|ms", "duration:500|ms", "requests:5|c"]
+
+def test_unreachable_agent_does_not_raise():
+    emitter = StatsDEmitter("host.invalid", 8125)
+    emitter.increment("requests")
+    emitter.flush()
+    assert emitter.send_errors == 1
+
+def test_observability_pushes_request_metrics(receiver):
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: int):
+        return {"item_id": item_id}
+
+    observability = FastAPIObservability(
+        app,
+        service_name="orders",
+        enable_structlog=False,
+        enable_prometheus=False,
+        enable_opentelemetry=False,
+        statsd_host=receiver.host,
+        statsd_port=receiver.port,
+        statsd_flush_interval=60
+    )
+    with TestClient(app) as client:
+        for index in range(25):
+            client.get(f"/items/{index}")
+        assert not receiver.packets
+    # Remaining aggregates are sent on shutdown
+    assert receiver.wait_for_packets(observability.statsd.packets_sent)
+    assert receiver.counter("http.requests", {"service": "orders", "method": "GET", "status": "200"}) == 25
+    assert receiver.timing_count("http.request.duration", {"method": "GET"}) == 25
+    # Without enable_prometheus there is no scrape endpoint
+    assert all(route.path != "/metrics" for route in app.routes)
+
+def test_invalid_settings():
+    with pytest.raises(ValueError):
+        StatsDEmitter(protocol="graphite")
+    with pytest.raises(ValueError):
+        StatsDEmitter(flush_interval=0)
@@ -0,0 +1,174 @@
+import asyncio
+import functools
+import time
+import anyio.to_thread
+import httpx
+import pytest
+from fastapi import BackgroundTasks, Depends, FastAPI
+from fastapi.testclient import TestClient
+from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.trace import StatusCode
+from fastapi_observability import FastAPIObservability
+from fastapi_observability.tasks import TaskInstrumentationApp, get_task_name, instrument_tasks, uninstrument_tasks
+from fastapi_observability.testing import IsolatedRegistry
+from unittest.mock import MagicMock
+
+async def notify(user: str):
+    await asyncio.sleep(0.01)
+
+def write_audit_log(entry: str):
+    time.sleep(0.02)
+
+def fail():
+    raise ValueError("boom")
+
+def get_user():
+    return "alice"
+
+@pytest.fixture
+def metrics():
+    return MagicMock()
+
+@pytest.fixture
+def span_exporter():
+    return InMemorySpanExporter()
+
+@pytest.fixture
+def instrumentation(metrics, span_exporter):
+    tracer_provider = TracerProvider()
+    tracer_provider.add_span_processor(SimpleSpanProcessor(span_exporter))
+    yield instrument_tasks(tracer_provider=tracer_provider, metrics=metrics)
+    uninstrument_tasks()
+
+def add_routes(app):
+    @app.post("/signup")
+    async def signup(background_tasks: BackgroundTasks):
+        background_tasks.add_task(notify, "alice")
+        background_tasks.add_task(write_audit_log, "signup")
+        return {}
+
+    @app.post("/fail")
+    async def failing(background_tasks: BackgroundTasks):
+        background_tasks.add_task(fail)
+        return {}
+
+    @app.get("/sync")
+    def sync(user: str = Depends(get_user)):
+        time.sleep(0.05)
+        return {"user": user}
+
+@pytest.fixture
+def app(instrumentation):
+    app = FastAPI()
+    add_routes(app)
+    app.add_middleware(TaskInstrumentationApp, instrumentation=instrumentation)
+    return app
+
+def test_task_name():
+    assert get_task_name(notify) == "notify"
+    assert get_task_name(functools.partial(functools.partial(write_audit_log), "x")) == "write_audit_log"
+
+def test_background_tasks(app, metrics, span_exporter):
+    """Test queue delay, duration and spans linked to the request span"""
+    tracer_provider = TracerProvider()
+    tracer_provider.add_span_processor(SimpleSpanProcessor(span_exporter))
+    FastAPIInstrumentor.instrument_app(app, tracer_provider=tracer_provider)
+    try:
+        TestClient(app).post("/signup")
+    finally:
+        FastAPIInstrumentor.uninstrument_app(app)
+
+    calls = {call.args[0]: call.args[1:] for call in metrics.record_background_task.call_args_list}
+    assert set(calls) == {"notify", "write_audit_log"}
+    queue_delay, duration, error = calls["write_audit_log"]
+    # The audit log task waited for notify to finish
+    assert queue_delay >= 0.01
+    assert duration >= 0.02
+    assert error is None
+
+    spans = {span.name: span for span in span_exporter.get_finished_spans()}
+    (server_span,) = [span for span in spans.values() if span.name == "POST /signup"]
+    task_span = spans["background write_audit_log"]
+    assert task_span.parent is None
+    assert task_span.links[0].context.span_id == server_span.context.span_id
+    assert task_span.attributes["background_task.queue_delay"] == queue_delay
+
+    kinds = [call.args[0] for call in metrics.record_threadpool.call_args_list]
+    assert kinds == ["background_task"]
+
+def test_background_task_failure(app, metrics, span_exporter):
+    with pytest.raises(ValueError):
+        TestClient(app).post("/fail")
+
+    name, _, _, error = metrics.record_background_task.call_args.args
+    assert name == "fail"
+    assert isinstance(error, ValueError)
+    (span,) = span_exporter.get_finished_spans()
+    assert span.status.status_code == StatusCode.ERROR
+
+def test_sync_endpoint_threadpool(app, metrics):
+    TestClient(app).get("/sync")
+
+    calls = {call.args[0]: call.args[1:] for call in metrics.record_threadpool.call_args_list}
+    assert set(calls) == {"endpoint", "dependency"}
+    wait, run = calls["endpoint"]
+    assert run >= 0.05
+    assert 0 <= wait < run
+    metrics.set_threadpool_limit.assert_called_with(40)
+    assert [call.args[0] for call in metrics.threadpool_busy.call_args_list] == [1, -1, 1, -1]
+
+@pytest.mark.asyncio
+async def test_threadpool_wait(app, metrics):
+    """Test that calls queued behind a saturated threadpool record their wait"""
+    anyio.to_thread.current_default_thread_limiter().total_tokens = 1
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        await asyncio.gather(*(client.get("/sync") for _ in range(3)))
+
+    waits = sorted(call.args[1] for call in metrics.record_threadpool.call_args_list if call.args[0] == "endpoint")
+    assert waits[0] < 0.04
+    assert waits[-1] >= 0.09
+
+def test_uninstrument(app, metrics):
+    uninstrument_tasks()
+    TestClient(app).post("/signup")
+    metrics.record_background_task.assert_not_called()
+    metrics.record_threadpool.assert_not_called()
+
+def test_uninstrumented_app(instrumentation, metrics):
+    """Test that apps without TaskInstrumentationApp record nothing"""
+    app = FastAPI()
+    add_routes(app)
+    TestClient(app).get("/sync")
+    metrics.record_threadpool.assert_not_called()
+
+def test_instances_record_to_own_metrics():
+    """Test that each FastAPIObservability instance records its own tasks"""
+    apps, registries = {}, {}
+    for name in ("shop", "admin"):
+        apps[name] = FastAPI()
+        add_routes(apps[name])
+        registries[name] = IsolatedRegistry()
+        FastAPIObservability(
+            apps[name],
+            service_name=name,
+            enable_structlog=False,
+            enable_opentelemetry=False,
+            metrics_registry=registries[name],
+        )
+    try:
+        with TestClient(apps["shop"]) as client:
+            client.get("/sync")
+            client.post("/signup")
+    finally:
+        uninstrument_tasks()
+
+    shop, admin = registries["shop"], registries["admin"]
+    assert shop.get_value("threadpool_run_seconds_count", {"kind": "endpoint", "service": "shop"}) == 1.0
+    assert shop.get_value("background_task_duration_seconds_count", {"task": "notify"}) == 1.0
+    assert admin.get_value("threadpool_run_seconds_count") == 0.0
+    assert admin.get_value("background_task_duration_seconds_count") == 0.0
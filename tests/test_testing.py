@@ -0,0 +1,77 @@
+import logging
+import structlog
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor, SpanExportResult
+from fastapi_observability import FastAPIObservability
+from fastapi_observability.testing import IsolatedRegistry, LocalOTLPReceiver
+
+def test_in_memory_exporters(app, client, span_exporter, log_exporter, metrics_registry):
+    """Test that spans, log events and metrics of the test app are collected in memory"""
+    app.get("/items/{item_id}")(lambda item_id: {"item_id": item_id})
+    assert client.get("/items/1").status_code == 200
+
+    (server_span,) = span_exporter.get_spans("GET /items/{item_id}")
+    (event,) = [event for event in log_exporter.get_events("info") if "/items/1" in event["event"]]
+    assert event["trace_id"] == format(server_span.context.trace_id, "032x")
+    assert event["http"]["status_code"] == 200
+    assert metrics_registry.get_value("http_requests_total", {"endpoint": "/items/1", "status": "200"}) == 1.0
+    assert metrics_registry.get_value("http_requests_total", {"status": "500"}) == 0.0
+
+def test_isolated_registries():
+    """Test that several applications can be instrumented in one process"""
+    registries = [IsolatedRegistry(), IsolatedRegistry()]
+    for registry in registries:
+        app = FastAPI()
+        FastAPIObservability(
+            app,
+            enable_structlog=False,
+            enable_opentelemetry=False,
+            metrics_registry=registry,
+        )
+        TestClient(app).get("/metrics")
+
+    for registry in registries:
+        assert registry.get_value("http_requests_total", {"endpoint": "/metrics"}) == 1.0
+        assert "threadpool_threads_limit" in registry.sample_names()
+
+def test_log_sink_unified_logging(log_exporter, capsys):
+    """Test that stdlib records reach the log sink in unified mode, and nothing is printed"""
+    app = FastAPI()
+    observability = FastAPIObservability(
+        app,
+        enable_prometheus=False,
+        enable_opentelemetry=False,
+        unified_logging=True,
+        log_sink=log_exporter,
+    )
+    try:
+        logging.getLogger("payments").warning("card declined")
+        observability.get_logger().info("charged")
+    finally:
+        logging.getLogger().handlers = []
+        structlog.reset_defaults()
+
+    assert log_exporter.messages() == ["card declined", "charged"]
+    assert [event["event"] for event in log_exporter.get_events("warning")] == ["card declined"]
+    assert capsys.readouterr().out == ""
+
+def test_local_otlp_http_receiver():
+    with LocalOTLPReceiver(protocol="http") as receiver:
+        exporter = OTLPSpanExporter(endpoint=receiver.endpoint)
+        tracer_provider = TracerProvider()
+        tracer_provider.add_span_processor(SimpleSpanProcessor(exporter))
+        with tracer_provider.get_tracer(__name__).start_as_current_span("checkout"):
+            pass
+        assert receiver.wait_for_spans(1)
+        assert receiver.span_names() == ["checkout"]
+
+        receiver.available = False
+        exporter = OTLPSpanExporter(endpoint=receiver.endpoint, timeout=1)
+        assert exporter.export([]) == SpanExportResult.FAILURE
+
+    with pytest.raises(ValueError):
+        LocalOTLPReceiver(protocol="udp")
@@ -0,0 +1,92 @@
+import time
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from fastapi_observability.middleware import ObservabilityMiddleware
+from fastapi_observability.timing import ServerTiming, get_server_timing, measure
+from unittest.mock import MagicMock
+
+def parse_server_timing(value):
+    """Map phase names to durations in milliseconds"""
+    phases = {}
+    for metric in value.split(", "):
+        name, *params = metric.split(";")
+        phases[name] = float(dict(param.split("=", 1) for param in params)["dur"])
+    return phases
+
+def test_header_value():
+    """Test formatting, summing of repeated phases and description escaping"""
+    timing = ServerTiming()
+    timing.add("db", 0.0123, 'query "items"')
+    timing.add("cache", 0.001)
+    timing.add("db", 0.002)
+    assert timing.header_value() == 'db;dur=14.3;desc="query \\"items\\"", cache;dur=1.0'
+    assert timing.phases == [("db", pytest.approx(0.0143)), ("cache", 0.001)]
+
+def test_measure_outside_request():
+    """Test that measure does nothing without an active request"""
+    assert get_server_timing() is None
+    with measure("db"):
+        pass
+
+@pytest.fixture
+def metrics():
+    return MagicMock()
+
+@pytest.fixture
+def app(metrics):
+    app = FastAPI()
+    app.add_middleware(
+        ObservabilityMiddleware,
+        service_name="test-service",
+        metrics=metrics,
+        server_timing=True,
+        server_timing_histograms=True
+    )
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: int, request: Request):
+        with measure("db", "item query"):
+            time.sleep(0.02)
+        request.state.timing.add("cache", 0.005)
+        return {"item_id": item_id}
+
+    @app.get("/sync")
+    def sync():
+        with measure("upstream"):
+            time.sleep(0.01)
+        return {}
+
+    return app
+
+def test_server_timing_header(app, metrics):
+    """Test middleware and handler phases in the header and histograms"""
+    response = TestClient(app).get("/items/1", headers={"X-Request-Start": f"t={time.time() - 0.1:.3f}"})
+
+    header = response.headers["server-timing"]
+    assert 'db;dur=' in header and 'desc="item query"' in header
+    phases = parse_server_timing(header)
+    assert list(phases) == ["queue", "db", "cache", "app", "middleware", "total"]
+    assert phases["queue"] >= 99
+    assert phases["db"] >= 20
+    assert phases["cache"] == 5.0
+    assert phases["app"] >= phases["db"]
+    assert phases["total"] >= phases["app"] + phases["middleware"] - 0.2
+
+    method, endpoint, recorded = metrics.record_phases.call_args.args
+    assert (method, endpoint) == ("GET", "/items/{item_id}")
+    assert [name for name, _ in recorded] == list(phases)
+
+def test_sync_handler_phases(app):
+    """Test that phases measured in threadpool handlers reach the header"""
+    phases = parse_server_timing(TestClient(app).get("/sync").headers["server-timing"])
+    assert phases["upstream"] >= 10
+
+def test_disabled_by_default(metrics):
+    app = FastAPI()
+    app.add_middleware(ObservabilityMiddleware, service_name="test-service", metrics=metrics)
+    app.get("/")(lambda: {})
+
+    response = TestClient(app).get("/")
+    assert "server-timing" not in response.headers
+    metrics.record_phases.assert_not_called()
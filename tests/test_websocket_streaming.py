@@ -0,0 +1,97 @@
+import asyncio
+import pytest
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from fastapi_observability.middleware import ObservabilityMiddleware
+from unittest.mock import MagicMock
+
+@pytest.fixture
+def metrics():
+    """Mocked metrics recording the calls made by the middleware"""
+    return MagicMock()
+
+@pytest.fixture
+def client(metrics):
+    """Create a test client for an app with WebSocket and streaming endpoints"""
+    app = FastAPI()
+    app.add_middleware(ObservabilityMiddleware, service_name="test-service", metrics=metrics)
+
+    @app.websocket("/ws/echo")
+    async def echo(websocket: WebSocket):
+        await websocket.accept()
+        message = await websocket.receive_text()
+        await websocket.send_text(message)
+        await websocket.send_bytes(b"\x00\x01")
+        await websocket.close(code=4000)
+
+    @app.websocket("/ws/rooms/{room}")
+    async def listen(websocket: WebSocket, room: str):
+        await websocket.accept()
+        try:
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            pass
+
+    @app.get("/stream/{feed}")
+    async def stream(feed: str):
+        async def events():
+            for index in range(3):
+                await asyncio.sleep(0.01)
+                yield f"data: {index}\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/json")
+    async def json():
+        return {"status": "ok"}
+
+    return TestClient(app)
+
+def test_websocket_server_close(client, metrics):
+    """Test messages, bytes and close code of a connection closed by the server"""
+    with client.websocket_connect("/ws/echo") as websocket:
+        websocket.send_text("hello")
+        assert websocket.receive_text() == "hello"
+        assert websocket.receive_bytes() == b"\x00\x01"
+
+    metrics.record_websocket.assert_called_once()
+    recorded = metrics.record_websocket.call_args.kwargs
+    assert recorded["endpoint"] == "/ws/echo"
+    assert recorded["messages"] == {"in": 1, "out": 2}
+    assert recorded["message_bytes"] == {"in": 5, "out": 7}
+    assert recorded["close_code"] == 4000
+    assert recorded["duration"] > 0
+
+def test_websocket_client_close(client, metrics):
+    """Test the close code and route label of a connection closed by the client"""
+    with client.websocket_connect("/ws/rooms/lobby") as websocket:
+        websocket.send_text("ping")
+        websocket.send_text("pong")
+        websocket.close(code=1001)
+
+    recorded = metrics.record_websocket.call_args.kwargs
+    assert recorded["endpoint"] == "/ws/rooms/{room}"
+    assert recorded["messages"] == {"in": 2, "out": 0}
+    assert recorded["close_code"] == 1001
+
+def test_streaming_response_timed_until_last_chunk(client, metrics):
+    """Test time to first byte, stream duration and chunks of a streaming response"""
+    response = client.get("/stream/news")
+    assert response.text == "data: 0\n\ndata: 1\n\ndata: 2\n\n"
+
+    metrics.record_stream.assert_called_once()
+    recorded = metrics.record_stream.call_args.kwargs
+    assert recorded["method"] == "GET"
+    assert recorded["endpoint"] == "/stream/{feed}"
+    assert recorded["chunks"] == 3
+    assert 0 < recorded["time_to_first_byte"] < recorded["duration"]
+    assert recorded["duration"] >= 0.03
+
+def test_regular_response_not_recorded_as_stream(client, metrics):
+    """Test that responses with a Content-Length are not treated as streams"""
+    response = client.get("/json")
+    assert response.status_code == 200
+
+    metrics.record_stream.assert_not_called()
+    metrics.record_request.assert_called_once()